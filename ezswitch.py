@@ -1,23 +1,3958 @@
-import tkinter as tk
-from tkinter import ttk, messagebox
+import time
+
+# Taken before the heavier imports so startup timing covers them
+PROCESS_START = time.perf_counter()
+
 import subprocess
 import os
 import sys
 import threading
 import json
+import base64
+import queue
+import hashlib
+import hmac
+import argparse
+import re
+import collections
+import functools
 from pathlib import Path
 
+from ezswitch_common import FORWARDED_COMMANDS, SERVED_COMMANDS, run_session_command
+
+# tkinter is only imported when the GUI starts (see import_tk) so the CLI stays fast
+tk = ttk = messagebox = None
+
+try:
+    import winreg
+except ImportError:
+    winreg = None
+
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# Environment variables managed by this application
+ENV_VARS = ('ANTHROPIC_AUTH_TOKEN', 'ANTHROPIC_BASE_URL')
+
+# Claude Code settings a profile can set besides the token and URL, and their value types.
+# Other names are accepted as strings if they start with one of VARIABLE_PREFIXES.
+PROFILE_VARIABLES = {
+    'API_TIMEOUT_MS': 'int',
+    'ANTHROPIC_MODEL': 'str',
+    'ANTHROPIC_SMALL_FAST_MODEL': 'str',
+    'ANTHROPIC_DEFAULT_OPUS_MODEL': 'str',
+    'ANTHROPIC_DEFAULT_SONNET_MODEL': 'str',
+    'ANTHROPIC_DEFAULT_HAIKU_MODEL': 'str',
+    'CLAUDE_CODE_MAX_OUTPUT_TOKENS': 'int',
+    'MAX_THINKING_TOKENS': 'int',
+    'BASH_DEFAULT_TIMEOUT_MS': 'int',
+    'BASH_MAX_TIMEOUT_MS': 'int',
+    'MCP_TIMEOUT': 'int',
+    'CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC': 'bool',
+    'DISABLE_NON_ESSENTIAL_MODEL_CALLS': 'bool',
+    'DISABLE_PROMPT_CACHING': 'bool',
+    'DISABLE_TELEMETRY': 'bool',
+    'DISABLE_ERROR_REPORTING': 'bool',
+    'DISABLE_AUTOUPDATER': 'bool',
+}
+
+# Name prefixes of Claude Code's own settings; nothing else (PATH, HOME, ...) can be set or cleared
+VARIABLE_PREFIXES = ('ANTHROPIC_', 'CLAUDE_', 'DISABLE_', 'MCP_')
+
+# Starting points for a profile's variables ('ezswitch vars PROFILE --preset NAME')
+VARIABLE_PRESETS = {
+    # The Anthropic API answers quickly: Claude Code's own timeout, full-length replies
+    'fast-direct': {'API_TIMEOUT_MS': 600000, 'CLAUDE_CODE_MAX_OUTPUT_TOKENS': 32000},
+    # Gateways and regional relays can take minutes to answer: wait longer, send less
+    'slow-gateway': {'API_TIMEOUT_MS': 3000000, 'CLAUDE_CODE_MAX_OUTPUT_TOKENS': 16000,
+                     'CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC': True},
+}
+
+ZAI_BASE_URL = 'https://api.z.ai/api/anthropic'
+
+OPENROUTER_BASE_URL = 'https://openrouter.ai/api'
+LOCAL_GATEWAY_URL = 'http://localhost:4000'
+
+# Claude Code sends the local proxy a random per-install token starting with this; the proxy
+# checks it and injects the real key
+PROXY_TOKEN_PREFIX = 'ezswitch-proxy'
+DEFAULT_PROXY_PORT = 8082
+
+
+def url_host(url):
+    """Return the lower-cased host part of ``url`` without parsing the rest"""
+    netloc = url.split('://', 1)[-1].split('/', 1)[0].rsplit('@', 1)[-1]
+    if netloc.startswith('['):
+        return netloc[1:].split(']', 1)[0].lower()
+    return netloc.split(':', 1)[0].lower()
+
+
+class Field:
+    """A form entry a provider needs; its value is saved in config.json under ``key``
+
+    ``missing`` is the error shown when the field is left empty; without it the
+    field is optional and ``default`` (possibly empty) is used instead.
+    """
+
+    def __init__(self, key, label, secret=False, missing=None, default=''):
+        self.key = key
+        self.label = label
+        self.secret = secret
+        self.missing = missing
+        self.default = default
+
+
+class Provider:
+    """A profile: the fields it asks for, the variables it sets and how to recognise it
+
+    ``variables`` maps each managed variable to a literal value, None to remove
+    it, or a '{field}' template filled from the saved field values. ``detect``
+    is called with the current base URL and token; providers are tried in
+    ``detect_order`` (lowest first). Providers sharing a ``group`` appear as one
+    option in the window, with ``mode`` chosen through the '<group>_mode' setting.
+    ``preset`` is the VARIABLE_PRESETS entry suggested for it; nothing is set
+    until the user chooses a preset.
+    """
+
+    def __init__(self, name, label, variables, fields=(), detect=None, detect_order=0,
+                 group=None, group_label=None, mode=None, mode_label=None, status=None, preset='slow-gateway'):
+        self.name = name
+        self.label = label
+        self.variables = variables
+        self.fields = tuple(fields)
+        self.detect = detect or (lambda base_url, token: False)
+        self.detect_order = detect_order
+        self.group = group or name
+        self.group_label = group_label or label
+        self.mode = mode
+        self.mode_label = mode_label or label
+        self.status = status or label
+        self.preset = preset
+
+    @property
+    def mode_setting(self):
+        return f'{self.group}_mode' if self.mode else None
+
+    def templates(self):
+        """Yield (variable, field key) for each variable filled from a field"""
+        for name, spec in self.variables.items():
+            if spec and spec.startswith('{') and spec.endswith('}'):
+                yield name, spec[1:-1]
+
+
+PROVIDERS = (
+    Provider('zai', "Z.ai", status="z.ai API",
+             fields=[Field('zai_key', "Z.ai API Key:", secret=True, missing="Please enter your z.ai API key")],
+             variables={'ANTHROPIC_AUTH_TOKEN': '{zai_key}', 'ANTHROPIC_BASE_URL': ZAI_BASE_URL},
+             detect=lambda base_url, token: 'z.ai' in base_url),
+    Provider('claude-subscription', "Claude Subscription", group='claude', group_label="Anthropic",
+             mode='subscription', mode_label="Use Claude Subscription (Pro/Team/Enterprise)", preset='fast-direct',
+             variables={'ANTHROPIC_AUTH_TOKEN': None, 'ANTHROPIC_BASE_URL': None},
+             detect=lambda base_url, token: True, detect_order=30),
+    Provider('claude-api', "Claude API Key", group='claude', group_label="Anthropic",
+             mode='api', mode_label="Use Claude API Key", preset='fast-direct',
+             fields=[Field('claude_key', "Claude API Key:", secret=True, missing="Please enter your Claude API key")],
+             variables={'ANTHROPIC_AUTH_TOKEN': '{claude_key}', 'ANTHROPIC_BASE_URL': None},
+             detect=lambda base_url, token: bool(token) and not base_url, detect_order=20),
+    Provider('openrouter', "OpenRouter",
+             fields=[Field('openrouter_key', "OpenRouter API Key:", secret=True,
+                           missing="Please enter your OpenRouter API key")],
+             variables={'ANTHROPIC_AUTH_TOKEN': '{openrouter_key}', 'ANTHROPIC_BASE_URL': OPENROUTER_BASE_URL},
+             detect=lambda base_url, token: 'openrouter.ai' in base_url),
+    # LiteLLM, Ollama and similar gateways on this machine; most accept any key
+    Provider('local', "Local Gateway",
+             fields=[Field('local_url', f"Gateway URL (default {LOCAL_GATEWAY_URL}):", default=LOCAL_GATEWAY_URL),
+                     Field('local_key', "Gateway Key (optional):", secret=True, default='local')],
+             variables={'ANTHROPIC_AUTH_TOKEN': '{local_key}', 'ANTHROPIC_BASE_URL': '{local_url}'},
+             detect=lambda base_url, token: (bool(base_url) and not token.startswith(PROXY_TOKEN_PREFIX)
+                                             and url_host(base_url) in ('localhost', '127.0.0.1', '::1')),
+             detect_order=5),
+    Provider('custom', "Custom", status="Custom Base URL",
+             fields=[Field('custom_url', "Custom Base URL:", missing="Please enter a custom base URL"),
+                     Field('custom_key', "Custom API Key:", secret=True, missing="Please enter your custom API key")],
+             variables={'ANTHROPIC_AUTH_TOKEN': '{custom_key}', 'ANTHROPIC_BASE_URL': '{custom_url}'},
+             detect=lambda base_url, token: bool(base_url and token), detect_order=10),
+)
+
+PROVIDERS_BY_NAME = {provider.name: provider for provider in PROVIDERS}
+
+# Window option -> the providers shown under it, in registry order
+PROVIDER_GROUPS = {}
+for _provider in PROVIDERS:
+    PROVIDER_GROUPS.setdefault(_provider.group, []).append(_provider)
+del _provider
+
+DETECTION_ORDER = sorted(PROVIDERS, key=lambda provider: provider.detect_order)
+
+# Profile name -> display name
+PROFILES = {provider.name: provider.label for provider in PROVIDERS}
+
+# Profile name -> config.json key holding its API key (a key vault record when keys are vaulted)
+PROFILE_SECRETS = {provider.name: field.key for provider in PROVIDERS for field in provider.fields if field.secret}
+
+# config.json keys of the form's fields, and of those holding API keys
+FORM_FIELDS = tuple(dict.fromkeys(field.key for provider in PROVIDERS for field in provider.fields))
+SECRET_FIELDS = tuple(dict.fromkeys(field.key for provider in PROVIDERS for field in provider.fields if field.secret))
+
+# config.json keys owned by the form; every other key is preserved as-is
+FORM_SETTINGS = FORM_FIELDS + tuple(dict.fromkeys(provider.mode_setting for provider in PROVIDERS if provider.mode)) + (
+    'selected_config',)
+
+RESTART_NOTICE = ("IMPORTANT: You must close and reopen VS Code or any application using Claude Code for changes to take effect.\n"
+                  "If using terminal only, close and reopen the terminal.")
+
+# PowerShell function shared by the one-shot script and the resident worker.
+# Requests are JSON objects: {"id": ..., "scope": "User", "get": [...], "set": {...}}
+ENV_REQUEST_FUNCTION = r"""
+function Invoke-EnvRequest($req) {
+    try {
+        if ($req.set) {
+            foreach ($p in $req.set.PSObject.Properties) {
+                [System.Environment]::SetEnvironmentVariable($p.Name, $p.Value, $req.scope)
+            }
+        }
+        $values = @{}
+        foreach ($name in $req.get) {
+            $values[$name] = [System.Environment]::GetEnvironmentVariable($name, $req.scope)
+        }
+        return @{ id = $req.id; ok = $true; values = $values }
+    } catch {
+        return @{ id = $req.id; ok = $false; error = $_.Exception.Message }
+    }
+}
+"""
+
+# One-shot script. The request is passed as base64-encoded JSON so values never
+# have to be quoted inside the script.
+ENV_REQUEST_SCRIPT = r"""
+$ErrorActionPreference = 'Stop'
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+""" + ENV_REQUEST_FUNCTION + r"""
+$req = [System.Text.Encoding]::UTF8.GetString([System.Convert]::FromBase64String('__PAYLOAD__')) | ConvertFrom-Json
+[Console]::Out.WriteLine((ConvertTo-Json -Compress -InputObject (Invoke-EnvRequest $req)))
+"""
+
+# Resident worker script: one JSON request per stdin line, one JSON response per stdout line
+ENV_WORKER_SCRIPT = r"""
+# ezswitch-worker
+$ErrorActionPreference = 'Stop'
+[Console]::InputEncoding = [System.Text.Encoding]::UTF8
+[Console]::OutputEncoding = [System.Text.Encoding]::UTF8
+""" + ENV_REQUEST_FUNCTION + r"""
+while ($true) {
+    $line = [Console]::In.ReadLine()
+    if ($line -eq $null) { break }
+    if (-not $line.Trim()) { continue }
+    try {
+        $resp = Invoke-EnvRequest ($line | ConvertFrom-Json)
+    } catch {
+        $resp = @{ id = $null; ok = $false; error = $_.Exception.Message }
+    }
+    [Console]::Out.WriteLine((ConvertTo-Json -Compress -InputObject $resp))
+    [Console]::Out.Flush()
+}
+"""
+
+
+class Tracer:
+    """Record wall time per phase as JSON lines when enabled
+
+    Disabled by default; ``span`` then returns a shared no-op context manager,
+    so instrumented code pays only an attribute check. Enable with the
+    --trace/--profile flags or EZSWITCH_TRACE=1; records are appended to
+    ~/.claude_ez_switch/trace.jsonl.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self.handle = None
+        self.totals = {}
+        self.lock = threading.Lock()
+
+    def enable(self, path=None):
+        self.path = Path(path) if path else get_config_dir() / "trace.jsonl"
+        self.enabled = True
+
+    def span(self, phase, **fields):
+        if not self.enabled:
+            return NULL_SPAN
+        return TraceSpan(self, phase, fields)
+
+    def record(self, phase, seconds, fields=None):
+        """Store one timing and append it to the trace file"""
+        entry = {'ts': round(time.time(), 6), 'phase': phase, 'ms': round(seconds * 1000, 3),
+                 'pid': os.getpid(), 'thread': threading.current_thread().name}
+        if fields:
+            entry.update(fields)
+        with self.lock:
+            calls, total, slowest = self.totals.get(phase, (0, 0.0, 0.0))
+            self.totals[phase] = (calls + 1, total + seconds, max(slowest, seconds))
+            try:
+                if self.handle is None:
+                    self.handle = open(self.path, 'a')
+                self.handle.write(json.dumps(entry) + '\n')
+                self.handle.flush()
+            except OSError:
+                pass
+
+    def summary(self):
+        """Return (phase, calls, total ms, mean ms, max ms) rows, slowest total first"""
+        with self.lock:
+            rows = [(phase, calls, total * 1000, total * 1000 / calls, slowest * 1000)
+                    for phase, (calls, total, slowest) in self.totals.items()]
+        return sorted(rows, key=lambda row: row[2], reverse=True)
+
+    def format_summary(self):
+        lines = [f"{'phase':<36} {'calls':>6} {'total ms':>10} {'mean ms':>9} {'max ms':>9}"]
+        for phase, calls, total, mean, slowest in self.summary():
+            lines.append(f"{phase:<36} {calls:>6} {total:>10.2f} {mean:>9.2f} {slowest:>9.2f}")
+        return "\n".join(lines)
+
+
+class TraceSpan:
+    def __init__(self, tracer, phase, fields):
+        self.tracer = tracer
+        self.phase = phase
+        self.fields = fields
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        fields = dict(self.fields, error=exc_type.__name__) if exc_type else self.fields
+        self.tracer.record(self.phase, time.perf_counter() - self.start, fields)
+        return False
+
+
+class _NullSpan:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_SPAN = _NullSpan()
+TRACER = Tracer()
+
+
+def traced(phase):
+    """Decorator recording each call's wall time under ``phase`` when tracing is enabled"""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not TRACER.enabled:
+                return func(*args, **kwargs)
+            with TRACER.span(phase):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def powershell_executable():
+    """Return the PowerShell executable, honouring EZSWITCH_POWERSHELL (see tools/fake-powershell)"""
+    return os.environ.get('EZSWITCH_POWERSHELL', 'powershell')
+
+
+def encode_powershell_command(executable, script):
+    """Build a PowerShell command line that runs ``script`` via -EncodedCommand"""
+    encoded = base64.b64encode(script.encode('utf-16-le')).decode('ascii')
+    return [executable, '-NoProfile', '-NonInteractive', '-EncodedCommand', encoded]
+
+
+class EnvironmentStoreError(Exception):
+    """Raised when the environment store cannot read or write variables"""
+
+
+class WorkerCrashedError(EnvironmentStoreError):
+    """Raised when the resident worker dies; the request is safe to retry on a new worker"""
+
+
+class PowerShellWorker:
+    """Long-lived PowerShell process serving environment requests over stdin/stdout"""
+
+    def __init__(self, command=None, timeout=10):
+        # Any command speaking the line-delimited JSON protocol works here
+        self.command = command or encode_powershell_command(powershell_executable(), ENV_WORKER_SCRIPT)
+        self.timeout = timeout
+        self.process = None
+        self.responses = None
+        self.next_id = 0
+        self.lock = threading.Lock()
+
+    @traced("powershell.spawn")
+    def start(self):
+        """Start the worker process and its stdout reader thread"""
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+            text=True, encoding='utf-8', bufsize=1
+        )
+        # Each process gets its own queue so a dead worker's output is never misread
+        self.responses = queue.Queue()
+        reader = threading.Thread(target=self._read_responses,
+                                  args=(self.process, self.responses), daemon=True)
+        reader.start()
+
+    @staticmethod
+    def _read_responses(process, responses):
+        """Forward worker output lines to the response queue until EOF"""
+        for line in process.stdout:
+            responses.put(line)
+        responses.put(None)
+
+    def is_running(self):
+        return self.process is not None and self.process.poll() is None
+
+    @traced("powershell.worker_request")
+    def execute(self, request):
+        """Send one request and wait for its response, restarting the worker once if it died"""
+        with self.lock:
+            try:
+                return self._execute(request)
+            except WorkerCrashedError:
+                self._kill()
+                return self._execute(request)
+
+    def _execute(self, request):
+        if not self.is_running():
+            try:
+                self.start()
+            except OSError as e:
+                raise EnvironmentStoreError(str(e))
+        
+        self.next_id += 1
+        request = dict(request, id=self.next_id)
+        try:
+            self.process.stdin.write(json.dumps(request) + '\n')
+            self.process.stdin.flush()
+        except (OSError, ValueError):
+            raise WorkerCrashedError("Worker process is not accepting requests")
+        
+        deadline = time.monotonic() + self.timeout
+        while True:
+            remaining = deadline - time.monotonic()
+            try:
+                line = self.responses.get(timeout=max(remaining, 0))
+            except queue.Empty:
+                # A hung worker cannot be trusted with the next request
+                self._kill()
+                raise EnvironmentStoreError("Command timed out")
+            if line is None:
+                self._kill()
+                raise WorkerCrashedError("Worker process exited unexpectedly")
+            try:
+                response = json.loads(line)
+            except ValueError:
+                continue
+            if response.get('id') == request['id']:
+                return response
+
+    def _kill(self):
+        if self.process is not None:
+            try:
+                self.process.kill()
+                self.process.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+        self.process = None
+
+    def stop(self, timeout=2):
+        """Ask the worker to exit by closing stdin, killing it if it does not"""
+        with self.lock:
+            if self.process is None:
+                return
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=timeout)
+            except (OSError, subprocess.TimeoutExpired):
+                pass
+            self._kill()
+
+
+class EnvironmentBackend:
+    """Interface for reading and writing persistent User-scope environment variables"""
+
+    name = "base"
+
+    def get(self, names=ENV_VARS):
+        """Return a dict of name -> value, with '' for variables that are not set"""
+        raise NotImplementedError
+
+    def set(self, values):
+        """Write several variables as one batch; None or '' removes a variable"""
+        raise NotImplementedError
+
+    def close(self):
+        """Release any resources held by the backend"""
+
+    def change_notifier(self):
+        """Return an object whose wait(timeout) reports changes, or None if the store must be polled"""
+        return None
+
+    def location(self):
+        """Return a name for where the variables live that stays the same across runs"""
+        # File-based stores are told apart by their file
+        path = getattr(self, 'path', None)
+        return str(path) if path else self.name
+
+
+class PowerShellBackend(EnvironmentBackend):
+    """Read and write persistent environment variables in one PowerShell request per batch"""
+
+    name = "powershell"
+
+    def __init__(self, scope='User', executable=None, timeout=30, worker=None):
+        self.scope = scope
+        self.executable = executable or powershell_executable()
+        self.timeout = timeout
+        # Optional resident worker; without one every request starts a new process
+        self.worker = worker
+
+    def build_command(self, names=(), writes=None):
+        """Build the PowerShell command line for a single batched request"""
+        request = {'scope': self.scope, 'get': list(names), 'set': dict(writes or {})}
+        payload = base64.b64encode(json.dumps(request).encode('utf-8')).decode('ascii')
+        return encode_powershell_command(self.executable, ENV_REQUEST_SCRIPT.replace('__PAYLOAD__', payload))
+
+    @traced("powershell.run_once")
+    def run_once(self, names=(), writes=None):
+        """Run a request in a fresh PowerShell process and return the decoded response"""
+        try:
+            result = subprocess.run(
+                self.build_command(names, writes),
+                capture_output=True, text=True, encoding='utf-8',
+                timeout=self.timeout, check=True
+            )
+        except subprocess.CalledProcessError as e:
+            raise EnvironmentStoreError(f"Command failed: {e.stderr}")
+        except subprocess.TimeoutExpired:
+            raise EnvironmentStoreError("Command timed out")
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+        
+        try:
+            return json.loads(result.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            raise EnvironmentStoreError(f"Unexpected output: {result.stdout.strip()}")
+
+    def request(self, names=(), writes=None):
+        """Apply ``writes`` (None deletes) then return the values of ``names``"""
+        if self.worker is not None:
+            response = self.worker.execute({'scope': self.scope, 'get': list(names),
+                                            'set': dict(writes or {})})
+        else:
+            response = self.run_once(names, writes)
+        
+        if not response.get('ok'):
+            raise EnvironmentStoreError(response.get('error') or "Unknown error")
+        
+        # Missing variables come back as null; normalise to empty strings like GetEnvironmentVariable output
+        values = response.get('values') or {}
+        return {name: values.get(name) or '' for name in names}
+
+    def get(self, names=ENV_VARS):
+        """Read several variables in one request"""
+        return self.request(names=names)
+
+    def set(self, values):
+        """Write several variables in one request; None removes a variable"""
+        self.request(writes=values)
+
+    def close(self):
+        """Shut down the resident worker, if any"""
+        if self.worker is not None:
+            self.worker.stop()
+
+
+class RegistryBackend(EnvironmentBackend):
+    """Read and write HKCU\\Environment directly, without starting any process"""
+
+    name = "registry"
+    key_path = "Environment"
+
+    def __init__(self, broadcast_timeout_ms=5000):
+        if winreg is None:
+            raise EnvironmentStoreError("The registry backend requires Windows")
+        self.broadcast_timeout_ms = broadcast_timeout_ms
+
+    @traced("registry.get")
+    def get(self, names=ENV_VARS):
+        values = {}
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.key_path, 0, winreg.KEY_READ) as key:
+                for name in names:
+                    try:
+                        values[name] = str(winreg.QueryValueEx(key, name)[0])
+                    except FileNotFoundError:
+                        values[name] = ''
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+        return values
+
+    @traced("registry.set")
+    def set(self, values):
+        if not values:
+            return
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.key_path, 0,
+                                winreg.KEY_READ | winreg.KEY_WRITE) as key:
+                for name, value in values.items():
+                    if value is None or value == '':
+                        try:
+                            winreg.DeleteValue(key, name)
+                        except FileNotFoundError:
+                            pass
+                    else:
+                        value_type = winreg.REG_EXPAND_SZ if '%' in value else winreg.REG_SZ
+                        winreg.SetValueEx(key, name, 0, value_type, value)
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+        # One broadcast for the whole batch instead of one per variable
+        self.broadcast_change()
+
+    @traced("registry.broadcast")
+    def broadcast_change(self):
+        """Tell running applications (Explorer, new terminals) that the environment changed"""
+        import ctypes
+        from ctypes import wintypes
+        HWND_BROADCAST = 0xFFFF
+        WM_SETTINGCHANGE = 0x001A
+        SMTO_ABORTIFHUNG = 0x0002
+        result = wintypes.DWORD()
+        ctypes.windll.user32.SendMessageTimeoutW(
+            HWND_BROADCAST, WM_SETTINGCHANGE, 0, "Environment",
+            SMTO_ABORTIFHUNG, self.broadcast_timeout_ms, ctypes.byref(result)
+        )
+
+    def change_notifier(self):
+        return RegistryChangeNotifier(self.key_path)
+
+
+class MemoryBackend(EnvironmentBackend):
+    """In-memory backend for tests and non-Windows development"""
+
+    name = "memory"
+
+    def __init__(self, values=None):
+        self.values = dict(values or {})
+        self.lock = threading.Lock()
+        # Counters let tests assert how much work an operation did
+        self.reads = 0
+        self.writes = 0
+        self.broadcasts = 0
+
+    def get(self, names=ENV_VARS):
+        with self.lock:
+            self.reads += 1
+            return {name: self.values.get(name, '') for name in names}
+
+    def set(self, values):
+        if not values:
+            return
+        with self.lock:
+            for name, value in values.items():
+                if value is None or value == '':
+                    self.values.pop(name, None)
+                else:
+                    self.values[name] = value
+                self.writes += 1
+            self.broadcasts += 1
+
+
+class SettingsFileBackend(EnvironmentBackend):
+    """Store variables in the ``env`` block of Claude Code's settings.json
+
+    Only that block is patched; every other key is preserved. Reads and writes
+    are plain file operations, so this backend works on every platform.
+    """
+
+    name = "settings"
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else Path.home() / ".claude" / "settings.json"
+        # (mtime_ns, size) -> parsed settings, so repeated status reads skip the JSON parse
+        self.cache_key = None
+        self.cache = {}
+
+    def read_settings(self):
+        try:
+            stat = self.path.stat()
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+        key = (stat.st_mtime_ns, stat.st_size)
+        if key != self.cache_key:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    self.cache = json.load(f)
+            except (OSError, ValueError) as e:
+                raise EnvironmentStoreError(f"Could not read {self.path}: {e}")
+            if not isinstance(self.cache, dict):
+                raise EnvironmentStoreError(f"{self.path} does not contain a JSON object")
+            self.cache_key = key
+        return self.cache
+
+    def get(self, names=ENV_VARS):
+        env = self.read_settings().get('env') or {}
+        return {name: str(env.get(name) or '') for name in names}
+
+    @traced("settings.set")
+    def set(self, values):
+        if not values:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with FileLock(self.path):
+                # Re-read under the lock so concurrent edits to other keys are not lost
+                self.cache_key = None
+                settings = dict(self.read_settings())
+                env = dict(settings.get('env') or {})
+                for name, value in values.items():
+                    if value is None or value == '':
+                        env.pop(name, None)
+                    else:
+                        env[name] = value
+                if env == (settings.get('env') or {}):
+                    return
+                if env:
+                    settings['env'] = env
+                else:
+                    settings.pop('env', None)
+                write_json_atomic(self.path, settings)
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+
+    def change_notifier(self):
+        return FileChangeNotifier(self.path)
+
+
+def default_shell_profile():
+    """Return the start-up file of the user's shell: ~/.zshrc for zsh, else ~/.bashrc"""
+    shell = os.path.basename(os.environ.get('SHELL', ''))
+    return Path.home() / (".zshrc" if shell == 'zsh' else ".bashrc")
+
+
+class ShellProfileBackend(EnvironmentBackend):
+    """Keep the variables as ``export`` lines in a marked block of a shell start-up file
+
+    Only the block between the markers is rewritten, so the rest of the file
+    stays as the user wrote it. New shells pick the values up.
+    """
+
+    name = "shell"
+
+    BEGIN = "# >>> claude-code-ez-switch >>>"
+    END = "# <<< claude-code-ez-switch <<<"
+
+    def __init__(self, path=None):
+        self.path = Path(path).expanduser() if path else default_shell_profile()
+
+    def read(self):
+        """Return (lines before the block, exported values, lines after the block)"""
+        try:
+            lines = self.path.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return [], {}, []
+        except (OSError, ValueError) as e:
+            raise EnvironmentStoreError(f"Could not read {self.path}: {e}")
+        if self.BEGIN not in lines or self.END not in lines[lines.index(self.BEGIN):]:
+            return lines, {}, []
+        begin = lines.index(self.BEGIN)
+        end = lines.index(self.END, begin)
+        import shlex
+        values = {}
+        for line in lines[begin + 1:end]:
+            name, sep, value = line.partition('=')
+            if sep and name.startswith('export '):
+                try:
+                    values[name[len('export '):].strip()] = ''.join(shlex.split(value))
+                except ValueError:
+                    continue
+        return lines[:begin], values, lines[end + 1:]
+
+    def get(self, names=ENV_VARS):
+        values = self.read()[1]
+        return {name: values.get(name, '') for name in names}
+
+    @traced("shell.set")
+    def set(self, values):
+        if not values:
+            return
+        import shlex
+        try:
+            with FileLock(self.path):
+                before, current, after = self.read()
+                for name, value in values.items():
+                    if value is None or value == '':
+                        current.pop(name, None)
+                    else:
+                        current[name] = value
+                block = [self.BEGIN] + [f"export {name}={shlex.quote(value)}" for name, value in current.items()]
+                lines = before + (block + [self.END] if current else []) + after
+                write_text_atomic(self.path, "\n".join(lines) + "\n")
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+
+
+class DotenvBackend(EnvironmentBackend):
+    """Keep the variables as NAME=value lines in a dotenv file, leaving its other lines alone"""
+
+    name = "dotenv"
+
+    def __init__(self, path=None):
+        self.path = Path(path).expanduser() if path else get_config_dir() / "claude.env"
+
+    @staticmethod
+    def parse(line):
+        """Return (name, value) for an assignment line, or None"""
+        name, sep, value = line.partition('=')
+        name = name.strip()
+        if name.startswith('export '):
+            name = name[len('export '):].strip()
+        if not sep or not name or name.startswith('#'):
+            return None
+        value = value.strip()
+        if len(value) >= 2 and value[0] == value[-1] == "'":
+            value = value[1:-1]
+        elif len(value) >= 2 and value[0] == value[-1] == '"':
+            value = value[1:-1].replace('\\"', '"').replace('\\\\', '\\')
+        return name, value
+
+    @staticmethod
+    def render(name, value):
+        """Return an assignment line, quoting values with anything beyond URL and key characters"""
+        if all(c.isalnum() or c in '-._/:@+=' for c in value):
+            return f"{name}={value}"
+        escaped = value.replace('\\', '\\\\').replace('"', '\\"')
+        return f'{name}="{escaped}"'
+
+    def read_lines(self):
+        try:
+            return self.path.read_text(encoding='utf-8').splitlines()
+        except FileNotFoundError:
+            return []
+        except (OSError, ValueError) as e:
+            raise EnvironmentStoreError(f"Could not read {self.path}: {e}")
+
+    def get(self, names=ENV_VARS):
+        values = dict(filter(None, map(self.parse, self.read_lines())))
+        return {name: values.get(name, '') for name in names}
+
+    @traced("dotenv.set")
+    def set(self, values):
+        if not values:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with FileLock(self.path):
+                pending = dict(values)
+                lines = []
+                for line in self.read_lines():
+                    parsed = self.parse(line)
+                    if parsed is None or parsed[0] not in values:
+                        lines.append(line)
+                        continue
+                    # Rewrite the first assignment in place and drop any repeats
+                    value = pending.pop(parsed[0], None)
+                    if value:
+                        lines.append(self.render(parsed[0], value))
+                lines.extend(self.render(name, value) for name, value in pending.items() if value)
+                write_text_atomic(self.path, "\n".join(lines) + "\n" if lines else "")
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+
+
+def select_backend(name=None, settings=None):
+    """Pick the environment backend
+
+    The choice comes from ``name``, EZSWITCH_BACKEND, or the 'backend' key in
+    config.json. Without one, the registry is used on Windows and Claude Code's
+    settings.json everywhere else.
+    """
+    if not name and resident_backend is not None:
+        return SharedBackend(resident_backend)
+    name = name or os.environ.get('EZSWITCH_BACKEND') or (settings or {}).get('backend', '')
+    if name == 'memory':
+        return MemoryBackend()
+    if name == 'powershell':
+        return PowerShellBackend(worker=PowerShellWorker())
+    if name == 'settings':
+        return SettingsFileBackend()
+    if name == 'registry' or (not name and winreg is not None):
+        return RegistryBackend()
+    if name:
+        raise EnvironmentStoreError(f"Unknown backend: {name}")
+    return SettingsFileBackend()
+
+
+BACKENDS = ('registry', 'powershell', 'settings', 'memory')
+
+# Places apply can write a profile to, listed under 'apply_targets' in config.json
+APPLY_TARGETS = {'settings': SettingsFileBackend, 'shell': ShellProfileBackend, 'dotenv': DotenvBackend}
+
+# Seconds a target may take; the environment may have to start PowerShell first
+DEFAULT_TARGET_TIMEOUTS = {'environment': 30.0, 'settings': 5.0, 'shell': 5.0, 'dotenv': 5.0}
+
+
+def apply_targets(backend, settings):
+    """Return the (name, backend, timeout) targets apply writes to, ``backend`` first
+
+    'apply_targets' in config.json lists extra targets by name, or as objects
+    such as {"target": "dotenv", "path": "~/work/.env", "timeout": 2}. An
+    "environment" entry only sets the timeout of ``backend`` itself.
+    """
+    targets = [['environment', backend, DEFAULT_TARGET_TIMEOUTS['environment']]]
+    for entry in settings.get('apply_targets') or ():
+        options = {'target': entry} if isinstance(entry, str) else dict(entry)
+        kind = options.get('target')
+        timeout = float(options.get('timeout', DEFAULT_TARGET_TIMEOUTS.get(kind, 5.0)))
+        if kind == 'environment':
+            targets[0][2] = timeout
+            continue
+        if kind not in APPLY_TARGETS:
+            raise EnvironmentStoreError(f"Unknown apply target: {kind}")
+        path = options.get('path')
+        target = APPLY_TARGETS[kind](os.path.expanduser(path) if path else None)
+        # settings.json is already the environment on Linux and macOS
+        if isinstance(backend, SettingsFileBackend) and backend.path == target.path:
+            continue
+        targets.append([f"{kind} ({target.path})", target, timeout])
+    return [tuple(target) for target in targets]
+
+
+class RegistryChangeNotifier:
+    """Wait for writes to HKCU\\<key_path> with RegNotifyChangeKeyValue
+
+    The notification is registered on the thread that creates this object,
+    which must stay alive while it is used.
+    """
+
+    def __init__(self, key_path):
+        import ctypes
+        from ctypes import wintypes
+        self.advapi32 = ctypes.windll.advapi32
+        self.kernel32 = ctypes.windll.kernel32
+        self.advapi32.RegNotifyChangeKeyValue.argtypes = [wintypes.HANDLE, wintypes.BOOL, wintypes.DWORD,
+                                                          wintypes.HANDLE, wintypes.BOOL]
+        self.kernel32.CreateEventW.restype = wintypes.HANDLE
+        self.kernel32.WaitForSingleObject.argtypes = [wintypes.HANDLE, wintypes.DWORD]
+        self.kernel32.CloseHandle.argtypes = [wintypes.HANDLE]
+        try:
+            self.key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, key_path, 0, winreg.KEY_NOTIFY)
+        except OSError as e:
+            raise EnvironmentStoreError(str(e))
+        # Auto-reset event, signalled by the next value write or delete
+        self.event = self.kernel32.CreateEventW(None, False, False, None)
+        self.arm()
+
+    def arm(self):
+        REG_NOTIFY_CHANGE_NAME = 0x1
+        REG_NOTIFY_CHANGE_LAST_SET = 0x4
+        result = self.advapi32.RegNotifyChangeKeyValue(self.key.handle, False,
+                                                       REG_NOTIFY_CHANGE_NAME | REG_NOTIFY_CHANGE_LAST_SET,
+                                                       self.event, True)
+        if result:
+            raise EnvironmentStoreError(f"RegNotifyChangeKeyValue failed with error {result}")
+
+    def wait(self, timeout):
+        """Return True if the key changed within ``timeout`` seconds"""
+        WAIT_OBJECT_0 = 0
+        if self.kernel32.WaitForSingleObject(self.event, int(timeout * 1000)) != WAIT_OBJECT_0:
+            return False
+        # Notifications are one-shot
+        self.arm()
+        return True
+
+    def close(self):
+        self.kernel32.CloseHandle(self.event)
+        self.key.Close()
+
+
+class FileChangeNotifier:
+    """Wait for a file's mtime or size to change by polling os.stat
+
+    A stat is a fraction of the cost of parsing the file, so it can run
+    often enough that edits from other tools show up within ``poll``
+    seconds on every platform.
+    """
+
+    def __init__(self, path, poll=0.25):
+        self.path = Path(path)
+        self.poll = poll
+        self.key = self.stat_key()
+
+    def stat_key(self):
+        try:
+            stat = self.path.stat()
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def wait(self, timeout):
+        """Return True if the file changed within ``timeout`` seconds"""
+        deadline = time.monotonic() + timeout
+        while True:
+            key = self.stat_key()
+            if key != self.key:
+                self.key = key
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            time.sleep(min(self.poll, remaining))
+
+    def close(self):
+        pass
+
+
+class StatusWatcher:
+    """Queue the managed variables whenever another process changes them
+
+    Uses the backend's change notifier where there is one (registry change
+    notifications, settings.json stat watching) and otherwise re-reads every
+    ``interval`` seconds, comparing fingerprints. Only changed readings are
+    put on ``updates``, a queue.Queue the consumer drains on its own thread;
+    a failed read is queued as the exception, once per distinct message.
+    """
+
+    def __init__(self, backend, interval=2.0, updates=None, names=ENV_VARS):
+        self.backend = backend
+        self.interval = interval
+        self.names = names
+        self.updates = updates if updates is not None else queue.Queue()
+        self.fingerprint = None
+        self.last_error = None
+        self.wakeup = threading.Event()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    def seed(self, env):
+        """Record values the consumer has already shown so they are not queued again"""
+        self.fingerprint = status_fingerprint(env)
+
+    def check(self):
+        """Read the variables once; returns True if something was queued"""
+        try:
+            env = self.backend.get(self.names)
+        except EnvironmentStoreError as e:
+            if str(e) == self.last_error:
+                return False
+            self.last_error = str(e)
+            self.fingerprint = None
+            self.updates.put(e)
+            return True
+        self.last_error = None
+        fingerprint = status_fingerprint(env)
+        if fingerprint == self.fingerprint:
+            return False
+        self.fingerprint = fingerprint
+        self.updates.put(env)
+        return True
+
+    def poke(self, force=False):
+        """Check now instead of waiting; ``force`` queues the values even if unchanged"""
+        if force:
+            self.fingerprint = None
+        self.wakeup.set()
+
+    def _run(self):
+        try:
+            notifier = self.backend.change_notifier()
+        except EnvironmentStoreError:
+            notifier = None
+        try:
+            # Catch anything that changed between the consumer's own read and the notifier starting
+            self.check()
+            while not self.stopped.is_set():
+                if notifier is None:
+                    self.wakeup.wait(self.interval)
+                    changed = True
+                else:
+                    # Short waits so poke() and stop() are noticed promptly
+                    changed = notifier.wait(min(self.interval, 0.25)) or self.wakeup.is_set()
+                self.wakeup.clear()
+                if changed and not self.stopped.is_set():
+                    self.check()
+        finally:
+            if notifier is not None:
+                notifier.close()
+
+    def start(self):
+        """Start watching on a daemon thread"""
+        if self.thread is None:
+            self.stopped.clear()
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2):
+        """Stop watching and wait briefly for the thread to finish"""
+        self.stopped.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+
+def status_watch_options(settings):
+    """Return (enabled, interval) from the 'status_watch' block in config.json"""
+    config = settings.get('status_watch') or {}
+    return bool(config.get('enabled', True)), float(config.get('interval', 2.0))
+
+
+class Job:
+    """One unit of background work and the callbacks that receive its outcome on the UI thread"""
+
+    def __init__(self, kind, func, args, on_done=None, on_error=None):
+        self.kind = kind
+        self.func = func
+        self.args = args
+        self.on_done = on_done
+        self.on_error = on_error
+        self.cancelled = False
+
+
+class TaskExecutor:
+    """Run background jobs one at a time on a single worker thread
+
+    Jobs take their inputs as arguments, read from the widgets before
+    submitting, so the worker never touches Tk. Outcomes are put on
+    ``results`` and delivered by drain(), which the UI thread calls; each job's
+    on_done or on_error callback runs there. Policies per submission:
+    'coalesce' returns the job of the same kind that is still queued instead
+    of queueing another, and 'latest' cancels queued and running jobs of the
+    same kind so only the newest one's outcome is delivered. A running job is
+    not interrupted; jobs run in submission order, so its effects are
+    overwritten by the newer job. Without start(), run_pending() runs the
+    queue on the calling thread, which keeps the executor testable headlessly.
+    A callback that raises is passed to ``on_callback_error`` (by default
+    printed to stderr) and the remaining outcomes are still delivered.
+    """
+
+    def __init__(self, on_callback_error=None):
+        self.on_callback_error = on_callback_error or self.print_callback_error
+        self.pending = collections.deque()
+        self.condition = threading.Condition()
+        self.results = queue.Queue()
+        self.running = None
+        self.stopped = False
+        self.thread = None
+
+    def submit(self, kind, func, *args, on_done=None, on_error=None, policy=None):
+        """Queue ``func(*args)``; returns its Job, or the queued one it was coalesced into"""
+        with self.condition:
+            if policy == 'coalesce':
+                for job in self.pending:
+                    if job.kind == kind:
+                        return job
+            elif policy == 'latest':
+                for job in self.pending:
+                    if job.kind == kind:
+                        job.cancelled = True
+                self.pending = collections.deque(job for job in self.pending if not job.cancelled)
+                if self.running is not None and self.running.kind == kind:
+                    self.running.cancelled = True
+            job = Job(kind, func, args, on_done, on_error)
+            self.pending.append(job)
+            self.condition.notify()
+        return job
+
+    def call_soon(self, func, *args):
+        """Run ``func(*args)`` on the UI thread at the next drain; safe to call from any thread"""
+        self.results.put((Job('call', func, args, on_done=lambda _: func(*args)), None, None))
+
+    def busy(self, kind=None):
+        """True while a job (of ``kind``, if given) is queued or running"""
+        with self.condition:
+            jobs = list(self.pending) + ([self.running] if self.running is not None else [])
+        return any(kind is None or job.kind == kind for job in jobs)
+
+    def _next(self, block):
+        with self.condition:
+            while block and not self.pending and not self.stopped:
+                self.condition.wait()
+            if self.stopped or not self.pending:
+                return None
+            self.running = self.pending.popleft()
+            return self.running
+
+    def _execute(self, job):
+        try:
+            outcome = (job, job.func(*job.args), None)
+        except Exception as e:
+            outcome = (job, None, e)
+        # Queued before the job stops counting as running, so busy() never hides an undelivered result
+        self.results.put(outcome)
+        with self.condition:
+            self.running = None
+
+    def _run(self):
+        while True:
+            job = self._next(block=True)
+            if job is None:
+                return
+            self._execute(job)
+
+    def run_pending(self):
+        """Run every queued job on the calling thread (for use without start())"""
+        while True:
+            job = self._next(block=False)
+            if job is None:
+                return
+            self._execute(job)
+
+    def drain(self):
+        """Deliver finished jobs to their callbacks; call on the UI thread. Returns how many ran"""
+        delivered = 0
+        while True:
+            try:
+                job, result, error = self.results.get_nowait()
+            except queue.Empty:
+                return delivered
+            if job.cancelled:
+                continue
+            delivered += 1
+            try:
+                if error is None:
+                    if job.on_done is not None:
+                        job.on_done(result)
+                elif job.on_error is not None:
+                    job.on_error(error)
+            except Exception as e:
+                self.on_callback_error(job, e)
+
+    @staticmethod
+    def print_callback_error(job, error):
+        import traceback
+        print(f"Error in {job.kind} callback:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__)
+
+    def start(self):
+        """Start the worker on a daemon thread"""
+        if self.thread is None:
+            self.stopped = False
+            self.thread = threading.Thread(target=self._run, daemon=True, name="ezswitch-executor")
+            self.thread.start()
+
+    def stop(self, timeout=2):
+        """Drop queued jobs and wait briefly for the running one to finish"""
+        with self.condition:
+            self.stopped = True
+            for job in self.pending:
+                job.cancelled = True
+            self.pending.clear()
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+
+def import_tk():
+    """Import tkinter on first use; only the GUI needs it"""
+    global tk, ttk, messagebox
+    if tk is None:
+        import tkinter as tk
+        from tkinter import ttk, messagebox
+
+
+def get_config_dir():
+    """Return ~/.claude_ez_switch, creating it if needed"""
+    config_dir = Path.home() / ".claude_ez_switch"
+    config_dir.mkdir(exist_ok=True)
+    return config_dir
+
+
+class ProfileError(ValueError):
+    """Raised when a profile cannot be applied with the saved settings"""
+
+
+def selected_profile(settings):
+    """Return the profile name selected in saved settings"""
+    selected = settings.get('selected_config', 'zai')
+    providers = PROVIDER_GROUPS.get(selected)
+    if not providers:
+        return selected
+    mode = settings.get(providers[0].mode_setting) if providers[0].mode else None
+    for provider in providers:
+        if provider.mode == mode:
+            return provider.name
+    return providers[0].name
+
+
+VARIABLE_NAME = re.compile(r'[A-Z][A-Z0-9_]*')
+
+
+def check_variable_name(name):
+    """Raise ProfileError unless ``name`` is a variable a profile may set"""
+    if name in ENV_VARS:
+        raise ProfileError(f"{name} comes from the profile's key and URL and cannot be set directly")
+    if not isinstance(name, str) or not VARIABLE_NAME.fullmatch(name):
+        raise ProfileError(f"Not an environment variable name: {name!r}")
+    if name not in PROFILE_VARIABLES and not name.startswith(VARIABLE_PREFIXES):
+        raise ProfileError(f"{name} is not a Claude Code setting; names must be known or start with "
+                           f"{', '.join(VARIABLE_PREFIXES)}")
+
+
+def allowed_variable(name):
+    """Return True if check_variable_name accepts ``name``"""
+    try:
+        check_variable_name(name)
+    except ProfileError:
+        return False
+    return True
+
+
+def coerce_variable(name, value):
+    """Validate ``value`` against the type of ``name`` and return it as a string, or None to unset it"""
+    check_variable_name(name)
+    kind = PROFILE_VARIABLES.get(name, 'str')
+    if value is None or value == '' or value is False:
+        return None
+    if kind == 'bool':
+        if value is True or str(value).lower() in ('1', 'true', 'yes', 'on'):
+            return '1'
+        if str(value).lower() in ('0', 'false', 'no', 'off'):
+            return None
+        raise ProfileError(f"{name} must be true or false, not {value!r}")
+    if kind == 'int':
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            number = -1
+        if isinstance(value, (bool, float)) or number < 0:
+            raise ProfileError(f"{name} must be a whole number, not {value!r}")
+        return str(number)
+    if isinstance(value, (dict, list)):
+        raise ProfileError(f"{name} must be a string, not {value!r}")
+    return str(value)
+
+
+def variable_maps(settings):
+    """Return the 'profile_variables' block of config.json: profile -> {name or 'preset': value}"""
+    maps = settings.get('profile_variables') or {}
+    if not isinstance(maps, dict) or not all(isinstance(config, dict) for config in maps.values()):
+        raise ProfileError("profile_variables in config.json must map profiles to objects")
+    return maps
+
+
+def profile_variables(profile, settings):
+    """Return the extra variables ``profile`` sets: its preset overlaid with its own values
+
+    Values are validated and rendered as strings; None unsets a variable, so
+    a profile can switch off something its preset turns on.
+    """
+    config = variable_maps(settings).get(profile) or {}
+    preset = config.get('preset')
+    if preset is not None and preset not in VARIABLE_PRESETS:
+        raise ProfileError(f"Unknown preset {preset!r}; choose from {', '.join(VARIABLE_PRESETS)}")
+    merged = dict(VARIABLE_PRESETS.get(preset) or {})
+    merged.update((name, value) for name, value in config.items() if name != 'preset')
+    return {name: coerce_variable(name, value) for name, value in merged.items()}
+
+
+def managed_variables(settings):
+    """Return every extra variable EZ Switch may have set, all of which are cleared when switching away
+
+    That is each name in any profile's map or chosen preset, plus those
+    removed from the maps since (kept in 'managed_variables').
+    """
+    # Earlier versions accepted any name here; those are dropped rather than cleared
+    names = set(filter(allowed_variable, settings.get('managed_variables') or ()))
+    for config in variable_maps(settings).values():
+        names.update(name for name in config if name != 'preset')
+        names.update(VARIABLE_PRESETS.get(config.get('preset')) or ())
+    for name in names:
+        check_variable_name(name)
+    return tuple(sorted(names))
+
+
+def status_variables(settings):
+    """Return the names the status shows: the token and URL, then the extra variables"""
+    return ENV_VARS + managed_variables(settings)
+
+
+@traced("apply.resolve")
+def profile_environment(profile, settings):
+    """Return the variable values a profile needs; None means the variable is removed"""
+    provider = PROVIDERS_BY_NAME.get(profile)
+    if provider is None:
+        raise ProfileError(f"Unknown profile: {profile}")
+    values = {}
+    for field in provider.fields:
+        value = saved_secret(settings, field.key) if field.secret else (settings.get(field.key) or '').strip()
+        if not value and field.missing:
+            raise ProfileError(field.missing)
+        values[field.key] = value or field.default
+    env = {name: (spec.format(**values) or None) if spec else None
+           for name, spec in provider.variables.items()}
+    # Extra variables go in the same batch; those another profile set are cleared
+    env.update(dict.fromkeys(managed_variables(settings)))
+    env.update(profile_variables(profile, settings))
+    return env
+
+
+def detect_profile(env):
+    """Return the profile name matching a set of environment values"""
+    user_auth_token = (env.get('ANTHROPIC_AUTH_TOKEN') or '').strip()
+    user_base_url = (env.get('ANTHROPIC_BASE_URL') or '').strip()
+    for provider in DETECTION_ORDER:
+        if provider.detect(user_base_url, user_auth_token):
+            return provider.name
+    return 'claude-subscription'
+
+
+class ApplyReport:
+    """Outcome of applying a profile: the variables that changed and those already correct"""
+
+    def __init__(self, profile, changes, unchanged):
+        self.profile = profile
+        # name -> (old value, new value); '' means not set
+        self.changes = changes
+        self.unchanged = unchanged
+
+    @property
+    def changed(self):
+        return bool(self.changes)
+
+    @property
+    def failures(self):
+        # A single target either succeeds or raises
+        return []
+
+    def describe(self):
+        """Return a short human-readable list of changes with keys masked"""
+        if not self.changes:
+            return "No changes needed; this profile is already active."
+        lines = []
+        for name, (old, new) in self.changes.items():
+            if name == 'ANTHROPIC_AUTH_TOKEN':
+                old, new = (mask_key(old) if old else ''), (mask_key(new) if new else '')
+            lines.append(f"{name}: {old or '(not set)'} -> {new or '(removed)'}")
+        return "\n".join(lines)
+
+
+def diff_environment(current, target):
+    """Return (changes, unchanged) needed to move ``current`` values to ``target``"""
+    changes = {}
+    unchanged = []
+    for name, value in target.items():
+        old = current.get(name) or ''
+        if old == (value or ''):
+            unchanged.append(name)
+        else:
+            changes[name] = (old, value or '')
+    return changes, unchanged
+
+
+class VariableLedger:
+    """The extra variables EZ Switch last wrote to each store, kept in written_variables.json
+
+    Switching away only clears an extra variable whose value is still the
+    one recorded here, so a value the user set or changed by hand is kept.
+    Stores are told apart by ``EnvironmentBackend.location()``.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else get_config_dir() / "written_variables.json"
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, location):
+        return self.load().get(location) or {}
+
+    def record(self, location, values):
+        """Remember ``values`` (None: no longer written by EZ Switch) for ``location``"""
+        with FileLock(self.path):
+            data = self.load()
+            written = dict(data.get(location) or {})
+            for name, value in values.items():
+                if value:
+                    written[name] = value
+                else:
+                    written.pop(name, None)
+            if written != (data.get(location) or {}):
+                data[location] = written
+                write_json_atomic(self.path, data)
+
+
+class TargetResult:
+    """What applying a profile did to one target: its ApplyReport, or the error that stopped it"""
+
+    def __init__(self, name, report=None, error=None, seconds=None):
+        self.name = name
+        self.report = report
+        self.error = error
+        self.seconds = seconds
+
+
+class PipelineReport:
+    """Outcome of applying a profile to several targets at once, one TargetResult each"""
+
+    def __init__(self, profile, results):
+        self.profile = profile
+        self.results = results
+
+    @property
+    def changed(self):
+        return any(result.report is not None and result.report.changed for result in self.results)
+
+    @property
+    def failures(self):
+        return [result for result in self.results if result.error is not None]
+
+    def describe(self):
+        """Return each target's changes, or why it failed"""
+        lines = []
+        for result in self.results:
+            if result.error is not None:
+                lines.append(f"{result.name}: FAILED - {result.error}")
+            elif result.report.changed:
+                lines.append(f"{result.name}:")
+                lines.extend(f"  {line}" for line in result.report.describe().splitlines())
+            else:
+                lines.append(f"{result.name}: already up to date")
+        return "\n".join(lines)
+
+
+def apply_to_targets(targets, profile, values):
+    """Apply ``values`` to every (name, backend, timeout) target at once and report each
+
+    Each target runs on its own thread, so the wall time is that of the
+    slowest target rather than the sum. A target that misses its timeout is
+    reported as failed; its thread is left to finish in the background.
+    """
+    start = time.monotonic()
+    outcomes = [{} for _ in targets]
+    
+    def run(outcome, backend):
+        began = time.monotonic()
+        try:
+            outcome['report'] = apply_profile_values(backend, profile, values)
+        except Exception as e:
+            outcome['error'] = e
+        outcome['seconds'] = time.monotonic() - began
+    
+    threads = []
+    for outcome, (name, backend, _) in zip(outcomes, targets):
+        thread = threading.Thread(target=run, args=(outcome, backend), daemon=True, name=f"apply-{name}")
+        thread.start()
+        threads.append(thread)
+    results = []
+    for outcome, thread, (name, _, timeout) in zip(outcomes, threads, targets):
+        thread.join(max(0.0, start + timeout - time.monotonic()))
+        if thread.is_alive():
+            results.append(TargetResult(name, error=EnvironmentStoreError(f"timed out after {timeout:g} s"),
+                                        seconds=timeout))
+        else:
+            results.append(TargetResult(name, outcome.get('report'), outcome.get('error'), outcome['seconds']))
+    return PipelineReport(profile, results)
+
+
+def apply_profile(backend, profile, settings, current=None):
+    """Write only the variables that differ from ``current`` (read if not given) and report them
+
+    When config.json lists extra ``apply_targets`` the profile goes to all of
+    them concurrently and a PipelineReport is returned; it raises only if
+    every target failed.
+    """
+    values = profile_environment(profile, settings)
+    targets = apply_targets(backend, settings)
+    if len(targets) == 1:
+        report = apply_profile_values(backend, profile, values, current)
+    else:
+        report = apply_to_targets(targets, profile, values)
+        if len(report.failures) == len(targets):
+            raise EnvironmentStoreError(report.describe())
+    record_switch(profile)
+    return report
+
+
+def apply_profile_values(backend, profile, target, current=None):
+    """Diff ``target`` against the environment and write only what changed"""
+    if current is None:
+        with TRACER.span("apply.read_current", backend=backend.name):
+            current = backend.get(list(target))
+    extras = [name for name in target if name not in ENV_VARS]
+    if extras:
+        ledger = VariableLedger()
+        written = ledger.get(backend.location())
+        # An extra variable is only removed while it still holds the value EZ Switch wrote
+        target = {name: value for name, value in target.items()
+                  if value or name in ENV_VARS or (current.get(name) or '') in ('', written.get(name))}
+    with TRACER.span("apply.diff"):
+        changes, unchanged = diff_environment(current, target)
+    # An empty batch skips the write and the settings-change broadcast entirely
+    if changes:
+        with TRACER.span("apply.write", backend=backend.name, variables=len(changes)):
+            try:
+                backend.set({name: target[name] for name in changes})
+            except EnvironmentStoreError:
+                # Put back anything the batch wrote before failing, so the token and URL stay a pair
+                try:
+                    backend.set({name: current.get(name) or None for name in changes})
+                except EnvironmentStoreError:
+                    pass
+                raise
+    if extras:
+        ledger.record(backend.location(), {name: target.get(name) for name in extras})
+    return ApplyReport(profile, changes, unchanged)
+
+
+def profile_settings(profile, settings):
+    """Return ``settings`` updated so the GUI shows ``profile`` as selected"""
+    provider = PROVIDERS_BY_NAME[profile]
+    settings = dict(settings)
+    settings['selected_config'] = provider.group
+    if provider.mode:
+        settings[provider.mode_setting] = provider.mode
+    return settings
+
+
+class FileLock:
+    """Advisory inter-process lock for ``path``, held on a file in ~/.claude_ez_switch/locks
+
+    Nothing is left beside the user's own files. The path is resolved first,
+    so a symlink and the file it points at share one lock.
+    """
+
+    def __init__(self, path):
+        real = os.path.normcase(os.path.realpath(path))
+        digest = hashlib.sha256(real.encode('utf-8')).hexdigest()[:16]
+        self.path = get_config_dir() / "locks" / f"{os.path.basename(real)}.{digest}.lock"
+        self.handle = None
+
+    def __enter__(self):
+        self.path.parent.mkdir(exist_ok=True)
+        self.handle = open(self.path, 'a+')
+        if fcntl is not None:
+            fcntl.flock(self.handle.fileno(), fcntl.LOCK_EX)
+        elif msvcrt is not None:
+            self.handle.seek(0)
+            # LK_LOCK retries for about 10 seconds before giving up
+            msvcrt.locking(self.handle.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self.handle.fileno(), fcntl.LOCK_UN)
+            elif msvcrt is not None:
+                self.handle.seek(0)
+                msvcrt.locking(self.handle.fileno(), msvcrt.LK_UNLCK, 1)
+        finally:
+            self.handle.close()
+            self.handle = None
+
+
+def write_json_atomic(path, data):
+    """Write JSON through a temporary file and os.replace so readers never see a partial file"""
+    write_text_atomic(path, json.dumps(data, indent=2))
+
+
+def write_text_atomic(path, text):
+    """Write ``text`` through a temporary file and os.replace so readers never see a partial file"""
+    write_lines_atomic(path, (text,))
+
+
+def write_lines_atomic(path, lines, mode=None):
+    """Like write_text_atomic, but streams an iterable of strings instead of holding the whole text
+
+    ``mode`` makes the file private (or otherwise) whether or not it existed;
+    without it a replaced file keeps its permissions. A symlinked target
+    (as dotfile managers create) is written through, so the link survives.
+    """
+    path = Path(os.path.realpath(path))
+    if mode is None and path.exists():
+        # Keep the permissions of a file being replaced, such as a private .env
+        mode = path.stat().st_mode & 0o7777
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        # Created with the final mode (less the umask) so the contents are never more exposed
+        fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o666 if mode is None else mode & 0o777)
+        with open(fd, 'w', encoding='utf-8') as f:
+            f.writelines(lines)
+            f.flush()
+            os.fsync(f.fileno())
+        if mode is not None:
+            os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    finally:
+        if tmp.exists():
+            tmp.unlink()
+
+
+class ConfigStore:
+    """Write-behind store for config.json: debounced, atomic and skipped when unchanged
+
+    A store given ``owned`` keys writes only those. Each write re-reads the
+    file under the lock and keeps every other key as stored, so a window
+    open for hours does not revert what command-line commands wrote since.
+    """
+
+    def __init__(self, path, delay=0.5, owned=None):
+        self.path = Path(path)
+        self.delay = delay
+        self.owned = None if owned is None else frozenset(owned)
+        self.lock = threading.Lock()
+        self.timer = None
+        self.pending = None
+        self.deadline = 0.0
+        # Last content known to be on disk
+        self.saved = None
+
+    def read(self):
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    @traced("config.load")
+    def load(self):
+        """Read the stored settings, or an empty dict if there are none"""
+        data = self.read()
+        with self.lock:
+            self.saved = dict(data)
+        return data
+
+    def save(self, data):
+        """Write ``data`` now; returns False if it matched what is already stored"""
+        with self.lock:
+            self.pending = None
+            return self._write(data)
+
+    def save_later(self, data):
+        """Queue ``data`` to be written once edits have been idle for ``delay`` seconds"""
+        with self.lock:
+            self.pending = dict(data)
+            self.deadline = time.monotonic() + self.delay
+            # One waiter thread per idle window; further edits only push the deadline back
+            if self.timer is None:
+                self.timer = threading.Thread(target=self._write_when_idle, daemon=True)
+                self.timer.start()
+
+    def flush(self):
+        """Write any queued data immediately"""
+        with self.lock:
+            data, self.pending = self.pending, None
+            if data is not None:
+                return self._write(data)
+            return False
+
+    def _write_when_idle(self):
+        while True:
+            with self.lock:
+                if self.pending is None:
+                    self.timer = None
+                    return
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    data, self.pending = self.pending, None
+                    self.timer = None
+                    try:
+                        self._write(data)
+                    except OSError:
+                        pass
+                    return
+            time.sleep(remaining)
+
+    @traced("config.write")
+    def _write(self, data):
+        if self.owned is None:
+            if data == self.saved:
+                return False
+            with FileLock(self.path):
+                write_json_atomic(self.path, data)
+            self.saved = dict(data)
+            return True
+        with FileLock(self.path):
+            try:
+                stored = self.read()
+            except ValueError:
+                stored = {}
+            merged = {key: value for key, value in stored.items() if key not in self.owned}
+            merged.update((key, value) for key, value in data.items() if key in self.owned)
+            if merged.get('vault'):
+                # The vault may have been turned on since ``data`` was collected; keys stay out of the file
+                merged = {key: value for key, value in merged.items() if key not in SECRET_FIELDS}
+            self.saved = merged
+            if merged == stored:
+                return False
+            write_json_atomic(self.path, merged)
+        return True
+
+
+PROFILE_FORMATS = ('jsonl', 'csv')
+PROFILE_COLUMNS = ('name', 'url', 'key')
+# Picking a named profile fills in this profile's URL and key
+NAMED_PROFILE_TARGET = 'custom'
+# The picker lists at most this many matches; the filter narrows the rest
+PICKER_ROWS = 500
+
+
+def key_fingerprint(key):
+    """Short SHA-256 fingerprint of an API key, so keys can be compared without keeping them around"""
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+
+def profile_format(path, fmt=None):
+    """Return 'jsonl' or 'csv' for ``path``, by extension unless ``fmt`` is given"""
+    if fmt:
+        return fmt
+    return 'csv' if str(path).lower().endswith('.csv') else 'jsonl'
+
+
+def read_profile_records(f, fmt):
+    """Yield (line number, record, error) from a JSON Lines or CSV stream, one row at a time"""
+    if fmt == 'csv':
+        import csv
+        reader = csv.DictReader(f)
+        for row in reader:
+            yield reader.line_num, row, None
+        return
+    for number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            yield number, json.loads(line), None
+        except ValueError as e:
+            yield number, None, f"invalid JSON: {e}"
+
+
+def named_profile(record):
+    """Check an imported row and return it as {'name', 'url', 'key'}; raises ProfileError"""
+    if not isinstance(record, dict):
+        raise ProfileError("expected an object with name, url and key")
+    name = str(record.get('name') or '').strip()
+    url = str(record.get('url') or '').strip().rstrip('/')
+    key = str(record.get('key') or '').strip()
+    if not name:
+        raise ProfileError("missing name")
+    if not url.startswith(('http://', 'https://')):
+        raise ProfileError(f"{name}: url must start with http:// or https://")
+    if not key:
+        raise ProfileError(f"{name}: missing key")
+    return {'name': name, 'url': url, 'key': key}
+
+
+class ImportReport:
+    """Outcome of merging named profiles into the store, with the first few rejected rows"""
+
+    MAX_ERRORS = 10
+
+    def __init__(self):
+        self.added = 0
+        self.updated = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.errors = []
+
+    def reject(self, line, error):
+        self.invalid += 1
+        if len(self.errors) < self.MAX_ERRORS:
+            self.errors.append(f"line {line}: {error}")
+
+    def describe(self):
+        lines = [f"{self.added} added, {self.updated} updated, {self.duplicates} duplicates skipped, "
+                 f"{self.invalid} invalid"]
+        lines.extend(self.errors)
+        if self.invalid > len(self.errors):
+            lines.append(f"... and {self.invalid - len(self.errors)} more invalid rows")
+        return "\n".join(lines)
+
+
+class ProfileStore:
+    """Named endpoint profiles (name, URL, key) in profiles.jsonl, one JSON object per line
+
+    Team rollouts can hold thousands of entries, so the file is read as a
+    stream and only ever rewritten whole, through one atomic replace, and it
+    is readable only by the user. Profiles are deduplicated by URL and key
+    fingerprint. With a ``vault`` the keys are kept in one encrypted vault
+    record instead and each line holds only its key's fingerprint.
+    """
+
+    VAULT_RECORD = 'team-profile-keys'
+
+    def __init__(self, path=None, vault=None):
+        self.path = Path(path) if path else get_config_dir() / "profiles.jsonl"
+        self.vault = vault
+
+    def __iter__(self):
+        try:
+            f = open(self.path, 'r', encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with f:
+            for line in f:
+                try:
+                    profile = json.loads(line)
+                except ValueError:
+                    continue
+                if isinstance(profile, dict):
+                    yield profile
+
+    @staticmethod
+    def fingerprint(profile):
+        return profile.get('fingerprint') or key_fingerprint(profile.get('key') or '')
+
+    def vault_keys(self):
+        """Decrypt the vaulted keys: fingerprint -> key"""
+        if self.vault is None:
+            return {}
+        text = self.vault.get(self.VAULT_RECORD)
+        return json.loads(text) if text else {}
+
+    def with_keys(self, profiles):
+        """Yield ``profiles`` with vaulted keys filled in (decrypted once, and only if needed)"""
+        keys = None
+        for profile in profiles:
+            if not profile.get('key') and profile.get('fingerprint'):
+                if keys is None:
+                    keys = self.vault_keys()
+                profile = dict(profile, key=keys.get(profile['fingerprint']))
+            yield profile
+
+    def stored_line(self, profile, keys):
+        """Return the line to write for ``profile``, moving its key into ``keys`` when vaulted"""
+        if not profile.get('key'):
+            # Already vaulted
+            return json.dumps(profile) + "\n"
+        if keys is None:
+            return json.dumps({'name': profile['name'], 'url': profile['url'], 'key': profile['key']}) + "\n"
+        fingerprint = key_fingerprint(profile['key'])
+        keys[fingerprint] = profile['key']
+        return json.dumps({'name': profile['name'], 'url': profile['url'], 'fingerprint': fingerprint}) + "\n"
+
+    def write(self, lines, keys):
+        """Write the ``lines`` iterable and, when vaulted, the ``keys`` those lines still use"""
+        if keys is None:
+            write_lines_atomic(self.path, lines, mode=0o600)
+            return
+        # Generating the lines moves plain keys into ``keys``, which must be stored before any
+        # line points at them
+        lines = list(lines)
+        used = {json.loads(line).get('fingerprint') for line in lines}
+        self.vault.put(self.VAULT_RECORD, json.dumps({fp: key for fp, key in keys.items() if fp in used}))
+        write_lines_atomic(self.path, lines, mode=0o600)
+
+    def get(self, name):
+        """Return the profile called ``name``, with its key, or None"""
+        for profile in self:
+            if profile.get('name') == name:
+                return next(self.with_keys([profile]))
+        return None
+
+    @traced("profiles.merge")
+    def merge(self, records, replace=False):
+        """Merge (line, record, error) rows from read_profile_records; returns an ImportReport
+
+        A row whose URL and key are already stored, or came earlier in the
+        same import, is skipped as a duplicate. A row that reuses a stored
+        name replaces that profile in place. With ``replace`` the store ends up
+        holding only the imported profiles. Everything lands in one write.
+        """
+        report = ImportReport()
+        with FileLock(self.path):
+            # (url, key fingerprint) -> name; fingerprints keep the index small
+            index = {}
+            if not replace:
+                for profile in self:
+                    index[(profile.get('url'), self.fingerprint(profile))] = profile.get('name')
+            keys = self.vault_keys() if self.vault is not None else None
+            incoming = {}
+            for line, record, error in records:
+                if error is None:
+                    try:
+                        profile = named_profile(record)
+                    except ProfileError as e:
+                        error = str(e)
+                if error is not None:
+                    report.reject(line, error)
+                    continue
+                identity = (profile['url'], key_fingerprint(profile['key']))
+                if identity in index:
+                    report.duplicates += 1
+                    continue
+                index[identity] = profile['name']
+                # Held as the line to write, which takes a fraction of a dict's memory
+                incoming[profile['name']] = self.stored_line(profile, keys)
+            if not incoming and not replace:
+                return report
+
+            def lines():
+                if not replace:
+                    for profile in self:
+                        if profile.get('name') in incoming:
+                            report.updated += 1
+                            yield incoming.pop(profile['name'])
+                        else:
+                            yield self.stored_line(profile, keys)
+                report.added = len(incoming)
+                yield from incoming.values()
+
+            self.write(lines(), keys)
+        return report
+
+    def remove(self, name):
+        """Delete the profile called ``name``; returns False if there was none"""
+        with FileLock(self.path):
+            if not any(profile.get('name') == name for profile in self):
+                return False
+            keys = self.vault_keys() if self.vault is not None else None
+            self.write((self.stored_line(profile, keys) for profile in self if profile.get('name') != name), keys)
+        return True
+
+    def seal(self, vault):
+        """Move every key into ``vault``, or back into the file when ``vault`` is None"""
+        with FileLock(self.path):
+            profiles = list(self.with_keys(self))
+            if not profiles:
+                return
+            old_vault, self.vault = self.vault, vault
+            keys = {} if vault is not None else None
+            self.write((self.stored_line(profile, keys) for profile in profiles), keys)
+            if vault is None and old_vault is not None:
+                old_vault.put(self.VAULT_RECORD, None)
+
+    def export(self, f, fmt):
+        """Stream every profile, keys included, to ``f`` as JSON Lines or CSV; returns how many were written"""
+        writer = None
+        if fmt == 'csv':
+            import csv
+            writer = csv.DictWriter(f, PROFILE_COLUMNS, extrasaction='ignore', lineterminator='\n')
+            writer.writeheader()
+        count = 0
+        for profile in self.with_keys(self):
+            profile = {name: profile.get(name) for name in PROFILE_COLUMNS}
+            if writer is not None:
+                writer.writerow(profile)
+            else:
+                f.write(json.dumps(profile) + "\n")
+            count += 1
+        return count
+
+
+def profile_store(settings):
+    """Return the ProfileStore, with its keys in the key vault when the vault is on"""
+    return ProfileStore(vault=key_vault() if settings.get('vault') else None)
+
+
+def import_profiles(path, fmt=None, replace=False, store=None):
+    """Merge a JSON Lines or CSV file ('-' for stdin) into the profile store; returns an ImportReport"""
+    store = store or ProfileStore()
+    fmt = profile_format(path, fmt)
+    if str(path) == '-':
+        return store.merge(read_profile_records(sys.stdin, fmt), replace)
+    with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+        return store.merge(read_profile_records(f, fmt), replace)
+
+
+def export_profiles(path, fmt=None, store=None):
+    """Write the profile store, keys in plain text, to a JSON Lines or CSV file ('-' for stdout)
+
+    A new file is readable only by the user. Returns the count.
+    """
+    store = store or ProfileStore()
+    fmt = profile_format(path, fmt)
+    if str(path) == '-':
+        return store.export(sys.stdout, fmt)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with open(fd, 'w', encoding='utf-8', newline='') as f:
+        return store.export(f, fmt)
+
+
+def normalize_project_path(path):
+    """Return the absolute, case-normalised form of ``path`` used as a project index key"""
+    return os.path.normcase(os.path.abspath(os.path.expanduser(str(path))))
+
+
+class ProjectIndex:
+    """Prefix index of directory trees bound to profiles (config key ``project_profiles``)
+
+    Lookups walk up from the given directory and probe a dict at each level,
+    so the cost depends on path depth, not on the number of mappings.
+    """
+
+    def __init__(self, mappings=None):
+        self.roots = {normalize_project_path(path): profile for path, profile in (mappings or {}).items()}
+
+    def resolve(self, directory):
+        """Return (profile, root) for the nearest bound ancestor of ``directory``, or (None, None)"""
+        path = normalize_project_path(directory)
+        while True:
+            profile = self.roots.get(path)
+            if profile is not None:
+                return profile, path
+            parent = os.path.dirname(path)
+            if parent == path:
+                return None, None
+            path = parent
+
+
+class ProjectResolver:
+    """Resolve the profile for a directory, rebuilding the index only when config.json changes"""
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else get_config_dir() / "config.json"
+        # (mtime_ns, size) of the config the index was built from
+        self.cache_key = None
+        self.settings = {}
+        self.index = ProjectIndex()
+
+    def refresh(self):
+        try:
+            stat = self.path.stat()
+            key = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            key = ()
+        if key != self.cache_key:
+            self.settings = ConfigStore(self.path).load() if key else {}
+            self.index = ProjectIndex(self.settings.get('project_profiles'))
+            self.cache_key = key
+        return self.index
+
+    def resolve(self, directory=None):
+        """Return (profile, root) for ``directory`` (default: cwd); root is None for the global profile"""
+        profile, root = self.refresh().resolve(directory or os.getcwd())
+        if profile is None:
+            return selected_profile(self.settings), None
+        return profile, root
+
+
+def project_environment(profile, settings):
+    """Return the variables pinning ``profile`` in a project's settings.local.json
+
+    Project settings can only override user-level values, not unset them, so
+    the Anthropic API profile spells out the default base URL instead of
+    removing it.
+    """
+    values = profile_environment(profile, settings)
+    if values.get('ANTHROPIC_AUTH_TOKEN') and values.get('ANTHROPIC_BASE_URL', '') is None:
+        values['ANTHROPIC_BASE_URL'] = ANTHROPIC_BASE_URL
+    return values
+
+
+SHELLS = ('posix', 'fish', 'powershell', 'cmd', 'json')
+
+
+def shell_assignments(values, shell):
+    """Return lines that set (or unset, for None) ``values`` in the current session of ``shell``"""
+    import shlex
+    if shell == 'json':
+        return [json.dumps(values)]
+    lines = []
+    for name, value in values.items():
+        if shell == 'powershell':
+            lines.append(f"$env:{name} = '{value.replace(chr(39), chr(39) * 2)}'" if value
+                         else f"Remove-Item Env:{name} -ErrorAction SilentlyContinue")
+        elif shell == 'cmd':
+            lines.append(f"set \"{name}={value}\"" if value else f"set {name}=")
+        elif shell == 'fish':
+            lines.append(f"set -gx {name} {shlex.quote(value)}" if value else f"set -e {name}")
+        else:
+            lines.append(f"export {name}={shlex.quote(value)}" if value else f"unset {name}")
+    return lines
+
+
+def write_project_settings(directory, profile, settings):
+    """Write ``profile`` into <directory>/.claude/settings.local.json and report the changes"""
+    backend = SettingsFileBackend(Path(directory) / ".claude" / "settings.local.json")
+    return apply_profile_values(backend, profile, project_environment(profile, settings))
+
+
+def clear_project_settings(directory, names=ENV_VARS):
+    """Remove the managed variables from <directory>/.claude/settings.local.json"""
+    backend = SettingsFileBackend(Path(directory) / ".claude" / "settings.local.json")
+    if backend.path.exists():
+        apply_profile_values(backend, None, dict.fromkeys(names))
+
+
+class VaultError(ProfileError):
+    """Raised when the key vault cannot be read or written"""
+
+
+class VaultLockedError(VaultError):
+    """Raised when a vaulted key is needed and no passphrase was given"""
+
+
+def read_passphrase(confirm=False):
+    """Return the vault passphrase from EZSWITCH_VAULT_PASSPHRASE or the terminal"""
+    passphrase = os.environ.get('EZSWITCH_VAULT_PASSPHRASE')
+    if passphrase:
+        return passphrase
+    if not sys.stdin.isatty():
+        return None
+    import getpass
+    passphrase = getpass.getpass("Vault passphrase: ")
+    if confirm and getpass.getpass("Repeat passphrase: ") != passphrase:
+        raise VaultError("Passphrases do not match")
+    return passphrase
+
+
+class KeyVault:
+    """Encrypted API keys, one record file per key, in ~/.claude_ez_switch/vault
+
+    The passphrase is stretched with scrypt once per session and the derived
+    key is kept in memory until it has been idle for ``timeout`` seconds.
+    Records are decrypted one at a time when asked for, so opening the vault
+    costs the same however many keys it holds. Each record is encrypted
+    with an HMAC-SHA256 keystream under a random nonce and authenticated,
+    together with its name, by a separate HMAC-SHA256 tag.
+    """
+
+    SCRYPT = {'n': 2 ** 15, 'r': 8, 'p': 1}
+
+    def __init__(self, directory, timeout=900, prompt=read_passphrase):
+        self.directory = Path(directory)
+        self.timeout = timeout
+        # Called with no arguments when a locked vault is read; returns the passphrase or None
+        self.prompt = prompt
+        self.keys = None
+        self.expires = 0.0
+        self.lock = threading.RLock()
+
+    @property
+    def meta_file(self):
+        return self.directory / "vault.json"
+
+    def record_file(self, name):
+        if not name or not name.replace('_', '').replace('-', '').isalnum():
+            raise VaultError(f"Invalid key name: {name!r}")
+        return self.directory / f"{name}.json"
+
+    def exists(self):
+        return self.meta_file.exists()
+
+    def has(self, name):
+        """Return True if a record exists for ``name`` (nothing is decrypted)"""
+        return self.record_file(name).exists()
+
+    def names(self):
+        """Return the names of the stored records"""
+        return sorted(path.stem for path in self.directory.glob("*.json") if path != self.meta_file)
+
+    @staticmethod
+    def derive(passphrase, meta):
+        """Stretch ``passphrase`` into (encryption key, MAC key) with the vault's KDF parameters"""
+        salt = base64.b64decode(meta['salt'])
+        if meta['kdf'] == 'scrypt':
+            key = hashlib.scrypt(passphrase.encode('utf-8'), salt=salt, n=meta['n'], r=meta['r'], p=meta['p'],
+                                 maxmem=256 * meta['n'] * meta['r'], dklen=64)
+        else:
+            key = hashlib.pbkdf2_hmac('sha256', passphrase.encode('utf-8'), salt, meta['iterations'], dklen=64)
+        return key[:32], key[32:]
+
+    @staticmethod
+    def verifier(keys):
+        return hmac.new(keys[1], b"ezswitch-vault", hashlib.sha256).hexdigest()
+
+    def create(self, passphrase):
+        """Start an empty vault protected by ``passphrase`` and unlock it"""
+        if not passphrase:
+            raise VaultError("A passphrase is required")
+        if hasattr(hashlib, 'scrypt'):
+            meta = dict(self.SCRYPT, version=1, kdf='scrypt')
+        else:
+            meta = {'version': 1, 'kdf': 'pbkdf2-sha256', 'iterations': 600000}
+        meta['salt'] = base64.b64encode(os.urandom(16)).decode('ascii')
+        with self.lock:
+            keys = self.derive(passphrase, meta)
+            meta['check'] = self.verifier(keys)
+            self.directory.mkdir(parents=True, exist_ok=True)
+            write_json_atomic(self.meta_file, meta)
+            self.remember(keys)
+
+    @traced("vault.unlock")
+    def unlock(self, passphrase):
+        """Derive the session key, raising VaultError if ``passphrase`` is wrong"""
+        try:
+            with open(self.meta_file, 'r') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            raise VaultError("No key vault has been set up")
+        except (OSError, ValueError) as e:
+            raise VaultError(f"Could not read {self.meta_file}: {e}")
+        keys = self.derive(passphrase or '', meta)
+        if not hmac.compare_digest(self.verifier(keys), meta['check']):
+            raise VaultError("Incorrect vault passphrase")
+        with self.lock:
+            self.remember(keys)
+
+    def remember(self, keys):
+        self.keys = keys
+        self.expires = time.monotonic() + self.timeout
+
+    def lock_now(self):
+        """Forget the session key"""
+        with self.lock:
+            self.keys = None
+
+    def is_unlocked(self):
+        return self.keys is not None and time.monotonic() < self.expires
+
+    def session_keys(self):
+        """Return the session key, asking for the passphrase if it expired; the timeout restarts on use"""
+        with self.lock:
+            if not self.is_unlocked():
+                self.keys = None
+                passphrase = self.prompt() if self.prompt else None
+                if not passphrase:
+                    raise VaultLockedError("The key vault is locked")
+                self.unlock(passphrase)
+            self.expires = time.monotonic() + self.timeout
+            return self.keys
+
+    @staticmethod
+    def keystream(key, nonce, length):
+        blocks = []
+        for counter in range((length + 31) // 32):
+            blocks.append(hmac.new(key, nonce + counter.to_bytes(8, 'big'), hashlib.sha256).digest())
+        return b''.join(blocks)[:length]
+
+    @staticmethod
+    def tag(key, name, nonce, ciphertext):
+        return hmac.new(key, name.encode('utf-8') + b"\0" + nonce + ciphertext, hashlib.sha256).hexdigest()
+
+    @traced("vault.decrypt")
+    def get(self, name):
+        """Decrypt and return the key stored as ``name``, or None if there is none"""
+        path = self.record_file(name)
+        try:
+            with open(path, 'r') as f:
+                record = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            raise VaultError(f"Could not read {path}: {e}")
+        enc_key, mac_key = self.session_keys()
+        nonce = base64.b64decode(record['nonce'])
+        ciphertext = base64.b64decode(record['ciphertext'])
+        if not hmac.compare_digest(self.tag(mac_key, name, nonce, ciphertext), record['tag']):
+            raise VaultError(f"The vault record for {name} has been modified or is corrupt")
+        plaintext = bytes(a ^ b for a, b in zip(ciphertext, self.keystream(enc_key, nonce, len(ciphertext))))
+        return plaintext.decode('utf-8')
+
+    def put(self, name, value):
+        """Encrypt ``value`` into the record ``name``; None or '' deletes the record"""
+        path = self.record_file(name)
+        if not value:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+            return
+        enc_key, mac_key = self.session_keys()
+        nonce = os.urandom(16)
+        plaintext = value.encode('utf-8')
+        ciphertext = bytes(a ^ b for a, b in zip(plaintext, self.keystream(enc_key, nonce, len(plaintext))))
+        try:
+            write_json_atomic(path, {
+                'nonce': base64.b64encode(nonce).decode('ascii'),
+                'ciphertext': base64.b64encode(ciphertext).decode('ascii'),
+                'tag': self.tag(mac_key, name, nonce, ciphertext),
+            })
+        except OSError as e:
+            raise VaultError(str(e))
+
+    def destroy(self):
+        """Delete every record and the vault itself"""
+        for name in self.names():
+            self.record_file(name).unlink()
+        if self.meta_file.exists():
+            self.meta_file.unlink()
+        try:
+            self.directory.rmdir()
+        except OSError:
+            pass
+        self.lock_now()
+
+
+_key_vault = None
+
+
+def key_vault():
+    """Return the process-wide KeyVault, so the session key is shared by every caller"""
+    global _key_vault
+    if _key_vault is None:
+        _key_vault = KeyVault(get_config_dir() / "vault")
+    return _key_vault
+
+
+def saved_secret(settings, name):
+    """Return a saved API key, decrypting it from the key vault when keys are vaulted"""
+    value = (settings.get(name) or '').strip()
+    if not value and settings.get('vault'):
+        value = (key_vault().get(name) or '').strip()
+    return value
+
+
+def profile_saved(profile, settings):
+    """Return False for a profile whose fields are all optional until one of them is saved
+
+    Such a profile (the local gateway) would otherwise always look configured
+    through its defaults and be listed, checked and benchmarked on every machine.
+    """
+    fields = PROVIDERS_BY_NAME[profile].fields
+    if not fields or any(field.missing for field in fields):
+        return True
+    vaulted = settings.get('vault') and key_vault()
+    return any((settings.get(field.key) or '').strip() or (field.secret and vaulted and vaulted.has(field.key))
+               for field in fields)
+
+
+def profile_configured(profile, settings):
+    """Return True if ``profile`` has everything it needs, without decrypting vaulted keys"""
+    if not profile_saved(profile, settings):
+        return False
+    name = PROFILE_SECRETS.get(profile)
+    if name and settings.get('vault') and not settings.get(name) and key_vault().has(name):
+        settings = dict(settings, **{name: "(vaulted)"})
+    try:
+        profile_environment(profile, settings)
+    except ProfileError:
+        return False
+    return True
+
+
+def mask_key(key):
+    """Mask an API key for display"""
+    return key[:8] + "..." + key[-4:] if len(key) > 12 else "***"
+
+
+def describe_status(env):
+    """Return the human-readable status text for a set of environment values"""
+    user_auth_token = (env.get('ANTHROPIC_AUTH_TOKEN') or '').strip()
+    user_base_url = (env.get('ANTHROPIC_BASE_URL') or '').strip()
+    
+    if user_auth_token.startswith(PROXY_TOKEN_PREFIX):
+        return f"✓ Routing through the EZ Switch proxy\nBase URL: {user_base_url}"
+    provider = PROVIDERS_BY_NAME[detect_profile(env)]
+    lines = [f"✓ Currently using {provider.status}"]
+    # The base URL is only worth showing when the user chose it
+    if user_base_url and dict(provider.templates()).get('ANTHROPIC_BASE_URL'):
+        lines.append(f"Base URL: {user_base_url}")
+    if user_auth_token:
+        lines.append(f"API Key: {mask_key(user_auth_token)}")
+    extras = [f"{name}={env[name]}" for name in env if name not in ENV_VARS and env[name]]
+    if extras:
+        lines.extend(extras)
+    elif not user_auth_token and not any(provider.variables.values()):
+        lines.append("(No environment variables set)")
+    return "\n".join(lines)
+
+
+def status_fingerprint(env):
+    """Hash the managed variables so a cached status can be compared without storing secrets"""
+    data = json.dumps({name: env.get(name) or '' for name in set(ENV_VARS) | set(env)}, sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class StartupTimer:
+    """Print startup milestones when EZSWITCH_STARTUP_TIMING is set"""
+
+    def __init__(self, start=None):
+        self.start = start if start is not None else time.perf_counter()
+        self.enabled = bool(os.environ.get('EZSWITCH_STARTUP_TIMING'))
+        self.marks = {}
+
+    def mark(self, name):
+        if name in self.marks:
+            return
+        self.marks[name] = (time.perf_counter() - self.start) * 1000
+        if TRACER.enabled:
+            TRACER.record(f"startup.{name}", self.marks[name] / 1000)
+        if self.enabled:
+            print(f"{name}: {self.marks[name]:.1f} ms")
+
+
+ANTHROPIC_BASE_URL = 'https://api.anthropic.com'
+ANTHROPIC_VERSION = '2023-06-01'
+
+
+class HTTPError(Exception):
+    """Raised when an HTTP exchange fails below the status-code level"""
+
+
+class HTTPResponse:
+    """Response whose body is streamed from a pooled connection"""
+
+    def __init__(self, client, key, reader, writer, status, headers, connect_time, ttfb, reason=''):
+        self.client = client
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        # Seconds spent opening the connection (0 when reused) and waiting for the status line
+        self.connect_time = connect_time
+        self.ttfb = ttfb
+        self.chunked = 'chunked' in headers.get('transfer-encoding', '').lower()
+        length = headers.get('content-length')
+        self.remaining = int(length) if length is not None and not self.chunked else None
+        self.keep_alive = headers.get('connection', '').lower() != 'close' and (
+            self.chunked or self.remaining is not None)
+        self.done = False
+
+    async def iter_chunks(self):
+        """Yield body bytes as they arrive"""
+        reader = self.reader
+        if self.chunked:
+            while True:
+                size_line = await reader.readline()
+                if not size_line:
+                    raise HTTPError("Connection closed mid-response")
+                size = int(size_line.split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # Skip trailers up to the terminating blank line
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    break
+                data = await reader.readexactly(size)
+                await reader.readexactly(2)
+                yield data
+        elif self.remaining is not None:
+            while self.remaining > 0:
+                data = await reader.read(min(self.remaining, 65536))
+                if not data:
+                    raise HTTPError("Connection closed mid-response")
+                self.remaining -= len(data)
+                yield data
+        else:
+            while True:
+                data = await reader.read(65536)
+                if not data:
+                    break
+                yield data
+        self.done = True
+        self.release()
+
+    async def read(self):
+        """Read the whole body"""
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    async def iter_lines(self):
+        """Yield decoded body lines, e.g. for server-sent events"""
+        buffer = b''
+        async for chunk in self.iter_chunks():
+            buffer += chunk
+            while b'\n' in buffer:
+                line, buffer = buffer.split(b'\n', 1)
+                yield line.rstrip(b'\r').decode('utf-8', 'replace')
+        if buffer:
+            yield buffer.decode('utf-8', 'replace')
+
+    def release(self):
+        """Return the connection to the pool if it can be reused, otherwise close it"""
+        if self.writer is None:
+            return
+        pool = self.client.idle.setdefault(self.key, [])
+        if self.done and self.keep_alive and len(pool) < self.client.max_idle:
+            pool.append((self.reader, self.writer))
+        else:
+            self.writer.close()
+        self.reader = self.writer = None
+
+
+class AsyncHTTPClient:
+    """Minimal asyncio HTTP/1.1 client that keeps connections alive per origin"""
+
+    def __init__(self, timeout=30, max_idle=8):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        # (scheme, host, port) -> idle (reader, writer) pairs
+        self.idle = {}
+
+    async def _connect(self, key):
+        import asyncio
+        import ssl
+        scheme, host, port = key
+        context = ssl.create_default_context() if scheme == 'https' else None
+        return await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=context,
+                                    server_hostname=host if context else None),
+            self.timeout)
+
+    async def request(self, method, url, headers=None, body=None):
+        """Send a request and return an HTTPResponse once the headers have arrived"""
+        import asyncio
+        from urllib.parse import urlsplit
+        parts = urlsplit(url)
+        scheme = parts.scheme or 'http'
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = (parts.path or '/') + (f"?{parts.query}" if parts.query else '')
+        
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode('utf-8')
+            headers = dict(headers or {}, **{'content-type': 'application/json'})
+        host_header = parts.hostname if parts.port is None else f"{parts.hostname}:{port}"
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host_header}", "Connection: keep-alive"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        lines.append(f"Content-Length: {len(body or b'')}")
+        head = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1')
+        
+        # A pooled connection may have been closed by the server; retry once on a fresh one
+        while True:
+            pooled = self.idle.get(key)
+            reused = bool(pooled)
+            start = time.perf_counter()
+            if reused:
+                reader, writer = pooled.pop()
+            else:
+                # asyncio.TimeoutError is an OSError from Python 3.11, so it is caught first
+                try:
+                    reader, writer = await self._connect(key)
+                except asyncio.TimeoutError:
+                    raise HTTPError(f"Could not connect to {parts.hostname}:{port}: "
+                                    f"timed out after {self.timeout:g} s")
+                except OSError as e:
+                    raise HTTPError(f"Could not connect to {parts.hostname}:{port}: {e}")
+            connected = time.perf_counter()
+            try:
+                writer.write(head + (body or b''))
+                await writer.drain()
+                status_line = await asyncio.wait_for(reader.readline(), self.timeout)
+                if not status_line:
+                    raise ConnectionResetError("Connection closed before response")
+            except asyncio.TimeoutError:
+                # Not retried: the server is slow, not gone, and a fresh connection would wait as long again
+                writer.close()
+                raise HTTPError(f"No response from {parts.hostname}:{port} within {self.timeout:g} s")
+            except (OSError, asyncio.IncompleteReadError) as e:
+                writer.close()
+                if reused:
+                    continue
+                raise HTTPError(str(e) or type(e).__name__)
+            break
+        
+        ttfb = time.perf_counter() - connected
+        try:
+            _, status, reason = (status_line.decode('latin-1').rstrip('\r\n') + ' ').split(' ', 2)
+            status = int(status)
+        except ValueError:
+            writer.close()
+            raise HTTPError(f"Malformed status line: {status_line!r}")
+        response_headers = {}
+        while True:
+            try:
+                line = await asyncio.wait_for(reader.readline(), self.timeout)
+            except asyncio.TimeoutError:
+                writer.close()
+                raise HTTPError(f"Response headers from {parts.hostname}:{port} stalled for {self.timeout:g} s")
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            response_headers[name.strip().lower()] = value.strip()
+        return HTTPResponse(self, key, reader, writer, status, response_headers,
+                            0.0 if reused else connected - start, ttfb, reason.strip())
+
+    def close(self):
+        """Close every idle connection"""
+        for connections in self.idle.values():
+            for _, writer in connections:
+                writer.close()
+        self.idle.clear()
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers, or None if empty"""
+    if not values:
+        return None
+    import math
+    ordered = sorted(values)
+    # The smallest value with at least pct% of the samples at or below it
+    rank = max(math.ceil(pct * len(ordered) / 100), 1)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def profile_endpoint(profile, settings):
+    """Return (base_url, token) for a profile that talks to an API, or None"""
+    if not profile_saved(profile, settings):
+        return None
+    try:
+        env = profile_environment(profile, settings)
+    except ProfileError:
+        return None
+    token = env.get('ANTHROPIC_AUTH_TOKEN')
+    if not token:
+        return None
+    return (env.get('ANTHROPIC_BASE_URL') or ANTHROPIC_BASE_URL), token
+
+
+def messages_request(base_url, token, model, max_tokens, stream=True, prompt="Count from 1 to 20."):
+    """Return (url, headers, body) for a minimal Messages API call"""
+    url = base_url.rstrip('/') + '/v1/messages'
+    headers = {
+        'authorization': f"Bearer {token}",
+        'anthropic-version': ANTHROPIC_VERSION,
+        'accept': 'text/event-stream' if stream else 'application/json',
+    }
+    body = {'model': model, 'max_tokens': max_tokens, 'stream': stream,
+            'messages': [{'role': 'user', 'content': prompt}]}
+    return url, headers, body
+
+
+class BenchmarkResult:
+    """Latency and throughput samples for one profile"""
+
+    def __init__(self, profile, base_url):
+        self.profile = profile
+        self.base_url = base_url
+        self.connect = []
+        self.ttfb = []
+        self.tokens_per_second = []
+        self.errors = []
+
+    def summary(self):
+        def ms(value):
+            return None if value is None else round(value * 1000, 1)
+        return {
+            'profile': self.profile,
+            'base_url': self.base_url,
+            'runs': len(self.ttfb) + len(self.errors),
+            'errors': len(self.errors),
+            'last_error': self.errors[-1] if self.errors else None,
+            'connect_ms_p50': ms(percentile(self.connect, 50)),
+            'connect_ms_p95': ms(percentile(self.connect, 95)),
+            'ttfb_ms_p50': ms(percentile(self.ttfb, 50)),
+            'ttfb_ms_p95': ms(percentile(self.ttfb, 95)),
+            'tokens_per_second_p50': percentile(self.tokens_per_second, 50),
+            'tokens_per_second_p95': percentile(self.tokens_per_second, 95),
+        }
+
+
+async def stream_message(client, url, headers, body):
+    """Run one streaming Messages call and return (response, output tokens, streaming seconds)"""
+    response = await client.request('POST', url, headers, body)
+    if response.status != 200:
+        detail = (await response.read()).decode('utf-8', 'replace')[:200]
+        raise HTTPError(f"HTTP {response.status}: {detail}")
+    first_delta = last_delta = None
+    deltas = 0
+    output_tokens = None
+    async for line in response.iter_lines():
+        if not line.startswith('data:'):
+            continue
+        try:
+            event = json.loads(line[5:])
+        except ValueError:
+            continue
+        if event.get('type') == 'content_block_delta':
+            last_delta = time.perf_counter()
+            first_delta = first_delta or last_delta
+            deltas += 1
+        elif event.get('type') == 'message_delta':
+            output_tokens = (event.get('usage') or {}).get('output_tokens', output_tokens)
+    tokens = output_tokens if output_tokens is not None else deltas
+    duration = (last_delta - first_delta) if first_delta and last_delta and last_delta > first_delta else None
+    return response, tokens, duration
+
+
+async def benchmark_profile(client, profile, base_url, token, runs, model, max_tokens):
+    """Probe one endpoint ``runs`` times in sequence so later runs reuse the connection"""
+    result = BenchmarkResult(profile, base_url)
+    url, headers, body = messages_request(base_url, token, model, max_tokens)
+    for _ in range(runs):
+        try:
+            response, tokens, duration = await stream_message(client, url, headers, body)
+        except (HTTPError, OSError, ValueError) as e:
+            result.errors.append(str(e))
+            continue
+        if response.connect_time:
+            result.connect.append(response.connect_time)
+        result.ttfb.append(response.ttfb)
+        if duration:
+            result.tokens_per_second.append(round(tokens / duration, 1))
+    return result
+
+
+async def benchmark_endpoints(endpoints, runs=5, model='claude-3-5-haiku-latest', max_tokens=64, timeout=30):
+    """Benchmark {profile: (base_url, token)} concurrently and return BenchmarkResults"""
+    import asyncio
+    client = AsyncHTTPClient(timeout=timeout)
+    try:
+        return await asyncio.gather(*[
+            benchmark_profile(client, profile, base_url, token, runs, model, max_tokens)
+            for profile, (base_url, token) in endpoints.items()
+        ])
+    finally:
+        client.close()
+
+
+def run_benchmark(settings, runs=5, model='claude-3-5-haiku-latest', max_tokens=64, timeout=30):
+    """Benchmark every saved profile that has an endpoint and key"""
+    import asyncio
+    endpoints = {}
+    for profile in PROFILES:
+        endpoint = profile_endpoint(profile, settings)
+        if endpoint:
+            endpoints[profile] = endpoint
+    if not endpoints:
+        raise ProfileError("No saved profiles with an API key to benchmark")
+    results = asyncio.run(benchmark_endpoints(endpoints, runs, model, max_tokens, timeout))
+    return [result.summary() for result in results]
+
+
+def fastest_profile(summaries):
+    """Return the profile with the lowest median time-to-first-byte and no errors"""
+    candidates = [s for s in summaries if not s['errors'] and s['ttfb_ms_p50'] is not None]
+    if not candidates:
+        return None
+    return min(candidates, key=lambda s: s['ttfb_ms_p50'])['profile']
+
+
+def format_benchmark(summaries):
+    """Return benchmark summaries as display lines"""
+    def fmt(value, unit):
+        return "-" if value is None else f"{value:g}{unit}"
+    lines = []
+    for s in summaries:
+        lines.append(
+            f"{PROFILES[s['profile']]}: TTFB {fmt(s['ttfb_ms_p50'], ' ms')} p50 / {fmt(s['ttfb_ms_p95'], ' ms')} p95, "
+            f"connect {fmt(s['connect_ms_p50'], ' ms')}, "
+            f"{fmt(s['tokens_per_second_p50'], ' tok/s')} p50"
+            + (f", {s['errors']}/{s['runs']} failed" if s['errors'] else "")
+        )
+    return lines
+
+
+async def probe_endpoint(client, base_url, token=None, timeout=5.0):
+    """Probe an endpoint once and return (healthy, latency seconds, error message)
+
+    Any response below 500 counts as healthy: it proves the gateway is up even
+    when the key or path is rejected.
+    """
+    import asyncio
+    headers = {'anthropic-version': ANTHROPIC_VERSION}
+    if token:
+        headers['authorization'] = f"Bearer {token}"
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            client.request('GET', base_url.rstrip('/') + '/v1/models', headers), timeout)
+        await asyncio.wait_for(response.read(), timeout)
+    except asyncio.TimeoutError:
+        return False, time.perf_counter() - start, "Timed out"
+    except (HTTPError, OSError) as e:
+        return False, time.perf_counter() - start, str(e)
+    latency = time.perf_counter() - start
+    if response.status >= 500:
+        return False, latency, f"HTTP {response.status}"
+    return True, latency, None
+
+
+PREFLIGHT_TTL = 600.0
+
+VALIDATION_TEXT = {
+    'valid': "key accepted",
+    'rejected': "key rejected",
+    'unverified': "endpoint reachable, key not checked",
+    'unreachable': "endpoint unreachable",
+}
+
+
+class Validation:
+    """Outcome of checking one profile's key against its endpoint before switching to it
+
+    ``status`` is 'valid' (the key was accepted), 'rejected' (401 or 403),
+    'unverified' (the endpoint answered but offers no /v1/models to check
+    the key against) or 'unreachable' (no answer, a timeout or a 5xx).
+    """
+
+    def __init__(self, profile, base_url, status, detail=None, latency=None, cached=False):
+        self.profile = profile
+        self.base_url = base_url
+        self.status = status
+        self.detail = detail
+        self.latency = latency
+        self.cached = cached
+
+    @property
+    def ok(self):
+        """False when switching would leave Claude Code with a key or endpoint that does not work"""
+        return self.status in ('valid', 'unverified')
+
+    def describe(self):
+        text = f"{PROFILES.get(self.profile, self.profile)} ({self.base_url}): {VALIDATION_TEXT[self.status]}"
+        if self.detail:
+            text += f" ({self.detail})"
+        if self.cached:
+            text += " [cached]"
+        elif self.latency is not None:
+            text += f" in {self.latency * 1000:.0f} ms"
+        return text
+
+
+async def validate_endpoint(client, base_url, token, timeout=5.0):
+    """Send one authenticated GET /v1/models and return (status, detail, latency seconds)"""
+    import asyncio
+    headers = {'anthropic-version': ANTHROPIC_VERSION, 'authorization': f"Bearer {token}"}
+    start = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(
+            client.request('GET', base_url.rstrip('/') + '/v1/models', headers), timeout)
+        await asyncio.wait_for(response.read(), timeout)
+    except asyncio.TimeoutError:
+        return 'unreachable', f"no response within {timeout:g} s", time.perf_counter() - start
+    except (HTTPError, OSError) as e:
+        return 'unreachable', str(e), time.perf_counter() - start
+    latency = time.perf_counter() - start
+    if 200 <= response.status < 300:
+        return 'valid', None, latency
+    if response.status in (401, 403):
+        return 'rejected', f"HTTP {response.status}", latency
+    if response.status >= 500:
+        return 'unreachable', f"HTTP {response.status}", latency
+    return 'unverified', f"HTTP {response.status}", latency
+
+
+async def validate_endpoints(endpoints, timeout=5.0):
+    """Check {profile: (base_url, token)} concurrently; returns {profile: (status, detail, latency)}"""
+    import asyncio
+    client = AsyncHTTPClient(timeout=timeout)
+    try:
+        outcomes = await asyncio.gather(*[validate_endpoint(client, base_url, token, timeout)
+                                          for base_url, token in endpoints.values()])
+    finally:
+        client.close()
+    return dict(zip(endpoints, outcomes))
+
+
+class ValidationCache:
+    """Pre-flight results kept for ``ttl`` seconds per (base URL, key hash) in preflight_cache.json
+
+    Keys are stored only as SHA-256 digests. Unreachable results are not
+    kept, since an endpoint that is down now may be back by the next switch.
+    """
+
+    def __init__(self, path=None, ttl=PREFLIGHT_TTL):
+        self.path = Path(path) if path else get_config_dir() / "preflight_cache.json"
+        self.ttl = ttl
+        self.entries = None
+
+    @staticmethod
+    def cache_key(base_url, token):
+        return f"{base_url.rstrip('/')} {hashlib.sha256(token.encode('utf-8')).hexdigest()}"
+
+    def load(self):
+        if self.entries is None:
+            try:
+                with open(self.path, 'r') as f:
+                    entries = json.load(f)
+                self.entries = entries if isinstance(entries, dict) else {}
+            except (OSError, ValueError):
+                self.entries = {}
+        return self.entries
+
+    def get(self, base_url, token):
+        """Return the unexpired entry for this URL and key, or None"""
+        entry = self.load().get(self.cache_key(base_url, token))
+        if not isinstance(entry, dict) or time.time() - entry.get('checked_at', 0) >= self.ttl:
+            return None
+        return entry
+
+    def put(self, outcomes):
+        """Record {(base_url, token): (status, detail)} and drop expired entries, in one write"""
+        now = time.time()
+        entries = {key: entry for key, entry in self.load().items()
+                   if isinstance(entry, dict) and now - entry.get('checked_at', 0) < self.ttl}
+        for (base_url, token), (status, detail) in outcomes.items():
+            if status != 'unreachable':
+                entries[self.cache_key(base_url, token)] = {'status': status, 'detail': detail, 'checked_at': now}
+        self.entries = entries
+        try:
+            write_json_atomic(self.path, entries)
+        except OSError:
+            pass
+
+
+@traced("preflight")
+def validate_profiles(profiles, settings, cache=None, timeout=5.0, refresh=False):
+    """Check the keys of several profiles concurrently, reusing cached results; returns Validations
+
+    Profiles without a key (Claude Subscription, or nothing saved) are
+    skipped. ``refresh`` ignores cached results but still records new ones.
+    """
+    import asyncio
+    validations = {}
+    endpoints = {}
+    for profile in profiles:
+        endpoint = profile_endpoint(profile, settings)
+        if endpoint is None:
+            continue
+        entry = None if refresh or cache is None else cache.get(*endpoint)
+        if entry is not None:
+            validations[profile] = Validation(profile, endpoint[0], entry['status'], entry.get('detail'), cached=True)
+        else:
+            endpoints[profile] = endpoint
+    if endpoints:
+        outcomes = asyncio.run(validate_endpoints(endpoints, timeout))
+        for profile, (status, detail, latency) in outcomes.items():
+            validations[profile] = Validation(profile, endpoints[profile][0], status, detail, latency)
+        if cache is not None:
+            cache.put({endpoints[profile]: outcome[:2] for profile, outcome in outcomes.items()})
+    return [validations[profile] for profile in profiles if profile in validations]
+
+
+def preflight_options(settings):
+    """Return (enabled, ttl, timeout) from the 'preflight' block in config.json"""
+    config = settings.get('preflight') or {}
+    return (bool(config.get('enabled', False)), float(config.get('ttl', PREFLIGHT_TTL)),
+            float(config.get('timeout', 5.0)))
+
+
+def preflight_check(profile, settings, enabled=None):
+    """Check ``profile``'s key before switching when pre-flight is on; ``enabled`` overrides config.json
+
+    Raises ProfileError, before anything is written, if the endpoint rejects
+    the key or cannot be reached. Returns the Validation, or None when
+    nothing was checked.
+    """
+    configured, ttl, timeout = preflight_options(settings)
+    if not (configured if enabled is None else enabled):
+        return None
+    validations = validate_profiles([profile], settings, ValidationCache(ttl=ttl), timeout)
+    if not validations:
+        return None
+    if not validations[0].ok:
+        raise ProfileError(f"Pre-flight check failed; nothing was changed.\n{validations[0].describe()}")
+    return validations[0]
+
+
+def active_endpoint(env):
+    """Return (profile, base_url, token) that Claude Code will use for ``env``"""
+    return (detect_profile(env),
+            env.get('ANTHROPIC_BASE_URL') or ANTHROPIC_BASE_URL,
+            env.get('ANTHROPIC_AUTH_TOKEN') or None)
+
+
+class HealthMonitor:
+    """Background prober for the active endpoint with backoff and optional failover
+
+    Probes run on a private thread with its own event loop and a pooled
+    AsyncHTTPClient. ``on_update`` receives a status dict after every probe
+    and ``on_failover`` receives (profile, ApplyReport) after a switch; both
+    are called from the monitor thread.
+    """
+
+    def __init__(self, backend, load_settings, interval=30.0, timeout=5.0, max_backoff=300.0,
+                 window=20, failure_threshold=3, failover_profiles=(), on_update=None, on_failover=None):
+        self.backend = backend
+        self.load_settings = load_settings
+        self.interval = interval
+        self.timeout = timeout
+        self.max_backoff = max_backoff
+        self.failure_threshold = failure_threshold
+        self.failover_profiles = list(failover_profiles)
+        self.on_update = on_update
+        self.on_failover = on_failover
+        self.samples = collections.deque(maxlen=window)
+        self.consecutive_failures = 0
+        self.last_error = None
+        # Set when the last check itself broke, so the endpoint's health is not known
+        self.check_failed = False
+        self.endpoint = None
+        self.thread = None
+        self.loop = None
+        self.wakeup = None
+
+    def status(self):
+        """Return a snapshot of the active endpoint's health"""
+        latencies = [latency for ok, latency in self.samples if ok]
+        failures = sum(1 for ok, _ in self.samples if not ok)
+        p50 = percentile(latencies, 50)
+        return {
+            'profile': self.endpoint[0] if self.endpoint else None,
+            'base_url': self.endpoint[1] if self.endpoint else None,
+            'healthy': not self.check_failed and self.consecutive_failures < self.failure_threshold,
+            'unknown': self.check_failed,
+            'latency_ms_p50': None if p50 is None else round(p50 * 1000, 1),
+            'error_rate': round(failures / len(self.samples), 3) if self.samples else None,
+            'samples': len(self.samples),
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+        }
+
+    def next_delay(self):
+        """Seconds until the next probe: the interval, doubled per consecutive failure up to max_backoff"""
+        if not self.consecutive_failures:
+            return self.interval
+        return min(self.interval * (2 ** self.consecutive_failures), self.max_backoff)
+
+    async def check(self, client):
+        """Probe the active endpoint once, fail over if needed, and return the status"""
+        import asyncio
+        loop = asyncio.get_running_loop()
+        env = await loop.run_in_executor(None, self.backend.get, ENV_VARS)
+        endpoint = active_endpoint(env)
+        if endpoint[:2] != (self.endpoint or (None, None))[:2]:
+            # A different endpoint became active; its history starts fresh
+            self.samples.clear()
+            self.consecutive_failures = 0
+        self.endpoint = endpoint
+        
+        ok, latency, error = await probe_endpoint(client, endpoint[1], endpoint[2], self.timeout)
+        self.check_failed = False
+        self.samples.append((ok, latency))
+        if ok:
+            self.consecutive_failures = 0
+            self.last_error = None
+        else:
+            self.consecutive_failures += 1
+            self.last_error = error
+        
+        if self.consecutive_failures >= self.failure_threshold and self.failover_profiles:
+            await self.fail_over(client)
+        status = self.status()
+        if self.on_update:
+            self.on_update(status)
+        return status
+
+    async def fail_over(self, client):
+        """Switch to the first healthy profile in the priority list
+
+        In proxy mode the environment points at the proxy, so the failing
+        endpoint is the proxy's upstream and only that upstream is switched.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        settings = await loop.run_in_executor(None, self.load_settings)
+        port = proxy_port(settings)
+        failing = self.endpoint[1]
+        if port:
+            upstream = await loop.run_in_executor(None, proxy_request, port, 'GET', '/_ezswitch/status')
+            failing = upstream.get('base_url') or failing
+        for profile in self.failover_profiles:
+            endpoint = profile_endpoint(profile, settings)
+            # Skip unconfigured profiles and the endpoint that is already failing
+            if endpoint is None or endpoint[0].rstrip('/') == failing.rstrip('/'):
+                continue
+            ok, _, _ = await probe_endpoint(client, endpoint[0], endpoint[1], self.timeout)
+            if not ok:
+                continue
+            if port:
+                report = await loop.run_in_executor(None, switch_proxy_upstream, self.backend, port, profile,
+                                                    settings)
+                # Claude Code still talks to the proxy, which is what the next probe checks
+                self.endpoint = (profile,) + self.endpoint[1:]
+            else:
+                report = await loop.run_in_executor(None, apply_profile, self.backend, profile, settings)
+                self.endpoint = (profile,) + endpoint
+            self.samples.clear()
+            self.consecutive_failures = 0
+            self.last_error = None
+            if self.on_failover:
+                self.on_failover(profile, report)
+            return profile
+        return None
+
+    async def _run(self):
+        import asyncio
+        self.loop = asyncio.get_running_loop()
+        self.wakeup = asyncio.Event()
+        client = AsyncHTTPClient(timeout=self.timeout)
+        try:
+            while not self.wakeup.is_set():
+                try:
+                    await self.check(client)
+                except Exception as e:
+                    self.report_check_error(e)
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), self.next_delay())
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            client.close()
+
+    def report_check_error(self, error):
+        """Log a check that raised and report the endpoint's health as unknown rather than unchanged"""
+        import traceback
+        print("Error in health check:", file=sys.stderr)
+        traceback.print_exception(type(error), error, error.__traceback__)
+        self.check_failed = True
+        self.consecutive_failures += 1
+        self.last_error = f"health check failed: {error}"
+        if self.on_update:
+            try:
+                self.on_update(self.status())
+            except Exception as e:
+                traceback.print_exception(type(e), e, e.__traceback__)
+
+    def start(self):
+        """Start probing on a daemon thread"""
+        import asyncio
+        if self.thread is None:
+            self.thread = threading.Thread(target=lambda: asyncio.run(self._run()), daemon=True)
+            self.thread.start()
+
+    def stop(self, timeout=2):
+        """Stop probing and wait briefly for the thread to finish"""
+        if self.loop is not None and self.wakeup is not None:
+            try:
+                self.loop.call_soon_threadsafe(self.wakeup.set)
+            except RuntimeError:
+                pass
+        if self.thread is not None:
+            self.thread.join(timeout)
+            self.thread = None
+
+
+def health_monitor_options(settings):
+    """Return HealthMonitor keyword arguments from the 'health_monitor' block in config.json"""
+    config = settings.get('health_monitor') or {}
+    options = {}
+    for name in ('interval', 'timeout', 'max_backoff', 'failure_threshold'):
+        if name in config:
+            options[name] = config[name]
+    options['failover_profiles'] = [p for p in config.get('failover', []) if p in PROFILES]
+    return options
+
+
+def format_health(status):
+    """Return a one-line description of endpoint health"""
+    if status.get('unknown'):
+        return f"Endpoint health: UNKNOWN\nLast error: {status['last_error']}"
+    if not status.get('samples'):
+        return "Endpoint health: checking..."
+    state = "OK" if status['healthy'] else "DEGRADED"
+    parts = [f"Endpoint health: {state}"]
+    if status['latency_ms_p50'] is not None:
+        parts.append(f"{status['latency_ms_p50']:g} ms p50")
+    parts.append(f"{status['error_rate'] * 100:.0f}% errors")
+    text = " · ".join(parts)
+    if status['last_error']:
+        text += f"\nLast error: {status['last_error']}"
+    return text
+
+
+# Headers that describe a single connection and must not be forwarded
+HOP_BY_HOP_HEADERS = ('connection', 'keep-alive', 'proxy-authenticate', 'proxy-authorization',
+                      'te', 'trailer', 'transfer-encoding', 'upgrade', 'host', 'content-length')
+
+
+def proxy_url(port):
+    return f"http://127.0.0.1:{port}"
+
+
+def proxy_token(path=None):
+    """Return this install's proxy token, generating it on first use (the file is readable only by the user)"""
+    path = Path(path) if path else get_config_dir() / "proxy_token"
+    try:
+        token = path.read_text().strip()
+        if token:
+            return token
+    except OSError:
+        pass
+    token = f"{PROXY_TOKEN_PREFIX}-{os.urandom(24).hex()}"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w') as f:
+        f.write(token)
+    return token
+
+
+def proxy_environment(port):
+    """Variables that point Claude Code at the local proxy"""
+    return {'ANTHROPIC_AUTH_TOKEN': proxy_token(), 'ANTHROPIC_BASE_URL': proxy_url(port)}
+
+
+class SwitchingProxy:
+    """Local Anthropic-compatible proxy that forwards to whichever profile is selected
+
+    Responses, including server-sent event streams, are relayed chunk by chunk
+    as they arrive. Upstream connections are kept alive and reused. The
+    upstream is changed with ``set_upstream`` or ``POST /_ezswitch/upstream``.
+
+    Every request, including control requests, must carry ``token`` (this
+    install's proxy token by default) as its bearer token or x-api-key, and a
+    Host header naming the proxy itself, so neither another local user nor a
+    web page rebinding a domain to 127.0.0.1 can spend the key or redirect it.
+    """
+
+    def __init__(self, load_settings, host='127.0.0.1', port=DEFAULT_PROXY_PORT, timeout=600, token=None):
+        self.load_settings = load_settings
+        self.token = token or proxy_token()
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self.upstream = None
+        self.requests = 0
+        self.client = None
+        self.server = None
+        # Open client connections, closed on shutdown so their handlers exit cleanly
+        self.connections = set()
+
+    def set_upstream(self, profile, settings=None):
+        """Route new requests to ``profile``; requests already in flight finish on the old upstream"""
+        settings = self.load_settings() if settings is None else settings
+        endpoint = profile_endpoint(profile, settings)
+        if endpoint is None:
+            raise ProfileError(f"{PROFILES.get(profile, profile)} has no API key and cannot be used through the proxy")
+        self.upstream = (profile,) + endpoint
+        return self.upstream
+
+    def status(self):
+        profile, base_url = (self.upstream or (None, None, None))[:2]
+        return {'profile': profile, 'base_url': base_url, 'requests': self.requests,
+                'url': proxy_url(self.port)}
+
+    async def start(self):
+        import asyncio
+        self.client = AsyncHTTPClient(timeout=self.timeout)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        # Port 0 asks the OS for a free port
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        import asyncio
+        if self.server is not None:
+            self.server.close()
+            for writer in list(self.connections):
+                writer.close()
+            # Let connection handlers observe EOF and finish
+            await asyncio.sleep(0)
+            await self.server.wait_closed()
+        if self.client is not None:
+            self.client.close()
+
+    async def handle_connection(self, reader, writer):
+        """Serve requests on one client connection until it closes"""
+        import asyncio
+        self.connections.add(writer)
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await self.read_request_body(reader, headers)
+                
+                if not self.allowed(headers):
+                    await self.send_json(writer, 401, {'type': 'error', 'error': {
+                        'type': 'authentication_error', 'message': "Not an EZ Switch proxy request"}})
+                    break
+                if path.startswith('/_ezswitch/'):
+                    await self.handle_control(writer, method, path, body)
+                else:
+                    await self.forward(writer, method, path, headers, body)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            self.connections.discard(writer)
+            writer.close()
+
+    def allowed(self, headers):
+        """Return True if the request names this proxy as its host and carries the proxy token"""
+        if headers.get('host', '').lower() not in (f"127.0.0.1:{self.port}", f"localhost:{self.port}"):
+            return False
+        authorization = headers.get('authorization', '')
+        token = authorization[7:] if authorization[:7].lower() == 'bearer ' else headers.get('x-api-key', '')
+        return hmac.compare_digest(token.strip().encode('utf-8'), self.token.encode('utf-8'))
+
+    @staticmethod
+    async def read_request_body(reader, headers):
+        if 'chunked' in headers.get('transfer-encoding', '').lower():
+            parts = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass
+                    return b''.join(parts)
+                parts.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+        length = int(headers.get('content-length') or 0)
+        return await reader.readexactly(length) if length else b''
+
+    @staticmethod
+    async def send_json(writer, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        writer.write(f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(data)}\r\n\r\n".encode('latin-1') + data)
+        await writer.drain()
+
+    async def handle_control(self, writer, method, path, body):
+        if path == '/_ezswitch/status':
+            await self.send_json(writer, 200, self.status())
+        elif path == '/_ezswitch/upstream' and method == 'POST':
+            try:
+                self.set_upstream(json.loads(body or b'{}').get('profile'))
+            except (ProfileError, ValueError) as e:
+                await self.send_json(writer, 400, {'error': str(e)})
+                return
+            await self.send_json(writer, 200, self.status())
+        else:
+            await self.send_json(writer, 404, {'error': f"Unknown control path: {path}"})
+
+    async def forward(self, writer, method, path, headers, body):
+        """Relay one request upstream and stream the response back"""
+        if self.upstream is None:
+            await self.send_json(writer, 503, {'type': 'error', 'error': {
+                'type': 'api_error', 'message': "EZ Switch proxy has no upstream selected"}})
+            return
+        _, base_url, token = self.upstream
+        forward_headers = {name: value for name, value in headers.items()
+                           if name not in HOP_BY_HOP_HEADERS and name not in ('authorization', 'x-api-key')}
+        forward_headers['authorization'] = f"Bearer {token}"
+        self.requests += 1
+        try:
+            response = await self.client.request(method, base_url.rstrip('/') + path, forward_headers, body)
+        except HTTPError as e:
+            await self.send_json(writer, 502, {'type': 'error', 'error': {'type': 'api_error', 'message': str(e)}})
+            return
+        
+        lines = [f"HTTP/1.1 {response.status} {response.reason}"]
+        for name, value in response.headers.items():
+            if name not in HOP_BY_HOP_HEADERS:
+                lines.append(f"{name}: {value}")
+        chunked = response.remaining is None
+        lines.append("Transfer-Encoding: chunked" if chunked else f"Content-Length: {response.remaining}")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1'))
+        try:
+            async for chunk in response.iter_chunks():
+                writer.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n" if chunked else chunk)
+                # Flush every chunk so streamed tokens reach the client immediately
+                await writer.drain()
+        finally:
+            response.release()
+        if chunked:
+            writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+
+def proxy_request(port, method, path, payload=None, timeout=5, token=None):
+    """Call the running proxy's control API and return the decoded JSON response"""
+    import urllib.request
+    import urllib.error
+    data = json.dumps(payload).encode('utf-8') if payload is not None else None
+    request = urllib.request.Request(proxy_url(port) + path, data=data, method=method,
+                                     headers={'Content-Type': 'application/json',
+                                              'Authorization': f"Bearer {token or proxy_token()}"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        try:
+            message = json.loads(e.read()).get('error')
+        except ValueError:
+            message = None
+        raise ProfileError(message or f"Proxy returned HTTP {e.code}")
+    except (OSError, ValueError) as e:
+        raise HTTPError(f"EZ Switch proxy is not reachable on port {port}: {e}")
+
+
+def proxy_port(settings):
+    """Return the proxy port if proxy mode is enabled in config.json, else None"""
+    config = settings.get('proxy') or {}
+    return int(config.get('port', DEFAULT_PROXY_PORT)) if config.get('enabled') else None
+
+
+def switch_proxy_upstream(backend, port, profile, settings):
+    """Point the environment at the proxy (a no-op after the first time) and switch its upstream live
+
+    Nothing is written unless the proxy answers first, so a stopped proxy
+    never ends up as Claude Code's endpoint.
+    """
+    if profile_endpoint(profile, settings) is None:
+        raise ProfileError(f"{PROFILES[profile]} has no API key and cannot be used through the proxy")
+    try:
+        proxy_request(port, 'GET', '/_ezswitch/status')
+    except HTTPError as e:
+        raise HTTPError(f"{e}. Nothing was changed; start it with 'ezswitch proxy' "
+                        f"or turn proxy mode off with 'ezswitch proxy --off'")
+    # The proxy only swaps the key and URL; the profile's other variables are written as usual
+    values = dict(profile_environment(profile, settings), **proxy_environment(port))
+    report = apply_profile_values(backend, profile, values)
+    proxy_request(port, 'POST', '/_ezswitch/upstream', {'profile': profile})
+    record_switch(profile)
+    return report
+
+
+def run_proxy(settings, port, backend=None):
+    """Serve the proxy in the foreground until interrupted"""
+    import asyncio
+    
+    async def serve():
+        proxy = SwitchingProxy(load_settings, port=port)
+        profile = selected_profile(settings)
+        try:
+            proxy.set_upstream(profile, settings)
+        except ProfileError as e:
+            print(f"Warning: {e}; select a profile with 'ezswitch apply'", file=sys.stderr)
+        await proxy.start()
+        if backend is not None:
+            apply_profile_values(backend, profile, proxy_environment(proxy.port))
+        upstream = proxy.status()
+        print(f"EZ Switch proxy listening on {proxy_url(proxy.port)} -> {upstream['base_url'] or '(none)'}", flush=True)
+        try:
+            await proxy.server.serve_forever()
+        finally:
+            await proxy.close()
+    
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+def utc_timestamp(t=None):
+    """Return ``t`` (default: now) in the ISO 8601 UTC form Claude Code writes to its transcripts"""
+    t = time.time() if t is None else t
+    return time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(t)) + f".{int(t % 1 * 1000):03d}Z"
+
+
+def parse_timestamp(value):
+    """Return the epoch seconds of an ISO 8601 timestamp such as '2025-06-01T12:00:00.000Z'"""
+    from datetime import datetime
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+
+def switch_history_file():
+    return get_config_dir() / "switch_history.jsonl"
+
+
+def load_switch_history(path=None):
+    """Return [(timestamp, profile)] of every recorded switch, oldest first"""
+    history = []
+    try:
+        with open(path or switch_history_file()) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                    history.append((entry['ts'], entry['profile']))
+                except (ValueError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return history
+
+
+def record_switch(profile, path=None):
+    """Append ``profile`` to the switch history unless it is already the latest entry"""
+    path = path or switch_history_file()
+    try:
+        history = load_switch_history(path)
+        if history and history[-1][1] == profile:
+            return
+        with open(path, 'a') as f:
+            f.write(json.dumps({'ts': utc_timestamp(), 'profile': profile}) + "\n")
+    except OSError:
+        # Analytics must never make an apply fail
+        pass
+
+
+# Token counters summed from each reply's ``usage`` block
+USAGE_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+
+TRANSCRIPT_TIMESTAMP = re.compile(rb'"timestamp":"([^"]+)"')
+
+# Replies before the first recorded switch (and outside bound projects)
+UNATTRIBUTED = 'unattributed'
+
+# A longer gap between a prompt and its reply is the session sitting idle, not latency
+MAX_REPLY_LATENCY_MS = 10 * 60 * 1000
+
+
+class UsageAnalyzer:
+    """Aggregate requests, token usage and latency per profile from Claude Code transcripts
+
+    Transcripts (~/.claude/projects/*/*.jsonl) are only ever appended to, so
+    each file's byte offset is kept in usage_index.json together with the
+    running totals, and a run reads only the lines written since the last one.
+    A reply counts for the profile bound to its working directory, else for
+    the profile most recently applied before it according to the switch
+    history. Totals outlive the transcripts, which Claude Code prunes.
+    """
+
+    def __init__(self, projects_dir=None, index_path=None, history_path=None, settings=None):
+        self.projects_dir = Path(projects_dir) if projects_dir else Path.home() / ".claude" / "projects"
+        self.index_path = Path(index_path) if index_path else get_config_dir() / "usage_index.json"
+        history = load_switch_history(history_path)
+        self.history_times = [ts for ts, _ in history]
+        self.history_profiles = [profile for _, profile in history]
+        self.projects = ProjectIndex((settings or {}).get('project_profiles'))
+        self.project_cache = {}
+        self.index = {'version': 1, 'files': {}, 'totals': {}}
+
+    def load(self):
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+            if index.get('version') == 1:
+                self.index = index
+        except (FileNotFoundError, ValueError):
+            pass
+        return self
+
+    def transcripts(self):
+        """Yield (path, size) of every transcript file"""
+        for directory, _, names in os.walk(self.projects_dir):
+            for name in names:
+                if name.endswith('.jsonl'):
+                    path = os.path.join(directory, name)
+                    try:
+                        yield path, os.stat(path).st_size
+                    except OSError:
+                        continue
+
+    @traced("usage.update")
+    def update(self):
+        """Read what was appended since the last run, save the index and return self"""
+        with FileLock(self.index_path):
+            self.load()
+            files = self.index['files']
+            seen = set()
+            for path, size in self.transcripts():
+                seen.add(path)
+                state = files.get(path)
+                if state is None or size < state['offset']:
+                    # New, or rewritten from scratch
+                    state = files[path] = {'offset': 0}
+                if size > state['offset']:
+                    self.read(path, state)
+            for path in set(files) - seen:
+                del files[path]
+            write_json_atomic(self.index_path, self.index)
+        return self
+
+    def read(self, path, state):
+        """Fold the complete lines after ``state['offset']`` into the totals"""
+        offset = state['offset']
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Still being written; read it next time
+                    break
+                offset += len(line)
+                if b'"usage"' in line:
+                    try:
+                        self.add_entry(json.loads(line), state)
+                    except (ValueError, TypeError, AttributeError):
+                        continue
+                elif b'"type":"user"' in line:
+                    # Only the prompt's time is needed, so skip parsing tool output
+                    match = TRANSCRIPT_TIMESTAMP.search(line)
+                    if match:
+                        state['prompt'] = match.group(1).decode('ascii', 'replace')
+        state['offset'] = offset
+
+    def add_entry(self, entry, state):
+        timestamp = entry.get('timestamp') or ''
+        if entry.get('type') == 'user':
+            state['prompt'] = timestamp
+            return
+        message = entry.get('message') or {}
+        usage = message.get('usage')
+        if entry.get('type') != 'assistant' or not usage or message.get('model') == '<synthetic>':
+            return
+        # A streamed reply is written once per content block, each with the same usage
+        reply = message.get('id') or entry.get('requestId')
+        if reply and reply == state.get('reply'):
+            return
+        state['reply'] = reply
+        bucket = self.index['totals'].setdefault(self.attribute(timestamp, entry.get('cwd')), {}).setdefault(
+            timestamp[:10], [0] * (len(USAGE_FIELDS) + 3))
+        bucket[0] += 1
+        for i, name in enumerate(USAGE_FIELDS, 1):
+            bucket[i] += int(usage.get(name) or 0)
+        prompt = state.pop('prompt', None)
+        if prompt and timestamp:
+            try:
+                latency = (parse_timestamp(timestamp) - parse_timestamp(prompt)) * 1000
+            except ValueError:
+                return
+            if 0 <= latency <= MAX_REPLY_LATENCY_MS:
+                bucket[-2] += round(latency)
+                bucket[-1] += 1
+
+    def attribute(self, timestamp, cwd):
+        """Return the profile a reply at ``timestamp`` in ``cwd`` was served by"""
+        if cwd and self.projects.roots:
+            if cwd not in self.project_cache:
+                self.project_cache[cwd] = self.projects.resolve(cwd)[0]
+            if self.project_cache[cwd]:
+                return self.project_cache[cwd]
+        import bisect
+        # ISO 8601 UTC timestamps sort as strings
+        i = bisect.bisect_right(self.history_times, timestamp)
+        return self.history_profiles[i - 1] if i else UNATTRIBUTED
+
+    def summary(self, days=None):
+        """Return per-profile totals, busiest first, optionally for the last ``days`` days only"""
+        since = utc_timestamp(time.time() - (days - 1) * 86400)[:10] if days else ''
+        rows = []
+        for profile, buckets in self.index['totals'].items():
+            total = [0] * (len(USAGE_FIELDS) + 3)
+            for day, bucket in buckets.items():
+                if day >= since:
+                    total = [a + b for a, b in zip(total, bucket)]
+            if not total[0]:
+                continue
+            row = {'profile': profile, 'requests': total[0]}
+            row.update(zip(USAGE_FIELDS, total[1:]))
+            row['latency_ms_mean'] = round(total[-2] / total[-1]) if total[-1] else None
+            rows.append(row)
+        return sorted(rows, key=lambda row: -row['requests'])
+
+
+def format_usage(rows):
+    """Return usage summary rows as display lines"""
+    lines = [f"{'profile':<22} {'requests':>9} {'input':>12} {'output':>12} {'cache read':>13} {'latency':>9}"]
+    for row in rows:
+        latency = "-" if row['latency_ms_mean'] is None else f"{row['latency_ms_mean'] / 1000:.1f} s"
+        lines.append(f"{row['profile']:<22} {row['requests']:>9,} {row['input_tokens']:>12,} "
+                     f"{row['output_tokens']:>12,} {row['cache_read_input_tokens']:>13,} {latency:>9}")
+    return lines
+
+
+def instance_file():
+    """Return the file where the resident instance publishes its address and token"""
+    return get_config_dir() / "instance.json"
+
+
+class SharedBackend(EnvironmentBackend):
+    """Lend a long-lived backend to short commands without letting them close it"""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+
+    def get(self, names=ENV_VARS):
+        return self.backend.get(names)
+
+    def set(self, values):
+        self.backend.set(values)
+
+    def change_notifier(self):
+        return self.backend.change_notifier()
+
+
+# Set by the resident instance so forwarded commands reuse its warm backend
+resident_backend = None
+
+
+class InstanceServer:
+    """Accept command lines forwarded by later launches over a local socket
+
+    A Unix socket in ~/.claude_ez_switch is used where the platform has them
+    and a loopback TCP port elsewhere; either way the address and a random
+    token go into instance.json, readable only by the user. Each request is
+    one JSON line, {"token": ..., "argv": [...], "command": ...}, answered
+    with one JSON line holding the dict ``handler`` returns. Requests with
+    the wrong token are dropped. Each connection is served on its own thread.
+    """
+
+    def __init__(self, handler, path=None):
+        self.handler = handler
+        self.path = Path(path) if path else instance_file()
+        self.token = os.urandom(16).hex()
+        self.address = None
+        self.sock = None
+        self.closed = False
+
+    def start(self):
+        """Start listening; returns False if another live instance already answers"""
+        import socket
+        if forward_to_instance(None, self.path) is not None:
+            return False
+        try:
+            if hasattr(socket, 'AF_UNIX'):
+                address = str(self.path.with_suffix('.sock'))
+                if os.path.exists(address):
+                    os.unlink(address)
+                self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                self.sock.bind(address)
+                self.address = address
+            else:
+                self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+                self.sock.bind(('127.0.0.1', 0))
+                self.address = list(self.sock.getsockname()[:2])
+            self.sock.listen(8)
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'address': self.address, 'token': self.token, 'pid': os.getpid()}, f)
+        except OSError:
+            if self.sock is not None:
+                self.sock.close()
+            return False
+        threading.Thread(target=self._accept, daemon=True).start()
+        return True
+
+    def _accept(self):
+        delay = 0.0
+        while not self.closed:
+            try:
+                conn, _ = self.sock.accept()
+            except OSError:
+                if self.closed or self.sock.fileno() == -1:
+                    return
+                # A lasting error, such as running out of file descriptors, must not spin a core
+                delay = min(max(delay * 2, 0.01), 1.0)
+                time.sleep(delay)
+                continue
+            delay = 0.0
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        try:
+            with conn:
+                conn.settimeout(10)
+                request = json.loads(conn.makefile('rb').readline(1 << 20) or b'{}')
+                if not hmac.compare_digest(str(request.get('token', '')), self.token):
+                    return
+                if request.get('argv') is None:
+                    response = {'handled': True}
+                else:
+                    conn.settimeout(None)
+                    response = self.handler(request)
+                conn.sendall(json.dumps(response).encode('utf-8') + b'\n')
+        except (OSError, ValueError):
+            pass
+
+    def close(self):
+        """Stop accepting connections and withdraw the published address"""
+        import socket
+        if self.sock is None or self.closed:
+            return
+        self.closed = True
+        try:
+            # Wakes the thread blocked in accept()
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+        try:
+            with open(self.path, 'r') as f:
+                published = json.load(f)
+            if published.get('token') == self.token:
+                self.path.unlink()
+            if isinstance(self.address, str):
+                os.unlink(self.address)
+        except (OSError, ValueError):
+            pass
+
+
+def forward_to_instance(request, path=None):
+    """Send ``request`` to the resident instance and return its response, or None if none is running
+
+    A None request only checks that an instance answers.
+    """
+    import socket
+    try:
+        with open(path or instance_file(), 'r') as f:
+            published = json.load(f)
+        address = published['address']
+        if isinstance(address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(tuple(address))
+        with sock:
+            message = dict(request or {}, token=published['token'])
+            sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+            line = sock.makefile('rb').readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+_forward_lock = threading.Lock()
+
+
+def run_forwarded(argv):
+    """Run a forwarded command line in this process and capture its output and exit code
+
+    Only the quick SERVED_COMMANDS are run, without global flags; anything
+    else, including a command line that does not parse or asks for help, is
+    answered as not handled, so the caller runs it in its own process. The
+    output goes to buffers handed to the command, never through sys.stdout,
+    which the window and its worker threads share.
+    """
+    import io
+    if not isinstance(argv, list) or not all(isinstance(arg, str) for arg in argv):
+        return {'handled': False}
+    try:
+        args = build_parser(ForwardedArgumentParser).parse_args(argv)
+    except ProfileError:
+        return {'handled': False}
+    if (args.command not in SERVED_COMMANDS or args.command in (None, 'gui')
+            or args.backend or args.trace or args.print_profile):
+        return {'handled': False}
+    args.out, args.err = io.StringIO(), io.StringIO()
+    with _forward_lock:
+        try:
+            with TRACER.span(f"cli.{args.command}"):
+                code = run_cli(args)
+        except Exception as e:
+            print(f"Error: {e}", file=args.err)
+            code = 1
+    return {'handled': True, 'code': code, 'stdout': args.out.getvalue(), 'stderr': args.err.getvalue()}
+
+
 class ClaudeConfigSwitcher:
-    def __init__(self, root):
+    @traced("gui.init")
+    def __init__(self, root, executor=None):
+        import_tk()
         self.root = root
         self.root.title("Claude Code EZ Switch")
         self.root.geometry("600x760")
         self.root.resizable(False, False)
+        self.root.protocol("WM_DELETE_WINDOW", self.close_application)
         
         # Path for storing API keys persistently
-        self.config_dir = Path.home() / ".claude_ez_switch"
-        self.config_dir.mkdir(exist_ok=True)
+        self.config_dir = get_config_dir()
         self.config_file = self.config_dir / "config.json"
+        self.config_store = ConfigStore(self.config_file, owned=FORM_SETTINGS)
+        self.saved_settings = {}
+        self.health_monitor = None
+        self.status_watcher = None
+        self.instance_server = None
+        # Every blocking read or write runs here; pass an unstarted executor to drive it from tests
+        if executor is None:
+            executor = TaskExecutor()
+            executor.start()
+        self.executor = executor
+        # Vaulted keys decrypted or written this session: name -> plaintext
+        self.vault_values = {}
+        self.reveal_pending = False
+        self.vault = key_vault()
+        self.vault.prompt = self.ask_vault_passphrase
+        self.status_cache_file = self.config_dir / "status_cache.json"
+        self.startup_timer = StartupTimer(PROCESS_START)
+        
+        # Where the variables live (registry, PowerShell, Claude Code settings.json or in-memory)
+        try:
+            self.env_backend = select_backend(settings=self.config_store.load())
+        except (EnvironmentStoreError, ValueError):
+            self.env_backend = select_backend()
         
         # Configure style
         style = ttk.Style()
@@ -52,12 +3987,22 @@ class ClaudeConfigSwitcher:
         
         self.create_widgets()
         self.load_saved_api_keys()
-        self.load_existing_api_keys()
         # Update UI to match loaded configuration
         self.on_config_change()
-        self.on_claude_mode_change()
-        self.check_current_status()
         
+        # Show the last known status immediately; the real read happens in the background
+        self.status_snapshot = self.load_status_snapshot()
+        if self.status_snapshot:
+            self.status_label.configure(text=self.status_snapshot['text'] + "\n(unverified)",
+                                        fg=self.fg_color)
+        self.root.after_idle(lambda: self.startup_timer.mark("time-to-first-paint"))
+        self.root.after(50, self.drain_background)
+        self.reconcile_status()
+        
+        if (self.saved_settings.get('health_monitor') or {}).get('enabled'):
+            self.start_health_monitor()
+        
+    @traced("gui.create_widgets")
     def create_widgets(self):
         # Main container
         main_frame = tk.Frame(self.root, bg=self.bg_color, padx=30, pady=20)
@@ -90,6 +4035,11 @@ class ClaudeConfigSwitcher:
                                      font=('Segoe UI', 9), anchor=tk.W, justify=tk.LEFT)
         self.status_label.pack(anchor=tk.W, padx=15, pady=(0, 10), fill=tk.X)
         
+        # Endpoint health line (shown only while the health monitor runs)
+        self.health_label = tk.Label(status_frame, text="", 
+                                     bg=self.entry_bg, fg="#888888",
+                                     font=('Segoe UI', 8), anchor=tk.W, justify=tk.LEFT)
+        
         # Loading indicator (hidden by default)
         self.loading_frame = tk.Frame(status_frame, bg=self.entry_bg)
         self.loading_label = tk.Label(self.loading_frame, text="⟳ Applying configuration...", 
@@ -106,40 +4056,29 @@ class ClaudeConfigSwitcher:
         config_label.pack(anchor=tk.W, pady=(0, 10))
         
         self.config_var = tk.StringVar(value="zai")
+        # The mode picked inside each option that has several, e.g. 'claude_mode' -> 'subscription'
+        self.mode_vars = {providers[0].mode_setting: tk.StringVar(value=providers[0].mode)
+                          for providers in PROVIDER_GROUPS.values() if providers[0].mode}
         
-        # Configuration radio buttons container
+        # Configuration radio buttons container; longer lists wrap into columns
         radio_container = tk.Frame(content_frame, bg=self.bg_color)
         radio_container.pack(fill=tk.X, pady=(0, 10))
-        
-        # Z.ai radio button
-        zai_radio = ttk.Radiobutton(radio_container, text="Z.ai", 
-                                   variable=self.config_var, value="zai",
-                                   command=self.on_config_change)
-        zai_radio.pack(anchor=tk.W, pady=(0, 5))
-        
-        # Claude radio button
-        claude_radio = ttk.Radiobutton(radio_container, text="Anthropic", 
-                                      variable=self.config_var, value="claude",
-                                      command=self.on_config_change)
-        claude_radio.pack(anchor=tk.W, pady=(0, 5))
-        
-        # Custom radio button
-        custom_radio = ttk.Radiobutton(radio_container, text="Custom", 
-                                      variable=self.config_var, value="custom",
-                                      command=self.on_config_change)
-        custom_radio.pack(anchor=tk.W, pady=(0, 5))
+        columns = 1 if len(PROVIDER_GROUPS) <= 3 else 2 if len(PROVIDER_GROUPS) <= 8 else 3
+        for index, (group, providers) in enumerate(PROVIDER_GROUPS.items()):
+            radio = ttk.Radiobutton(radio_container, text=providers[0].group_label,
+                                    variable=self.config_var, value=group,
+                                    command=self.on_config_change)
+            radio.grid(row=index // columns, column=index % columns, sticky=tk.W, padx=(0, 30), pady=(0, 5))
         
         # Dynamic configuration container (where different configs will be shown)
         self.dynamic_config_container = tk.Frame(content_frame, bg=self.bg_color)
         self.dynamic_config_container.pack(fill=tk.BOTH, expand=False)
         
-        # Create all configuration frames but don't pack them yet
-        self.create_zai_frame()
-        self.create_claude_frame()
-        self.create_custom_frame()
-        
-        # Show initial configuration
-        self.on_config_change()
+        # Each option's frame is built the first time it is shown
+        self.group_frames = {}
+        self.entries = {}
+        # Values of fields whose frame has not been built yet
+        self.field_values = {}
         
         # Show/Hide Password Checkbutton
         self.show_password_var = tk.BooleanVar()
@@ -179,20 +4118,44 @@ class ClaudeConfigSwitcher:
                                        bg=self.refresh_button_bg, fg=self.fg_color,
                                        font=('Segoe UI', 10, 'bold'), relief=tk.FLAT,
                                        cursor="hand2", bd=0, pady=12,
-                                       command=self.check_current_status)
+                                       command=self.refresh_status)
         self.refresh_button.grid(row=0, column=2, sticky="ew", padx=(5, 0), pady=(0, 8))
         
         # Bind hover effects
         self.refresh_button.bind('<Enter>', lambda e: self.refresh_button.configure(bg=self.refresh_button_hover))
         self.refresh_button.bind('<Leave>', lambda e: self.refresh_button.configure(bg=self.refresh_button_bg))
         
-        # Close Button (spans all columns)
+        # Benchmark Button (spans 2 columns)
+        self.benchmark_button = tk.Button(button_container, text="Benchmark Endpoints",
+                                          bg=self.close_button_bg, fg=self.fg_color,
+                                          font=('Segoe UI', 10), relief=tk.FLAT,
+                                          cursor="hand2", bd=0, pady=10,
+                                          command=self.benchmark_endpoints)
+        self.benchmark_button.grid(row=1, column=0, sticky="ew", padx=(0, 5))
+        
+        # Bind hover effects
+        self.benchmark_button.bind('<Enter>', lambda e: self.benchmark_button.configure(bg=self.close_button_hover))
+        self.benchmark_button.bind('<Leave>', lambda e: self.benchmark_button.configure(bg=self.close_button_bg))
+        
+        # Usage Button
+        self.usage_button = tk.Button(button_container, text="Usage",
+                                      bg=self.close_button_bg, fg=self.fg_color,
+                                      font=('Segoe UI', 10), relief=tk.FLAT,
+                                      cursor="hand2", bd=0, pady=10,
+                                      command=self.show_usage)
+        self.usage_button.grid(row=1, column=1, sticky="ew", padx=5)
+        
+        # Bind hover effects
+        self.usage_button.bind('<Enter>', lambda e: self.usage_button.configure(bg=self.close_button_hover))
+        self.usage_button.bind('<Leave>', lambda e: self.usage_button.configure(bg=self.close_button_bg))
+        
+        # Close Button
         self.close_button = tk.Button(button_container, text="Close Application", 
                                      bg=self.close_button_bg, fg=self.fg_color,
                                      font=('Segoe UI', 10), relief=tk.FLAT,
                                      cursor="hand2", bd=0, pady=10,
                                      command=self.close_application)
-        self.close_button.grid(row=1, column=0, columnspan=3, sticky="ew")
+        self.close_button.grid(row=1, column=2, sticky="ew", padx=(5, 0))
         
         # Bind hover effects
         self.close_button.bind('<Enter>', lambda e: self.close_button.configure(bg=self.close_button_hover))
@@ -215,137 +4178,111 @@ class ClaudeConfigSwitcher:
         github_link.pack()
         github_link.bind("<Button-1>", lambda e: self.open_github_link())
     
-    def create_zai_frame(self):
-        """Create Z.ai configuration frame"""
-        self.zai_frame = tk.LabelFrame(self.dynamic_config_container, text="", bg=self.entry_bg, 
-                                 fg=self.fg_color, relief=tk.FLAT, bd=2)
-        
-        zai_key_label = ttk.Label(self.zai_frame, text="Z.ai API Key:")
-        zai_key_label.pack(anchor=tk.W, padx=15, pady=(10, 2))
-        
-        self.zai_key_entry = tk.Entry(self.zai_frame, bg=self.entry_bg, fg=self.fg_color,
-                                      insertbackground=self.fg_color, relief=tk.FLAT,
-                                      font=('Segoe UI', 10), bd=0, show="*")
-        self.zai_key_entry.pack(fill=tk.X, padx=15, pady=(0, 2), ipady=8)
-        
-        # Add border to entry
-        entry_border = tk.Frame(self.zai_frame, bg=self.accent_color, height=2)
-        entry_border.pack(fill=tk.X, padx=15, pady=(0, 10))
-    
-    def create_claude_frame(self):
-        """Create Claude configuration frame"""
-        self.claude_frame = tk.LabelFrame(self.dynamic_config_container, text="", bg=self.entry_bg, 
-                                    fg=self.fg_color, relief=tk.FLAT, bd=2)
-        
-        self.claude_mode_var = tk.StringVar(value="subscription")
-        
-        subscription_radio = ttk.Radiobutton(self.claude_frame, text="Use Claude Subscription (Pro/Team/Enterprise)", 
-                                           variable=self.claude_mode_var, value="subscription",
-                                           command=self.on_claude_mode_change)
-        subscription_radio.pack(anchor=tk.W, padx=15, pady=(10, 5))
-        
-        api_radio = ttk.Radiobutton(self.claude_frame, text="Use Claude API Key", 
-                                   variable=self.claude_mode_var, value="api",
-                                   command=self.on_claude_mode_change)
-        api_radio.pack(anchor=tk.W, padx=15, pady=(0, 5))
-        
-        claude_key_label = ttk.Label(self.claude_frame, text="Claude API Key:")
-        claude_key_label.pack(anchor=tk.W, padx=15, pady=(5, 2))
-        
-        self.claude_key_entry = tk.Entry(self.claude_frame, bg=self.entry_bg, fg=self.fg_color,
-                                         insertbackground=self.fg_color, relief=tk.FLAT,
-                                         font=('Segoe UI', 10), bd=0, show="*", state=tk.DISABLED,
-                                         disabledbackground=self.entry_bg, disabledforeground="#888888")
-        self.claude_key_entry.pack(fill=tk.X, padx=15, pady=(0, 2), ipady=8)
-        
-        # Add border to entry
-        claude_entry_border = tk.Frame(self.claude_frame, bg=self.accent_color, height=2)
-        claude_entry_border.pack(fill=tk.X, padx=15, pady=(0, 10))
-    
-    def create_custom_frame(self):
-        """Create Custom configuration frame"""
-        self.custom_frame = tk.LabelFrame(self.dynamic_config_container, text="", bg=self.entry_bg, 
-                                    fg=self.fg_color, relief=tk.FLAT, bd=2)
-        
-        custom_url_label = ttk.Label(self.custom_frame, text="Custom Base URL:")
-        custom_url_label.pack(anchor=tk.W, padx=15, pady=(10, 2))
-        
-        self.custom_url_entry = tk.Entry(self.custom_frame, bg=self.entry_bg, fg=self.fg_color,
-                                         insertbackground=self.fg_color, relief=tk.FLAT,
-                                         font=('Segoe UI', 10), bd=0)
-        self.custom_url_entry.pack(fill=tk.X, padx=15, pady=(0, 2), ipady=8)
-        
-        # Add border to entry
-        custom_url_border = tk.Frame(self.custom_frame, bg=self.accent_color, height=2)
-        custom_url_border.pack(fill=tk.X, padx=15, pady=(0, 5))
-        
-        custom_key_label = ttk.Label(self.custom_frame, text="Custom API Key:")
-        custom_key_label.pack(anchor=tk.W, padx=15, pady=(5, 2))
-        
-        self.custom_key_entry = tk.Entry(self.custom_frame, bg=self.entry_bg, fg=self.fg_color,
-                                         insertbackground=self.fg_color, relief=tk.FLAT,
-                                         font=('Segoe UI', 10), bd=0, show="*")
-        self.custom_key_entry.pack(fill=tk.X, padx=15, pady=(0, 2), ipady=8)
-        
-        # Add border to entry
-        custom_key_border = tk.Frame(self.custom_frame, bg=self.accent_color, height=2)
-        custom_key_border.pack(fill=tk.X, padx=15, pady=(0, 10))
-        
-        # Bind events to save API keys when they change
-        self.zai_key_entry.bind('<KeyRelease>', lambda e: self.save_api_keys())
-        self.claude_key_entry.bind('<KeyRelease>', lambda e: self.save_api_keys())
-        self.custom_key_entry.bind('<KeyRelease>', lambda e: self.save_api_keys())
-        self.custom_url_entry.bind('<KeyRelease>', lambda e: self.save_api_keys())
-    
-    def load_existing_api_keys(self):
-        """Load existing API keys from environment variables and pre-fill them"""
-        try:
-            # Only check user-level environment variables via PowerShell (not current process)
-            result = subprocess.run(
-                ['powershell', '-Command',
-                 "[System.Environment]::GetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', 'User')"],
-                capture_output=True, text=True, timeout=5
-            )
-            user_auth_token = result.stdout.strip()
-            
-            result = subprocess.run(
-                ['powershell', '-Command',
-                 "[System.Environment]::GetEnvironmentVariable('ANTHROPIC_BASE_URL', 'User')"],
-                capture_output=True, text=True, timeout=5
-            )
-            user_base_url = result.stdout.strip()
+    @traced("gui.build_frame")
+    def build_group_frame(self, group):
+        """Create the frame for one configuration option: its mode choices, then its fields"""
+        frame = tk.LabelFrame(self.dynamic_config_container, text="", bg=self.entry_bg,
+                              fg=self.fg_color, relief=tk.FLAT, bd=2)
+        providers = PROVIDER_GROUPS[group]
+        
+        if providers[0].mode:
+            for index, provider in enumerate(providers):
+                mode_radio = ttk.Radiobutton(frame, text=provider.mode_label,
+                                             variable=self.mode_vars[provider.mode_setting],
+                                             value=provider.mode, command=self.on_mode_change)
+                mode_radio.pack(anchor=tk.W, padx=15, pady=(10 if index == 0 else 0, 5))
+        
+        fields = list({field.key: field for provider in providers for field in provider.fields}.values())
+        for index, field in enumerate(fields):
+            field_label = ttk.Label(frame, text=field.label)
+            field_label.pack(anchor=tk.W, padx=15, pady=(10 if index == 0 and not providers[0].mode else 5, 2))
             
-            # Only update fields if they're empty AND if the environment variables are explicitly set
-            # Don't pre-fill anything if using subscription (no environment variables)
+            entry = tk.Entry(frame, bg=self.entry_bg, fg=self.fg_color,
+                             insertbackground=self.fg_color, relief=tk.FLAT,
+                             font=('Segoe UI', 10), bd=0,
+                             show="*" if field.secret and not self.show_password_var.get() else "",
+                             disabledbackground=self.entry_bg, disabledforeground="#888888")
+            entry.pack(fill=tk.X, padx=15, pady=(0, 2), ipady=8)
+            entry.insert(0, self.field_values.pop(field.key, ''))
             
-            # Pre-fill z.ai key only if it's set and base_url explicitly points to z.ai
-            if user_auth_token and user_base_url and 'z.ai' in user_base_url:
-                if not self.zai_key_entry.get().strip():
-                    self.zai_key_entry.delete(0, tk.END)
-                    self.zai_key_entry.insert(0, user_auth_token)
+            # Add border to entry
+            entry_border = tk.Frame(frame, bg=self.accent_color, height=2)
+            entry_border.pack(fill=tk.X, padx=15, pady=(0, 10 if index == len(fields) - 1 else 5))
             
-            # Pre-fill custom configuration only if both auth token and base URL are set and it's not z.ai
-            elif user_auth_token and user_base_url and user_base_url.strip() and 'z.ai' not in user_base_url:
-                if not self.custom_url_entry.get().strip():
-                    self.custom_url_entry.delete(0, tk.END)
-                    self.custom_url_entry.insert(0, user_base_url)
-                
-                if not self.custom_key_entry.get().strip():
-                    self.custom_key_entry.delete(0, tk.END)
-                    self.custom_key_entry.insert(0, user_auth_token)
+            # Save API keys when they change
+            entry.bind('<KeyRelease>', lambda e: self.save_api_keys(defer=True))
+            if field.secret:
+                # Vaulted keys are encrypted when the field loses focus, not on every keystroke
+                entry.bind('<KeyRelease>', lambda e, key=field.key: self.mark_secret_edited(key), add='+')
+                entry.bind('<FocusOut>', lambda e: self.store_vault_secrets())
+            self.entries[field.key] = entry
+        
+        if group == PROVIDERS_BY_NAME[NAMED_PROFILE_TARGET].group:
+            picker_button = tk.Button(frame, text="Choose Team Profile...", bg=self.close_button_bg,
+                                      fg=self.fg_color, font=('Segoe UI', 9), relief=tk.FLAT,
+                                      cursor="hand2", bd=0, pady=4, padx=10,
+                                      command=self.show_named_profiles)
+            picker_button.pack(anchor=tk.W, padx=15, pady=(0, 10))
+        
+        self.group_frames[group] = frame
+        return frame
+    
+    def get_field(self, key):
+        """Return a form field's value, whether or not its frame has been built"""
+        entry = self.entries.get(key)
+        value = entry.get() if entry is not None else self.field_values.get(key, '')
+        return value.strip()
+    
+    def set_field(self, key, value):
+        """Set a form field's value, keeping it until its frame is built if need be"""
+        entry = self.entries.get(key)
+        if entry is None:
+            self.field_values[key] = value
+            return
+        state = entry.cget('state')
+        entry.configure(state=tk.NORMAL)
+        entry.delete(0, tk.END)
+        entry.insert(0, value)
+        entry.configure(state=state)
+    
+    def form_selection(self):
+        """Return the selected option and modes in config.json format"""
+        selection = {setting: var.get() for setting, var in self.mode_vars.items()}
+        selection['selected_config'] = self.config_var.get()
+        return selection
+    
+    def select_profile(self, profile):
+        """Show ``profile`` as selected in the form without applying it"""
+        provider = PROVIDERS_BY_NAME[profile]
+        self.config_var.set(provider.group)
+        if provider.mode:
+            self.mode_vars[provider.mode_setting].set(provider.mode)
+        self.on_config_change()
+    
+    @traced("gui.load_existing_api_keys")
+    def load_existing_api_keys(self, env=None):
+        """Load existing API keys from environment variables and pre-fill them"""
+        try:
+            # Only check user-level environment variables (not current process)
+            if env is None:
+                env = self.env_backend.get(ENV_VARS)
+            # The proxy's placeholder token is not a key worth keeping
+            if env['ANTHROPIC_AUTH_TOKEN'].strip().startswith(PROXY_TOKEN_PREFIX):
+                return
             
-            # Pre-fill Claude API key only if auth token is set but base URL is explicitly empty/null
-            elif user_auth_token and not user_base_url:
-                if not self.claude_key_entry.get().strip():
-                    self.claude_key_entry.configure(state=tk.NORMAL)
-                    self.claude_key_entry.delete(0, tk.END)
-                    self.claude_key_entry.insert(0, user_auth_token)
-                    self.claude_key_entry.configure(state=tk.DISABLED)
+            # Only fill empty fields of the profile the variables match; the subscription
+            # sets no variables, so nothing is pre-filled for it
+            provider = PROVIDERS_BY_NAME[detect_profile(env)]
+            for name, key in provider.templates():
+                value = (env.get(name) or '').strip()
+                if value and not self.get_field(key):
+                    self.set_field(key, value)
                 
         except Exception as e:
             # Silently fail if we can't load keys
             pass
     
+    @traced("gui.load_saved_api_keys")
     def load_saved_api_keys(self):
         """Load API keys from the persistent storage file"""
         try:
@@ -353,90 +4290,138 @@ class ClaudeConfigSwitcher:
             
             # Check if new config file exists
             if self.config_file.exists():
-                with open(self.config_file, 'r') as f:
-                    saved_keys = json.load(f)
+                saved_keys = self.config_store.load()
             else:
                 # Check if old config file exists and migrate it
                 old_config_file = Path.home() / ".claude_code_ez_switch_config.json"
                 if old_config_file.exists():
                     with open(old_config_file, 'r') as f:
                         saved_keys = json.load(f)
-                    # Save to new location
-                    with open(self.config_file, 'w') as f:
-                        json.dump(saved_keys, f, indent=2)
+                    # Save to new location, settings the form does not own included
+                    ConfigStore(self.config_file).save(saved_keys)
                     # Remove old file
                     old_config_file.unlink()
             
-            # Load z.ai key
-            if 'zai_key' in saved_keys:
-                self.zai_key_entry.delete(0, tk.END)
-                self.zai_key_entry.insert(0, saved_keys['zai_key'])
-            
-            # Load Claude key
-            if 'claude_key' in saved_keys:
-                self.claude_key_entry.configure(state=tk.NORMAL)
-                self.claude_key_entry.delete(0, tk.END)
-                self.claude_key_entry.insert(0, saved_keys['claude_key'])
-                self.claude_key_entry.configure(state=tk.DISABLED)
-            
-            # Load custom config
-            if 'custom_url' in saved_keys:
-                self.custom_url_entry.delete(0, tk.END)
-                self.custom_url_entry.insert(0, saved_keys['custom_url'])
+            # Keep settings the form does not edit so saving does not drop them
+            self.saved_settings = saved_keys
             
-            if 'custom_key' in saved_keys:
-                self.custom_key_entry.delete(0, tk.END)
-                self.custom_key_entry.insert(0, saved_keys['custom_key'])
+            # Load the fields, the mode of each option and the selected option
+            for key in FORM_FIELDS:
+                if key in saved_keys:
+                    self.set_field(key, saved_keys[key])
             
-            # Load Claude mode
-            if 'claude_mode' in saved_keys:
-                self.claude_mode_var.set(saved_keys['claude_mode'])
-                self.on_claude_mode_change()
+            for setting, var in self.mode_vars.items():
+                if setting in saved_keys:
+                    var.set(saved_keys[setting])
             
-            # Load selected config
-            if 'selected_config' in saved_keys:
+            if saved_keys.get('selected_config') in PROVIDER_GROUPS:
                 self.config_var.set(saved_keys['selected_config'])
         except Exception as e:
             # Silently fail if we can't load saved keys
             pass
     
-    def save_api_keys(self):
-        """Save current API keys to persistent storage"""
+    def collect_settings(self):
+        """Return the current form values in config.json format"""
+        saved_keys = {key: value for key, value in self.saved_settings.items()
+                      if key not in FORM_SETTINGS}
+        
+        # Save every non-empty field, including those of options never shown
+        for key in FORM_FIELDS:
+            value = self.get_field(key)
+            if value:
+                saved_keys[key] = value
+        
+        # Save the mode of each option and the selected option
+        saved_keys.update(self.form_selection())
+        return saved_keys
+    
+    @traced("gui.save_api_keys")
+    def save_api_keys(self, defer=False):
+        """Save current API keys to persistent storage (debounced when ``defer`` is set)"""
         try:
-            saved_keys = {}
-            
-            # Save z.ai key if not empty
-            zai_key = self.zai_key_entry.get().strip()
-            if zai_key:
-                saved_keys['zai_key'] = zai_key
-            
-            # Save Claude key if not empty
-            claude_key = self.claude_key_entry.get().strip()
-            if claude_key:
-                saved_keys['claude_key'] = claude_key
-            
-            # Save custom config if not empty
-            custom_url = self.custom_url_entry.get().strip()
-            if custom_url:
-                saved_keys['custom_url'] = custom_url
-            
-            custom_key = self.custom_key_entry.get().strip()
-            if custom_key:
-                saved_keys['custom_key'] = custom_key
+            if self.config_store.saved is not None:
+                # Pick up settings that command-line commands wrote since the last save
+                self.saved_settings = self.config_store.saved
+            saved_keys = self.collect_settings()
+            self.saved_settings = saved_keys
+            if saved_keys.get('vault'):
+                # Keys never reach config.json; they are encrypted into the vault instead
+                saved_keys = {key: value for key, value in saved_keys.items() if key not in SECRET_FIELDS}
+                if not defer:
+                    self.root.after(0, self.store_vault_secrets)
             
-            # Save Claude mode
-            saved_keys['claude_mode'] = self.claude_mode_var.get()
-            
-            # Save selected config
-            saved_keys['selected_config'] = self.config_var.get()
-            
-            # Write to file
-            with open(self.config_file, 'w') as f:
-                json.dump(saved_keys, f, indent=2)
+            # Write to file; keystrokes are coalesced and unchanged content is skipped
+            if defer:
+                self.config_store.save_later(saved_keys)
+            else:
+                self.config_store.save(saved_keys)
         except Exception as e:
             # Silently fail if we can't save keys
             pass
     
+    def ask_vault_passphrase(self):
+        """Ask for the vault passphrase; only the UI thread can ask, other threads get None"""
+        if threading.current_thread() is not threading.main_thread():
+            return None
+        from tkinter import simpledialog
+        return simpledialog.askstring("Key Vault", "Enter the passphrase for your saved API keys:",
+                                      show='*', parent=self.root)
+    
+    def reveal_selected_key(self):
+        """Decrypt the selected profile's key into its field the first time that profile is shown"""
+        self.reveal_pending = False
+        name = PROFILE_SECRETS.get(selected_profile(self.form_selection()))
+        if not self.saved_settings.get('vault') or name is None or name in self.vault_values:
+            return
+        try:
+            value = self.vault.get(name) or ''
+        except VaultLockedError:
+            return
+        except VaultError as e:
+            messagebox.showerror("Key Vault", str(e))
+            return
+        self.vault_values[name] = value
+        if value:
+            self.set_field(name, value)
+    
+    def schedule_reveal(self):
+        if self.saved_settings.get('vault') and not self.reveal_pending:
+            self.reveal_pending = True
+            self.root.after_idle(self.reveal_selected_key)
+    
+    def mark_secret_edited(self, name):
+        """Note that a key was typed, so it reaches the vault even though the old one was never revealed"""
+        if self.saved_settings.get('vault'):
+            self.vault_values.setdefault(name, None)
+    
+    def store_vault_secrets(self):
+        """Encrypt revealed or typed keys whose fields changed (runs on the UI thread)
+
+        The passphrase is asked for if the vault is locked. Keys never reach
+        config.json while the vault is on, so a key that cannot be stored is
+        reported rather than dropped; it stays in the form and the next
+        attempt tries again. Returns False if a key could not be stored.
+        """
+        if not self.saved_settings.get('vault'):
+            return True
+        for name in SECRET_FIELDS:
+            # Fields that were never revealed may hold stale values and must not overwrite records
+            if name not in self.vault_values:
+                continue
+            value = self.get_field(name)
+            # An unrevealed field left empty is not a request to delete the stored key
+            if value == self.vault_values[name] or (self.vault_values[name] is None and not value):
+                continue
+            try:
+                self.vault.put(name, value)
+            except VaultError as e:
+                profile = next(profile for profile, key in PROFILE_SECRETS.items() if key == name)
+                messagebox.showerror("Key Vault", f"The {PROFILES[profile]} API key was not saved: {e}.\n\n"
+                                     "It stays in the form and is saved once the vault is unlocked.")
+                return False
+            self.vault_values[name] = value
+        return True
+    
     def open_github_link(self):
         """Open the GitHub repository link"""
         import webbrowser
@@ -445,46 +4430,64 @@ class ClaudeConfigSwitcher:
     def on_config_change(self):
         """Handle configuration radio button change - switch visible frame"""
         # Hide all frames first
-        self.zai_frame.pack_forget()
-        self.custom_frame.pack_forget()
-        self.claude_frame.pack_forget()
-        
-        # Show the selected frame
-        if self.config_var.get() == "zai":
-            self.zai_frame.pack(fill=tk.X, pady=(0, 10))
-        elif self.config_var.get() == "custom":
-            self.custom_frame.pack(fill=tk.X, pady=(0, 10))
-        elif self.config_var.get() == "claude":
-            self.claude_frame.pack(fill=tk.X, pady=(0, 10))
-    
-    def on_claude_mode_change(self):
-        """Handle Claude mode radio button change"""
-        if self.claude_mode_var.get() == "api":
-            self.claude_key_entry.configure(state=tk.NORMAL)
-        else:
-            self.claude_key_entry.configure(state=tk.DISABLED)
+        for frame in self.group_frames.values():
+            frame.pack_forget()
+        
+        # Show the selected frame, building it on first use
+        group = self.config_var.get()
+        if group in PROVIDER_GROUPS:
+            frame = self.group_frames.get(group) or self.build_group_frame(group)
+            frame.pack(fill=tk.X, pady=(0, 10))
+        self.on_mode_change()
+    
+    def on_mode_change(self):
+        """Enable only the fields the selected mode uses"""
+        active = selected_profile(self.form_selection())
+        for provider in PROVIDER_GROUPS.get(self.config_var.get(), ()):
+            for field in provider.fields:
+                entry = self.entries.get(field.key)
+                if entry is not None:
+                    entry.configure(state=tk.NORMAL if provider.name == active else tk.DISABLED)
+        self.schedule_reveal()
     
     def toggle_password_visibility(self):
         """Toggle password visibility in entry fields"""
-        if self.show_password_var.get():
-            self.zai_key_entry.configure(show="")
-            self.custom_key_entry.configure(show="")
-            self.claude_key_entry.configure(show="")
-        else:
-            self.zai_key_entry.configure(show="*")
-            self.custom_key_entry.configure(show="*")
-            self.claude_key_entry.configure(show="*")
+        show = "" if self.show_password_var.get() else "*"
+        for key in SECRET_FIELDS:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.configure(show=show)
     
     def close_application(self):
         """Properly close the application"""
+        try:
+            self.config_store.flush()
+            stored = self.store_vault_secrets()
+        except Exception:
+            stored = True
+        if not stored and not messagebox.askyesno(
+                "Key Vault", "An API key you entered is not saved because the vault is locked.\n\n"
+                             "Close anyway and discard it?"):
+            return
+        if self.health_monitor is not None:
+            self.health_monitor.stop()
+        if self.status_watcher is not None:
+            self.status_watcher.stop()
+        self.executor.stop()
+        if self.instance_server is not None:
+            self.instance_server.close()
+        self.env_backend.close()
         self.root.destroy()
     
-    def show_loading(self):
+    def show_loading(self, text="⟳ Applying configuration..."):
         """Show loading spinner"""
+        self.loading_label.configure(text=text)
         self.loading_frame.pack(fill=tk.X, pady=(5, 5))
         self.progress_bar.start(10)
         self.apply_button.configure(state=tk.DISABLED)
         self.refresh_button.configure(state=tk.DISABLED)
+        self.benchmark_button.configure(state=tk.DISABLED)
+        self.usage_button.configure(state=tk.DISABLED)
         self.root.update_idletasks()
     
     def hide_loading(self):
@@ -493,205 +4496,1013 @@ class ClaudeConfigSwitcher:
         self.loading_frame.pack_forget()
         self.apply_button.configure(state=tk.NORMAL)
         self.refresh_button.configure(state=tk.NORMAL)
+        self.benchmark_button.configure(state=tk.NORMAL)
+        self.usage_button.configure(state=tk.NORMAL)
         self.root.update_idletasks()
     
     def check_current_status(self):
-        """Check current environment variable configuration"""
+        """Re-read the environment variables in the background and show the result"""
+        self.executor.submit('status', self.env_backend.get, self.status_names(),
+                             on_done=self.show_verified_status, on_error=self.show_status_error,
+                             policy='coalesce')
+    
+    def show_status_error(self, error):
+        """Show that the variables could not be read (runs on the UI thread)"""
+        self.status_label.configure(
+            text=f"⚠ Could not determine current status\nError: {error}",
+            fg=self.error_color
+        )
+    
+    def status_names(self):
+        """Return the variables the status frame shows, falling back to the token and URL"""
         try:
-            # Only check persistent user environment variables (not current process)
-            result = subprocess.run(
-                ['powershell', '-Command',
-                 "[System.Environment]::GetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', 'User')"],
-                capture_output=True, text=True, timeout=5
-            )
-            user_auth_token = result.stdout.strip()
-            
-            result = subprocess.run(
-                ['powershell', '-Command',
-                 "[System.Environment]::GetEnvironmentVariable('ANTHROPIC_BASE_URL', 'User')"],
-                capture_output=True, text=True, timeout=5
-            )
-            user_base_url = result.stdout.strip()
-            
-            if user_base_url and 'z.ai' in user_base_url:
-                status_text = "✓ Currently using z.ai API\n"
-                if user_auth_token:
-                    masked_key = user_auth_token[:8] + "..." + user_auth_token[-4:] if len(user_auth_token) > 12 else "***"
-                    status_text += f"API Key: {masked_key}"
-                self.status_label.configure(text=status_text, fg=self.success_color)
-            elif user_base_url and user_auth_token:
-                status_text = f"✓ Currently using Custom Base URL\n"
-                status_text += f"Base URL: {user_base_url}\n"
-                masked_key = user_auth_token[:8] + "..." + user_auth_token[-4:] if len(user_auth_token) > 12 else "***"
-                status_text += f"API Key: {masked_key}"
-                self.status_label.configure(text=status_text, fg=self.success_color)
-            elif user_auth_token and not user_base_url:
-                masked_key = user_auth_token[:8] + "..." + user_auth_token[-4:] if len(user_auth_token) > 12 else "***"
-                status_text = f"✓ Currently using Claude API Key\nAPI Key: {masked_key}"
-                self.status_label.configure(text=status_text, fg=self.success_color)
-            else:
-                status_text = "✓ Currently using Claude Subscription\n(No environment variables set)"
-                self.status_label.configure(text=status_text, fg=self.success_color)
-                
-        except Exception as e:
-            self.status_label.configure(
-                text=f"⚠ Could not determine current status\nError: {str(e)}",
-                fg=self.error_color
-            )
+            return status_variables(self.saved_settings)
+        except ProfileError:
+            return ENV_VARS
+    
+    def show_verified_status(self, env):
+        """Render status from a real environment read and refresh the cached snapshot"""
+        fingerprint = status_fingerprint(env)
+        status_text = describe_status(env)
+        self.status_label.configure(text=status_text, fg=self.success_color)
+        if fingerprint != self.status_snapshot.get('fingerprint'):
+            self.status_snapshot = {'fingerprint': fingerprint, 'text': status_text, 'saved_at': time.time()}
+            try:
+                with open(self.status_cache_file, 'w') as f:
+                    json.dump(self.status_snapshot, f, indent=2)
+            except OSError:
+                pass
     
-    def run_powershell_command(self, command):
-        """Run a PowerShell command and return success status"""
+    def load_status_snapshot(self):
+        """Load the last known status snapshot, or an empty dict"""
         try:
-            result = subprocess.run(
-                ['powershell', '-Command', command],
-                capture_output=True, text=True, timeout=30, check=True
-            )
-            return True, result.stdout
-        except subprocess.CalledProcessError as e:
-            return False, f"Command failed: {e.stderr}"
-        except subprocess.TimeoutExpired:
-            return False, "Command timed out"
-        except Exception as e:
-            return False, str(e)
+            with open(self.status_cache_file, 'r') as f:
+                snapshot = json.load(f)
+            if snapshot.get('fingerprint') and snapshot.get('text'):
+                return snapshot
+        except (OSError, ValueError):
+            pass
+        return {}
+    
+    def reconcile_status(self):
+        """Read the real environment off the UI thread and reconcile the cached status"""
+        self.executor.submit('reconcile', self.env_backend.get, self.status_names(),
+                             on_done=self.on_status_reconciled, on_error=self.show_status_error)
+    
+    def on_status_reconciled(self, env):
+        """Apply the first verified environment read (runs on the UI thread)"""
+        self.load_existing_api_keys(env)
+        self.show_verified_status(env)
+        self.startup_timer.mark("time-to-verified-status")
+        
+        enabled, interval = status_watch_options(self.saved_settings)
+        if enabled and self.status_watcher is None:
+            self.status_watcher = StatusWatcher(self.env_backend, interval, names=self.status_names())
+            self.status_watcher.seed(env)
+            self.status_watcher.start()
     
-    def apply_configuration_thread(self):
-        """Thread worker for applying configuration"""
+    def drain_background(self):
+        """Deliver finished jobs and watcher updates, then look again shortly (runs on the UI thread)"""
         try:
-            if self.config_var.get() == "zai":
-                # Apply z.ai configuration
-                zai_key = self.zai_key_entry.get().strip()
-                
-                if not zai_key:
-                    self.root.after(0, lambda: messagebox.showerror("Error", "Please enter your z.ai API key"))
-                    self.root.after(0, self.hide_loading)
-                    return
-                
-                # Set z.ai environment variables
-                commands = [
-                    f"[System.Environment]::SetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', '{zai_key}', 'User')",
-                    f"[System.Environment]::SetEnvironmentVariable('ANTHROPIC_BASE_URL', 'https://api.z.ai/api/anthropic', 'User')"
-                ]
-                
-                for cmd in commands:
-                    success, output = self.run_powershell_command(cmd)
-                    if not success:
-                        self.root.after(0, lambda msg=output: messagebox.showerror("Error", f"Failed to set environment variable:\n{msg}"))
-                        self.root.after(0, self.hide_loading)
-                        return
-                
-                self.root.after(0, lambda: messagebox.showinfo("Success",
-                                   "Z.ai configuration applied successfully!\n\n"
-                                   "IMPORTANT: You must close and reopen VS Code or any application using Claude Code for changes to take effect.\n"
-                                   "If using terminal only, close and reopen the terminal."))
-            
-            elif self.config_var.get() == "custom":
-                # Apply custom configuration
-                custom_url = self.custom_url_entry.get().strip()
-                custom_key = self.custom_key_entry.get().strip()
-                
-                if not custom_url:
-                    self.root.after(0, lambda: messagebox.showerror("Error", "Please enter a custom base URL"))
-                    self.root.after(0, self.hide_loading)
-                    return
-                
-                if not custom_key:
-                    self.root.after(0, lambda: messagebox.showerror("Error", "Please enter your custom API key"))
-                    self.root.after(0, self.hide_loading)
-                    return
-                
-                # Set custom environment variables
-                commands = [
-                    f"[System.Environment]::SetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', '{custom_key}', 'User')",
-                    f"[System.Environment]::SetEnvironmentVariable('ANTHROPIC_BASE_URL', '{custom_url}', 'User')"
-                ]
-                
-                for cmd in commands:
-                    success, output = self.run_powershell_command(cmd)
-                    if not success:
-                        self.root.after(0, lambda msg=output: messagebox.showerror("Error", f"Failed to set environment variable:\n{msg}"))
-                        self.root.after(0, self.hide_loading)
-                        return
-                
-                self.root.after(0, lambda: messagebox.showinfo("Success",
-                                   "Custom configuration applied successfully!\n\n"
-                                   "IMPORTANT: You must close and reopen VS Code or any application using Claude Code for changes to take effect.\n"
-                                   "If using terminal only, close and reopen the terminal."))
-                
+            self.executor.drain()
+            self.drain_status_updates()
+        finally:
+            # Keep delivering even if a status update could not be shown
+            self.root.after(50, self.drain_background)
+    
+    def drain_status_updates(self):
+        """Show whatever the status watcher queued since the last call (runs on the UI thread)"""
+        if self.status_watcher is None:
+            return
+        while True:
+            try:
+                update = self.status_watcher.updates.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(update, Exception):
+                self.show_status_error(update)
             else:
-                # Apply Claude configuration
-                if self.claude_mode_var.get() == "subscription":
-                    # Remove all environment variables to use subscription
-                    commands = [
-                        "[System.Environment]::SetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', $null, 'User')",
-                        "[System.Environment]::SetEnvironmentVariable('ANTHROPIC_BASE_URL', $null, 'User')"
-                    ]
-                    
-                    for cmd in commands:
-                        success, output = self.run_powershell_command(cmd)
-                        if not success:
-                            self.root.after(0, lambda msg=output: messagebox.showerror("Error", f"Failed to remove environment variable:\n{msg}"))
-                            self.root.after(0, self.hide_loading)
-                            return
-                    
-                    self.root.after(0, lambda: messagebox.showinfo("Success",
-                                       "Claude Subscription configuration applied successfully!\n\n"
-                                       "IMPORTANT: You must close and reopen VS Code or any application using Claude Code for changes to take effect.\n"
-                                       "If using terminal only, close and reopen the terminal."))
-                    
-                else:
-                    # Use Claude API key
-                    claude_key = self.claude_key_entry.get().strip()
-                    
-                    if not claude_key:
-                        self.root.after(0, lambda: messagebox.showerror("Error", "Please enter your Claude API key"))
-                        self.root.after(0, self.hide_loading)
-                        return
-                    
-                    # Set Claude API key, remove base URL
-                    commands = [
-                        f"[System.Environment]::SetEnvironmentVariable('ANTHROPIC_AUTH_TOKEN', '{claude_key}', 'User')",
-                        "[System.Environment]::SetEnvironmentVariable('ANTHROPIC_BASE_URL', $null, 'User')"
-                    ]
-                    
-                    for cmd in commands:
-                        success, output = self.run_powershell_command(cmd)
-                        if not success:
-                            self.root.after(0, lambda msg=output: messagebox.showerror("Error", f"Failed to set environment variable:\n{msg}"))
-                            self.root.after(0, self.hide_loading)
-                            return
-                    
-                    self.root.after(0, lambda: messagebox.showinfo("Success",
-                                       "Claude API Key configuration applied successfully!\n\n"
-                                       "IMPORTANT: You must close and reopen VS Code or any application using Claude Code for changes to take effect.\n"
-                                       "If using terminal only, close and reopen the terminal."))
-            
-            # Save API keys after applying configuration
-            self.save_api_keys()
-            
-            # Refresh status after applying
-            self.root.after(0, self.hide_loading)
-            self.root.after(500, self.check_current_status)
-            
-        except Exception as e:
-            self.root.after(0, lambda msg=str(e): messagebox.showerror("Error", f"An unexpected error occurred:\n{msg}"))
-            self.root.after(0, self.hide_loading)
+                self.show_verified_status(update)
+    
+    def refresh_status(self):
+        """Re-read the status off the UI thread, through the watcher when it is running"""
+        if self.status_watcher is not None:
+            self.status_watcher.poke(force=True)
+        else:
+            self.check_current_status()
+    
+    @traced("gui.apply")
+    def apply_job(self, settings):
+        """Apply the profile selected in ``settings`` (runs on the executor); returns (profile, port, report)"""
+        profile = selected_profile(settings)
+        preflight_check(profile, settings)
+        port = proxy_port(settings)
+        if port:
+            report = switch_proxy_upstream(self.env_backend, port, profile, settings)
+        else:
+            report = apply_profile(self.env_backend, profile, settings)
+        return profile, port, report
+    
+    def on_applied(self, result):
+        """Save the form and report a finished apply (runs on the UI thread)"""
+        profile, port, report = result
+        if port:
+            message = (f"The EZ Switch proxy now forwards to {PROFILES[profile]}.\n\n"
+                       "Running Claude Code sessions use it from their next request.")
+            if report.changed:
+                # The environment was just pointed at the proxy; that needs one last restart
+                message += f"\n\n{RESTART_NOTICE}"
+        elif report.failures:
+            message = (f"{PROFILES[profile]} was applied to only some targets.\n\n"
+                       f"{report.describe()}\n\n{RESTART_NOTICE}")
+        elif report.changed:
+            message = (f"{PROFILES[profile]} configuration applied successfully!\n\n"
+                       f"{report.describe()}\n\n{RESTART_NOTICE}")
+        else:
+            message = f"{PROFILES[profile]} configuration is already active.\n\n{report.describe()}"
+        
+        # Save API keys after applying configuration, then refresh the status behind the dialog
+        self.save_api_keys()
+        self.hide_loading()
+        self.refresh_status()
+        if report.failures:
+            messagebox.showwarning("Partially Applied", message)
+        else:
+            messagebox.showinfo("Success", message)
+    
+    def on_apply_error(self, error):
+        """Report a failed apply (runs on the UI thread)"""
+        self.hide_loading()
+        if isinstance(error, (ProfileError, HTTPError)):
+            messagebox.showerror("Error", str(error))
+        elif isinstance(error, EnvironmentStoreError):
+            messagebox.showerror("Error", f"Failed to set environment variable:\n{error}")
+        else:
+            messagebox.showerror("Error", f"An unexpected error occurred:\n{error}")
     
     def apply_configuration(self):
-        """Apply the selected configuration using threading to prevent UI freeze"""
-        # Show loading indicator
+        """Apply the selected configuration on the executor so the UI never waits on the backend"""
+        # Read the form here; the job must not touch the widgets
+        settings = self.collect_settings()
         self.show_loading()
+        # A newer apply supersedes one that has not reported yet
+        self.executor.submit('apply', self.apply_job, settings,
+                             on_done=self.on_applied, on_error=self.on_apply_error, policy='latest')
+    
+    def start_instance_server(self):
+        """Take over commands from later launches so they reuse this process's warm state"""
+        global resident_backend
+        server = InstanceServer(self.handle_forwarded)
+        if server.start():
+            self.instance_server = server
+            resident_backend = self.env_backend
+    
+    def handle_forwarded(self, request):
+        """Run a command forwarded by a later launch (runs on the server thread)"""
+        if request.get('command') in (None, 'gui'):
+            self.executor.call_soon(self.show_window)
+            return {'handled': True, 'code': 0}
+        # The command reads config.json, so pending edits from the form go first
+        self.config_store.flush()
+        response = run_forwarded(request['argv'])
+        if request.get('command') == 'apply':
+            self.executor.call_soon(self.on_forwarded_apply)
+        return response
+    
+    def show_window(self):
+        """Bring the window to the front (runs on the UI thread)"""
+        self.root.deiconify()
+        self.root.lift()
+        self.root.focus_force()
+    
+    def on_forwarded_apply(self):
+        """Show the profile another launch just applied (runs on the UI thread)"""
+        self.load_saved_api_keys()
+        self.on_config_change()
+        self.refresh_status()
+    
+    def start_health_monitor(self):
+        """Probe the active endpoint in the background and show its health in the status frame"""
+        self.health_label.configure(text="Endpoint health: checking...")
+        self.health_label.pack(anchor=tk.W, padx=15, pady=(0, 10), fill=tk.X, before=self.loading_frame)
+        self.health_monitor = HealthMonitor(
+            self.env_backend, lambda: self.saved_settings,
+            on_update=lambda status: self.executor.call_soon(self.show_health, status),
+            on_failover=lambda profile, report: self.executor.call_soon(self.on_failover, profile, report),
+            **health_monitor_options(self.saved_settings)
+        )
+        self.health_monitor.start()
+    
+    def show_health(self, status):
+        """Render a health monitor update (runs on the UI thread)"""
+        self.health_label.configure(text=format_health(status),
+                                    fg="#888888" if status['healthy'] else self.error_color)
+    
+    def on_failover(self, profile, report):
+        """Reflect an automatic failover in the UI (runs on the UI thread)"""
+        self.select_profile(profile)
+        self.save_api_keys()
+        self.refresh_status()
+        messagebox.showwarning("Failover",
+                               f"The active endpoint was unhealthy, so EZ Switch switched to {PROFILES[profile]}.\n\n"
+                               f"{report.describe()}\n\n{RESTART_NOTICE}")
+    
+    def benchmark_endpoints(self):
+        """Benchmark all saved profiles in the background and offer to apply the fastest"""
+        settings = self.collect_settings()
+        self.show_loading("⟳ Benchmarking endpoints...")
+        self.executor.submit('benchmark', run_benchmark, settings,
+                             on_done=lambda summaries: self.show_benchmark_results(settings, summaries),
+                             on_error=lambda e: self.show_job_error("Benchmark", e), policy='coalesce')
+    
+    def show_job_error(self, title, error):
+        """Report a failed background job (runs on the UI thread)"""
+        self.hide_loading()
+        messagebox.showerror(title, str(error))
+    
+    def show_benchmark_results(self, settings, summaries):
+        """Show benchmark results and apply the fastest profile if the user agrees"""
+        self.hide_loading()
+        text = "\n\n".join(format_benchmark(summaries))
+        fastest = fastest_profile(summaries)
+        if fastest is None:
+            messagebox.showinfo("Benchmark", text)
+            return
+        if messagebox.askyesno("Benchmark", f"{text}\n\nApply the fastest profile ({PROFILES[fastest]})?"):
+            self.select_profile(fastest)
+            self.apply_configuration()
+    
+    def show_usage(self):
+        """Read new transcript lines in the background, then show usage per profile"""
+        settings = self.collect_settings()
+        self.show_loading("⟳ Reading Claude Code transcripts...")
+        self.executor.submit('usage', lambda settings: UsageAnalyzer(settings=settings).update().summary(), settings,
+                             on_done=self.show_usage_results,
+                             on_error=lambda e: self.show_job_error("Usage", e), policy='coalesce')
+    
+    def show_usage_results(self, rows):
+        """Show usage per profile in its own window"""
+        self.hide_loading()
+        if not rows:
+            messagebox.showinfo("Usage", "No Claude Code usage found.")
+            return
+        window = tk.Toplevel(self.root)
+        window.title("Usage by Provider")
+        window.configure(bg=self.bg_color)
         
-        # Start configuration application in a separate thread
-        config_thread = threading.Thread(target=self.apply_configuration_thread, daemon=True)
-        config_thread.start()
+        columns = ('profile', 'requests', 'input_tokens', 'output_tokens', 'cache_read_input_tokens', 'latency')
+        headings = ("Profile", "Requests", "Input", "Output", "Cache Read", "Avg Latency")
+        tree = ttk.Treeview(window, columns=columns, show='headings', height=min(len(rows), 12))
+        for column, heading in zip(columns, headings):
+            tree.heading(column, text=heading)
+            tree.column(column, width=140 if column == 'profile' else 95,
+                        anchor=tk.W if column == 'profile' else tk.E)
+        for row in rows:
+            latency = "-" if row['latency_ms_mean'] is None else f"{row['latency_ms_mean'] / 1000:.1f} s"
+            tree.insert('', tk.END, values=(PROFILES.get(row['profile'], row['profile']), f"{row['requests']:,}",
+                                            f"{row['input_tokens']:,}", f"{row['output_tokens']:,}",
+                                            f"{row['cache_read_input_tokens']:,}", latency))
+        tree.pack(fill=tk.BOTH, expand=True, padx=15, pady=15)
+    
+    def show_named_profiles(self):
+        """Read the team profiles in the background, then open the picker"""
+        self.executor.submit('profiles', lambda: [(p.get('name', ''), p.get('url', '')) for p in ProfileStore()],
+                             on_done=self.show_named_profile_picker,
+                             on_error=lambda e: self.show_job_error("Team Profiles", e), policy='coalesce')
+    
+    def show_named_profile_picker(self, profiles):
+        """List team profiles with a filter box; picking one fills in the Custom fields
+    
+        Only the first PICKER_ROWS matches are put in the list and filtering
+        waits for a pause in typing, so thousands of profiles stay responsive.
+        """
+        window = tk.Toplevel(self.root)
+        window.title("Team Profiles")
+        window.configure(bg=self.bg_color)
+    
+        filter_entry = tk.Entry(window, bg=self.entry_bg, fg=self.fg_color, insertbackground=self.fg_color,
+                                relief=tk.FLAT, font=('Segoe UI', 10), bd=0)
+        filter_entry.pack(fill=tk.X, padx=15, pady=(15, 5), ipady=6)
+        count_label = ttk.Label(window, text="")
+        count_label.pack(anchor=tk.W, padx=15)
+        listbox = tk.Listbox(window, bg=self.entry_bg, fg=self.fg_color, relief=tk.FLAT, bd=0,
+                             font=('Segoe UI', 10), height=15, width=70, activestyle='none')
+        listbox.pack(fill=tk.BOTH, expand=True, padx=15, pady=5)
+    
+        # Lower-cased once, so each filter pass is a plain substring scan
+        haystacks = [f"{name}\n{url}".lower() for name, url in profiles]
+        shown = []
+        pending = []
+    
+        def render():
+            pending.clear()
+            text = filter_entry.get().strip().lower()
+            matches = [profile for profile, haystack in zip(profiles, haystacks) if text in haystack]
+            shown[:] = matches[:PICKER_ROWS]
+            listbox.delete(0, tk.END)
+            if shown:
+                listbox.insert(tk.END, *[f"{name}    {url}" for name, url in shown])
+            count = f"{len(matches):,} of {len(profiles):,} profiles"
+            if len(matches) > len(shown):
+                count += f"; the first {len(shown):,} are listed, type to narrow them down"
+            count_label.configure(text=count)
+    
+        def on_filter(event=None):
+            for after_id in pending:
+                window.after_cancel(after_id)
+            pending[:] = [window.after(150, render)]
+    
+        def use(event=None):
+            selection = listbox.curselection()
+            if not selection:
+                return
+            name = shown[selection[0]][0]
+            store = self.unlocked_profile_store()
+            if store is None:
+                return
+            window.destroy()
+            self.executor.submit('profiles', store.get, name, on_done=self.use_named_profile,
+                                 on_error=lambda e: self.show_job_error("Team Profiles", e))
+    
+        def import_file():
+            from tkinter import filedialog
+            path = filedialog.askopenfilename(parent=window, title="Import Team Profiles",
+                                              filetypes=[("Profiles", "*.jsonl *.csv"), ("All files", "*.*")])
+            store = self.unlocked_profile_store() if path else None
+            if store is not None:
+                window.destroy()
+                self.executor.submit('profiles', lambda: import_profiles(path, store=store),
+                                     on_done=self.on_profiles_imported,
+                                     on_error=lambda e: self.show_job_error("Team Profiles", e))
+    
+        filter_entry.bind('<KeyRelease>', on_filter)
+        listbox.bind('<Double-Button-1>', use)
+        listbox.bind('<Return>', use)
+        button_frame = tk.Frame(window, bg=self.bg_color)
+        button_frame.pack(fill=tk.X, padx=15, pady=(5, 15))
+        for text, command in (("Use Profile", use), ("Import...", import_file)):
+            button = tk.Button(button_frame, text=text, bg=self.close_button_bg, fg=self.fg_color,
+                               font=('Segoe UI', 10), relief=tk.FLAT, cursor="hand2", bd=0, pady=6, padx=12,
+                               command=command)
+            button.pack(side=tk.LEFT, padx=(0, 10))
+        render()
+        filter_entry.focus_set()
+    
+    def unlocked_profile_store(self):
+        """Return the team profile store, first asking for the vault passphrase if its keys are vaulted
+    
+        Background jobs cannot ask, so the vault is unlocked here on the UI
+        thread. Returns None if it stays locked.
+        """
+        store = profile_store(self.saved_settings)
+        if store.vault is not None:
+            try:
+                store.vault.session_keys()
+            except VaultError as e:
+                messagebox.showerror("Key Vault", str(e))
+                return None
+        return store
+    
+    def use_named_profile(self, profile):
+        """Fill in the Custom fields from a team profile and select it, without applying"""
+        if profile is None:
+            messagebox.showerror("Team Profiles", "That profile no longer exists.")
+            return
+        target = PROVIDERS_BY_NAME[NAMED_PROFILE_TARGET]
+        for field in target.fields:
+            self.set_field(field.key, profile['key'] if field.secret else profile['url'])
+            if field.secret:
+                # A freshly filled key is written to the vault even if the old one was never revealed
+                self.vault_values.setdefault(field.key, None)
+        self.select_profile(NAMED_PROFILE_TARGET)
+        self.save_api_keys(defer=True)
+    
+    def on_profiles_imported(self, report):
+        """Report an import and reopen the picker on the merged list"""
+        messagebox.showinfo("Team Profiles", report.describe())
+        self.show_named_profiles()
+
+
+def load_settings():
+    """Load config.json for command-line use"""
+    return ConfigStore(get_config_dir() / "config.json").load()
+
+
+def read_environment():
+    """Read the managed variables through a short-lived backend"""
+    settings = load_settings()
+    backend = select_backend(settings=settings)
+    try:
+        return backend.get(status_variables(settings))
+    finally:
+        backend.close()
+
+
+def cli_status(args):
+    """Print the current configuration"""
+    env = read_environment()
+    if args.json:
+        token = env['ANTHROPIC_AUTH_TOKEN']
+        print(json.dumps({
+            'profile': detect_profile(env),
+            'base_url': env['ANTHROPIC_BASE_URL'] or None,
+            'auth_token': mask_key(token) if token else None,
+            'variables': {name: value for name, value in env.items() if name not in ENV_VARS and value},
+        }, indent=2), file=args.out)
+    else:
+        print(describe_status(env), file=args.out)
+    return 0
+
+
+def cli_current(args):
+    """Print the name of the active profile"""
+    print(detect_profile(read_environment()), file=args.out)
+    return 0
+
+
+def cli_list(args):
+    """List profiles, marking the active one and those missing saved keys"""
+    settings = load_settings()
+    current = detect_profile(read_environment())
+    for name, label in PROFILES.items():
+        note = "" if profile_configured(name, settings) else " (not configured)"
+        marker = "*" if name == current else " "
+        print(f"{marker} {name:<20} {label}{note}", file=args.out)
+    return 0
+
+
+def cli_apply(args):
+    """Apply a saved profile"""
+    settings = load_settings()
+    validation = preflight_check(args.profile, settings, args.check)
+    if validation is not None:
+        print(validation.describe(), file=args.out)
+    backend = select_backend(settings=settings)
+    port = proxy_port(settings)
+    try:
+        if port:
+            report = switch_proxy_upstream(backend, port, args.profile, settings)
+        else:
+            report = apply_profile(backend, args.profile, settings)
+    finally:
+        backend.close()
+    ConfigStore(get_config_dir() / "config.json").save(profile_settings(args.profile, settings))
+    if port:
+        print(f"Proxy now forwards to {PROFILES[args.profile]}; running sessions switch immediately.",
+              file=args.out)
+        if report.changed:
+            print("Claude Code was pointed at the proxy; restart it once for that to take effect.", file=args.out)
+            print(report.describe(), file=args.out)
+        return 0
+    if report.failures:
+        print(f"{PROFILES[args.profile]} was applied to only some targets.", file=args.err)
+        print(report.describe(), file=args.out)
+        return 1
+    if report.changed:
+        print(f"{PROFILES[args.profile]} configuration applied successfully!", file=args.out)
+    print(report.describe(), file=args.out)
+    return 0
+
+
+def cli_run(args):
+    """Run a command with a profile's variables in its environment only; nothing is persisted"""
+    command = args.argv[1:] if args.argv[:1] == ['--'] else args.argv
+    if not command:
+        raise ProfileError("No command given; usage: ezswitch run PROFILE -- COMMAND [ARGS...]")
+    return run_session_command(command, profile_environment(args.profile, load_settings()))
+
+
+def cli_env(args):
+    """Print shell commands that put a profile's variables into the current session"""
+    resolver = ProjectResolver()
+    profile = args.profile or resolver.resolve()[0]
+    resolver.refresh()
+    values = profile_environment(profile, resolver.settings)
+    print("\n".join(shell_assignments(values, args.shell or ('powershell' if os.name == 'nt' else 'posix'))),
+          file=args.out)
+    return 0
+
+
+def cli_which(args):
+    """Print the profile that applies to a directory"""
+    profile, root = ProjectResolver().resolve(args.directory)
+    if args.json:
+        print(json.dumps({'profile': profile, 'project': root}, indent=2))
+    elif root:
+        print(f"{profile} (bound to {root})")
+    else:
+        print(f"{profile} (global)")
+    return 0
+
+
+def cli_bind(args):
+    """Bind a directory tree to a profile"""
+    directory = normalize_project_path(args.directory)
+    if not os.path.isdir(directory):
+        raise ProfileError(f"Not a directory: {directory}")
+    store = ConfigStore(get_config_dir() / "config.json")
+    settings = store.load()
+    if not args.map_only:
+        report = write_project_settings(directory, args.profile, settings)
+        print(report.describe())
+        if args.profile == 'claude-subscription':
+            print("Note: a globally set ANTHROPIC_AUTH_TOKEN still applies inside this project.")
+    mappings = dict(settings.get('project_profiles') or {})
+    mappings[directory] = args.profile
+    settings['project_profiles'] = mappings
+    store.save(settings)
+    print(f"{directory} now uses {PROFILES[args.profile]}")
+    return 0
+
+
+def cli_unbind(args):
+    """Remove a directory's profile binding"""
+    directory = normalize_project_path(args.directory)
+    store = ConfigStore(get_config_dir() / "config.json")
+    settings = store.load()
+    mappings = dict(settings.get('project_profiles') or {})
+    if mappings.pop(directory, None) is None:
+        raise ProfileError(f"No profile is bound to {directory}")
+    if not args.map_only:
+        clear_project_settings(directory, status_variables(settings))
+    if mappings:
+        settings['project_profiles'] = mappings
+    else:
+        settings.pop('project_profiles', None)
+    store.save(settings)
+    print(f"{directory} now follows the global profile")
+    return 0
+
+
+def cli_projects(args):
+    """List directory bindings"""
+    mappings = load_settings().get('project_profiles') or {}
+    for directory, profile in sorted(mappings.items()):
+        print(f"{profile:<20} {directory}")
+    return 0
 
-def main():
-    """Main entry point"""
-    # Check if running on Windows
-    if sys.platform != 'win32':
-        print("This application is designed for Windows only.")
-        sys.exit(1)
+
+def cli_vault(args):
+    """Set up, inspect or remove the encrypted key vault"""
+    store = ConfigStore(get_config_dir() / "config.json")
+    settings = store.load()
+    vault = key_vault()
+    if args.action == 'status':
+        if not settings.get('vault'):
+            print("Key vault: off (keys are stored in config.json)")
+        else:
+            print(f"Key vault: on ({vault.directory})")
+            for name in vault.names():
+                print(f"  {name}")
+        return 0
+    if args.action == 'enable':
+        if settings.get('vault'):
+            raise VaultError("The key vault is already enabled")
+        vault.create(read_passphrase(confirm=True))
+        for name in PROFILE_SECRETS.values():
+            vault.put(name, settings.pop(name, None))
+        ProfileStore().seal(vault)
+        settings['vault'] = True
+        store.save(settings)
+        print(f"Moved saved keys and team profile keys into {vault.directory}")
+        return 0
+    # disable
+    if not settings.get('vault'):
+        raise VaultError("The key vault is not enabled")
+    for name in vault.names():
+        if name != ProfileStore.VAULT_RECORD:
+            settings[name] = vault.get(name)
+    ProfileStore(vault=vault).seal(None)
+    settings.pop('vault', None)
+    store.save(settings)
+    vault.destroy()
+    print("Keys moved back into config.json")
+    return 0
+
+
+def cli_profiles(args):
+    """List, import, export, use or remove named team profiles"""
+    store = profile_store(load_settings())
+    if args.action == 'list':
+        text = (args.name or '').lower()
+        for profile in store:
+            if text in profile.get('name', '').lower() or text in profile.get('url', '').lower():
+                key = mask_key(profile['key']) if profile.get('key') else "(vaulted)"
+                print(f"{profile['name']}  {profile['url']}  {key}")
+        return 0
+    if not args.name:
+        raise ProfileError(f"profiles {args.action} needs a {'file' if args.action in ('import', 'export') else 'name'}")
+    if args.action == 'import':
+        try:
+            report = import_profiles(args.name, args.format, args.replace, store)
+        except OSError as e:
+            raise ProfileError(f"Cannot read {args.name}: {e}")
+        print(report.describe(), file=sys.stderr if args.name == '-' else sys.stdout)
+        return 1 if report.invalid else 0
+    if args.action == 'export':
+        print(f"Warning: the export holds every team API key in plain text; keep {args.name} private "
+              "and delete it when done", file=sys.stderr)
+        try:
+            count = export_profiles(args.name, args.format, store)
+        except OSError as e:
+            raise ProfileError(f"Cannot write {args.name}: {e}")
+        if args.name != '-':
+            print(f"Exported {count} profiles to {args.name}")
+        return 0
+    if args.action == 'remove':
+        if not store.remove(args.name):
+            raise ProfileError(f"No team profile named {args.name!r}")
+        print(f"Removed {args.name}")
+        return 0
+    # use: fill in the Custom profile from the named one, then apply it
+    profile = store.get(args.name)
+    if profile is None:
+        raise ProfileError(f"No team profile named {args.name!r}")
+    target = PROVIDERS_BY_NAME[NAMED_PROFILE_TARGET]
+    url_field = next(field.key for field in target.fields if not field.secret)
+    key_field = PROFILE_SECRETS[NAMED_PROFILE_TARGET]
+    config = ConfigStore(get_config_dir() / "config.json")
+    settings = dict(config.load(), **{url_field: profile['url'], key_field: profile['key']})
+    preflight_check(NAMED_PROFILE_TARGET, settings, args.check)
+    if settings.get('vault'):
+        key_vault().put(key_field, settings.pop(key_field))
+    config.save(settings)
+    args.profile, args.check = NAMED_PROFILE_TARGET, False
+    return cli_apply(args)
+
+
+def cli_vars(args):
+    """Show or change the extra variables a profile sets"""
+    store = ConfigStore(get_config_dir() / "config.json")
+    settings = store.load()
+    maps = variable_maps(settings)
+    if args.profile is None:
+        for name, preset in VARIABLE_PRESETS.items():
+            print(f"preset {name}: " + ", ".join(f"{var}={coerce_variable(var, value)}" for var, value in preset.items()))
+        for profile, config in maps.items():
+            print(f"{profile}: " + (", ".join(f"{name}={value}" for name, value in config.items()) or "(none)"))
+        return 0
+    if args.profile not in PROFILES:
+        raise ProfileError(f"Unknown profile: {args.profile}")
+    config = dict(maps.get(args.profile) or {})
+    if args.clear:
+        config = {}
+    if args.preset is not None:
+        if args.preset == 'none':
+            config.pop('preset', None)
+        elif args.preset not in VARIABLE_PRESETS:
+            raise ProfileError(f"Unknown preset {args.preset!r}; choose from {', '.join(VARIABLE_PRESETS)}")
+        else:
+            config['preset'] = args.preset
+    for name in args.unset:
+        # A name saved before it was refused can still be removed
+        if name not in config:
+            check_variable_name(name)
+        config.pop(name, None)
+    for assignment in args.assignments:
+        name, sep, value = assignment.partition('=')
+        if not sep:
+            raise ProfileError(f"Expected NAME=VALUE, not {assignment!r}")
+        # Validate now so config.json never holds a value apply would reject
+        coerce_variable(name, value)
+        config[name] = value
+    
+    changed = config != (maps.get(args.profile) or {})
+    if changed:
+        updated = dict(maps)
+        if config:
+            updated[args.profile] = config
+        else:
+            updated.pop(args.profile, None)
+        # Names no profile sets any more are remembered, so switching still clears them
+        settings['managed_variables'] = list(managed_variables(settings))
+        settings['profile_variables'] = updated
+        profile_variables(args.profile, settings)
+        store.save(settings)
+    
+    values = profile_variables(args.profile, settings)
+    for name, value in values.items():
+        print(f"{name}={value if value is not None else '(unset)'}")
+    if not values:
+        preset = PROVIDERS_BY_NAME[args.profile].preset
+        print(f"No extra variables; try --preset {preset}" if preset else "No extra variables")
+    if changed:
+        print(f"Apply {args.profile} again for the change to take effect.")
+    return 0
+
+
+def cli_serve(args):
+    """Run a windowless resident instance until interrupted"""
+    global resident_backend
+    settings = load_settings()
+    if settings.get('vault'):
+        # Unlock once up front; forwarded commands cannot ask for the passphrase
+        key_vault().session_keys()
+    key_vault().prompt = None
+    resident_backend = select_backend(settings=settings)
+    
+    def handle(request):
+        if request.get('command') in (None, 'gui'):
+            # No window to show; the caller opens its own
+            return {'handled': False}
+        return run_forwarded(request['argv'])
+    
+    server = InstanceServer(handle)
+    if not server.start():
+        resident_backend.close()
+        raise EnvironmentStoreError("Another EZ Switch instance is already running")
+    print(f"EZ Switch instance listening on {server.address}", flush=True)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        resident_backend.close()
+    return 0
+
+
+def cli_proxy(args):
+    """Serve the local switching proxy, or turn proxy mode off"""
+    store = ConfigStore(get_config_dir() / "config.json")
+    settings = store.load()
+    backend = select_backend(settings=settings)
+    try:
+        if args.off:
+            settings.pop('proxy', None)
+            report = apply_profile(backend, selected_profile(settings), settings)
+            store.save(settings)
+            print("Proxy mode disabled.")
+            print(report.describe())
+            return 0
+        port = args.port or (settings.get('proxy') or {}).get('port') or DEFAULT_PROXY_PORT
+        settings['proxy'] = {'enabled': True, 'port': port}
+        store.save(settings)
+        run_proxy(settings, port, backend)
+    finally:
+        backend.close()
+    return 0
+
+
+def cli_bench(args):
+    """Benchmark every saved profile and optionally apply the fastest"""
+    settings = load_settings()
+    summaries = run_benchmark(settings, runs=args.runs, model=args.model,
+                              max_tokens=args.max_tokens, timeout=args.timeout)
+    if args.json:
+        print(json.dumps(summaries, indent=2))
+    else:
+        print("\n".join(format_benchmark(summaries)))
+    
+    if args.apply_fastest:
+        profile = fastest_profile(summaries)
+        if profile is None:
+            print("Error: no profile completed the benchmark without errors", file=sys.stderr)
+            return 1
+        args.profile = profile
+        return cli_apply(args)
+    return 0 if any(not s['errors'] for s in summaries) else 1
+
+
+def cli_check(args):
+    """Validate saved keys against their endpoints, all profiles at once"""
+    for profile in args.profiles:
+        if profile not in PROFILES:
+            raise ProfileError(f"Unknown profile: {profile}")
+    settings = load_settings()
+    _, ttl, timeout = preflight_options(settings)
+    validations = validate_profiles(args.profiles or list(PROFILES), settings, ValidationCache(ttl=ttl),
+                                    timeout, refresh=args.refresh)
+    if not validations:
+        print("Error: no saved profiles with an API key to check", file=sys.stderr)
+        return 1
+    if args.json:
+        print(json.dumps([{'profile': v.profile, 'base_url': v.base_url, 'status': v.status, 'detail': v.detail,
+                           'cached': v.cached} for v in validations], indent=2))
+    else:
+        print("\n".join(validation.describe() for validation in validations))
+    return 0 if all(validation.ok for validation in validations) else 1
+
+
+def cli_usage(args):
+    """Print requests, token usage and reply latency per profile from Claude Code's transcripts"""
+    analyzer = UsageAnalyzer(settings=load_settings())
+    if args.rebuild and analyzer.index_path.exists():
+        analyzer.index_path.unlink()
+    rows = analyzer.update().summary(args.days)
+    if args.json:
+        print(json.dumps(rows, indent=2))
+    elif not rows:
+        print("No Claude Code usage found.")
+    else:
+        print("\n".join(format_usage(rows)))
+    return 0
+
+
+def cli_monitor(args):
+    """Watch the active endpoint's health until interrupted"""
+    settings = load_settings()
+    options = health_monitor_options(settings)
+    if args.interval is not None:
+        options['interval'] = args.interval
+    if args.threshold is not None:
+        options['failure_threshold'] = args.threshold
+    if args.failover is not None:
+        options['failover_profiles'] = [p for p in args.failover.split(',') if p]
+        unknown = [p for p in options['failover_profiles'] if p not in PROFILES]
+        if unknown:
+            raise ProfileError(f"Unknown profile: {', '.join(unknown)}")
+    
+    def on_update(status):
+        print(f"[{time.strftime('%H:%M:%S')}] {status['base_url']}: {format_health(status)}", flush=True)
+    
+    def on_failover(profile, report):
+        print(f"Failed over to {PROFILES[profile]}\n{report.describe()}", flush=True)
+    
+    backend = select_backend(settings=settings)
+    monitor = HealthMonitor(backend, load_settings, on_update=on_update, on_failover=on_failover, **options)
+    try:
+        if args.once:
+            import asyncio
+            client = AsyncHTTPClient(timeout=monitor.timeout)
+            try:
+                status = asyncio.run(monitor.check(client))
+            finally:
+                client.close()
+            return 0 if status['healthy'] and not status['consecutive_failures'] else 1
+        monitor.start()
+        while monitor.thread is not None and monitor.thread.is_alive():
+            monitor.thread.join(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        monitor.stop()
+        backend.close()
+    return 0
+
+
+class ForwardedArgumentParser(argparse.ArgumentParser):
+    """Parser for command lines forwarded to the resident instance: nothing is printed and nothing exits
+
+    Errors and requests for help raise ProfileError instead, and the caller's
+    own process parses the command line again to report them.
+    """
+
+    def error(self, message):
+        raise ProfileError(message)
+
+    def exit(self, status=0, message=None):
+        raise ProfileError(message or f"exit {status}")
+
+    def print_help(self, file=None):
+        raise ProfileError("help requested")
+
+
+def build_parser(parser_class=argparse.ArgumentParser):
+    parser = parser_class(prog="ezswitch",
+                          description="Switch Claude Code between z.ai, Anthropic and custom endpoints")
+    parser.add_argument('--backend', choices=BACKENDS,
+                        help="where to store the variables (default: registry on Windows, "
+                             "Claude Code settings.json elsewhere)")
+    parser.add_argument('--trace', action='store_true',
+                        help="append per-phase timings to ~/.claude_ez_switch/trace.jsonl (or set EZSWITCH_TRACE=1)")
+    parser.add_argument('--profile', action='store_true', dest='print_profile',
+                        help="trace and print a per-phase timing breakdown on exit")
+    parser.add_argument('--no-instance', action='store_true',
+                        help="run in this process even if an EZ Switch instance is already running")
+    subparsers = parser.add_subparsers(dest='command')
+    
+    status_parser = subparsers.add_parser('status', help="show the current configuration")
+    status_parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    status_parser.set_defaults(func=cli_status)
+    
+    current_parser = subparsers.add_parser('current', help="print the active profile name")
+    current_parser.set_defaults(func=cli_current)
+    
+    list_parser = subparsers.add_parser('list', help="list available profiles")
+    list_parser.set_defaults(func=cli_list)
+    
+    apply_parser = subparsers.add_parser('apply', help="apply a saved profile")
+    apply_parser.add_argument('profile', choices=list(PROFILES))
+    apply_parser.add_argument('--check', action='store_true', default=None,
+                              help="validate the key against the endpoint first (config.json: preflight.enabled)")
+    apply_parser.add_argument('--no-check', dest='check', action='store_false', help="skip the pre-flight check")
+    apply_parser.set_defaults(func=cli_apply)
+    
+    check_parser = subparsers.add_parser('check', help="validate saved keys against their endpoints")
+    check_parser.add_argument('profiles', nargs='*', metavar='profile',
+                              help="profiles to check (default: every profile with a saved key)")
+    check_parser.add_argument('--refresh', action='store_true', help="ignore cached results")
+    check_parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    check_parser.set_defaults(func=cli_check)
+    
+    run_parser = subparsers.add_parser('run', help="run a command with a profile, without switching globally")
+    run_parser.add_argument('profile', choices=list(PROFILES))
+    # Not 'command': that dest already holds the subcommand's name
+    run_parser.add_argument('argv', nargs=argparse.REMAINDER, metavar='command', help="-- COMMAND [ARGS...]")
+    run_parser.set_defaults(func=cli_run)
+    
+    env_parser = subparsers.add_parser('env', help="print commands that set a profile in this shell session")
+    env_parser.add_argument('profile', nargs='?', choices=list(PROFILES),
+                            help="profile to print (default: the one for the current directory)")
+    env_parser.add_argument('--shell', choices=SHELLS,
+                            help="syntax to print (default: powershell on Windows, posix elsewhere)")
+    env_parser.set_defaults(func=cli_env)
+    
+    which_parser = subparsers.add_parser('which', help="print the profile that applies to a directory")
+    which_parser.add_argument('directory', nargs='?', default='.', help="directory to resolve (default: cwd)")
+    which_parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    which_parser.set_defaults(func=cli_which)
+    
+    bind_parser = subparsers.add_parser('bind', help="use a profile for every session under a directory")
+    bind_parser.add_argument('profile', choices=list(PROFILES))
+    bind_parser.add_argument('directory', nargs='?', default='.', help="project root (default: cwd)")
+    bind_parser.add_argument('--map-only', action='store_true',
+                             help="only record the mapping; do not write .claude/settings.local.json")
+    bind_parser.set_defaults(func=cli_bind)
+    
+    unbind_parser = subparsers.add_parser('unbind', help="remove a directory's profile binding")
+    unbind_parser.add_argument('directory', nargs='?', default='.', help="project root (default: cwd)")
+    unbind_parser.add_argument('--map-only', action='store_true',
+                               help="keep the variables in .claude/settings.local.json")
+    unbind_parser.set_defaults(func=cli_unbind)
     
+    projects_parser = subparsers.add_parser('projects', help="list directory bindings")
+    projects_parser.set_defaults(func=cli_projects)
+    
+    profiles_parser = subparsers.add_parser('profiles', help="import, export and use named team profiles")
+    profiles_parser.add_argument('action', choices=('list', 'import', 'export', 'use', 'remove'))
+    profiles_parser.add_argument('name', nargs='?',
+                                 help="file for import/export ('-' for stdin/stdout), profile name, or list filter")
+    profiles_parser.add_argument('--format', choices=PROFILE_FORMATS, help="file format (default: by extension)")
+    profiles_parser.add_argument('--replace', action='store_true', help="import: drop profiles not in the file")
+    profiles_parser.add_argument('--check', action='store_true', default=None, help="use: validate the key first")
+    profiles_parser.add_argument('--no-check', dest='check', action='store_false', help="use: skip the pre-flight check")
+    profiles_parser.set_defaults(func=cli_profiles)
+    
+    vars_parser = subparsers.add_parser('vars', help="show or set a profile's extra variables (timeouts, models, ...)")
+    vars_parser.add_argument('profile', nargs='?', help="profile to show or change (default: list all)")
+    vars_parser.add_argument('--preset', help=f"start from a preset: {', '.join(VARIABLE_PRESETS)} or none")
+    vars_parser.add_argument('--set', dest='assignments', action='append', default=[], metavar='NAME=VALUE',
+                             help="set a variable, e.g. API_TIMEOUT_MS=3000000")
+    vars_parser.add_argument('--unset', action='append', default=[], metavar='NAME', help="remove a variable")
+    vars_parser.add_argument('--clear', action='store_true', help="remove every variable and the preset")
+    vars_parser.set_defaults(func=cli_vars)
+    
+    vault_parser = subparsers.add_parser('vault', help="encrypt saved API keys with a passphrase")
+    vault_parser.add_argument('action', choices=('status', 'enable', 'disable'))
+    vault_parser.set_defaults(func=cli_vault)
+
+    bench_parser = subparsers.add_parser('bench', help="measure latency and throughput of saved profiles")
+    bench_parser.add_argument('-n', '--runs', type=int, default=5, help="requests per profile (default: 5)")
+    bench_parser.add_argument('--model', default='claude-3-5-haiku-latest', help="model to request")
+    bench_parser.add_argument('--max-tokens', type=int, default=64, help="max_tokens per request")
+    bench_parser.add_argument('--timeout', type=float, default=30, help="per-request timeout in seconds")
+    bench_parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    bench_parser.add_argument('--apply-fastest', action='store_true',
+                              help="apply the profile with the lowest median time-to-first-byte")
+    bench_parser.set_defaults(func=cli_bench, check=None)
+    
+    usage_parser = subparsers.add_parser('usage', help="show token usage and latency per profile")
+    usage_parser.add_argument('--days', type=int, help="only count the last N days")
+    usage_parser.add_argument('--rebuild', action='store_true',
+                              help="forget the saved totals and re-read every transcript")
+    usage_parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    usage_parser.set_defaults(func=cli_usage)
+    
+    monitor_parser = subparsers.add_parser('monitor', help="watch the active endpoint's health")
+    monitor_parser.add_argument('--interval', type=float, help="seconds between probes")
+    monitor_parser.add_argument('--threshold', type=int, help="consecutive failures before failing over")
+    monitor_parser.add_argument('--failover', help="comma-separated profiles to fail over to, in priority order")
+    monitor_parser.add_argument('--once', action='store_true', help="probe once and exit 1 if unhealthy")
+    monitor_parser.set_defaults(func=cli_monitor)
+    
+    proxy_parser = subparsers.add_parser('proxy', help="run the local switching proxy")
+    proxy_parser.add_argument('--port', type=int, help=f"port to listen on (default: {DEFAULT_PROXY_PORT})")
+    proxy_parser.add_argument('--off', action='store_true',
+                              help="disable proxy mode and apply the selected profile directly")
+    proxy_parser.set_defaults(func=cli_proxy)
+    
+    serve_parser = subparsers.add_parser('serve', help="stay resident so other commands run in this warm process")
+    serve_parser.set_defaults(func=cli_serve)
+    
+    subparsers.add_parser('gui', help="open the window (default)")
+    return parser
+
+
+def run_cli(args):
+    """Run a subcommand, turning expected failures into exit code 1"""
+    try:
+        return args.func(args)
+    except (ProfileError, EnvironmentStoreError, HTTPError) as e:
+        print(f"Error: {e}", file=args.err)
+        return 1
+
+
+def run_gui():
+    """Start the Tk application"""
+    import_tk()
     root = tk.Tk()
     app = ClaudeConfigSwitcher(root)
     
@@ -703,7 +5514,39 @@ def main():
     y = (root.winfo_screenheight() // 2) - (height // 2)
     root.geometry(f'{width}x{height}+{x}+{y}')
     
+    # Become the instance later launches forward to, once the window is up
+    if app.saved_settings.get('single_instance', True):
+        root.after_idle(app.start_instance_server)
     root.mainloop()
 
+
+def main(argv=None, forward=True, out=None, err=None):
+    """Main entry point; ``out`` and ``err`` take the output of the forwarded commands"""
+    args = build_parser().parse_args(argv)
+    args.out = out or sys.stdout
+    args.err = err or sys.stderr
+    if (forward and args.command in FORWARDED_COMMANDS and not args.no_instance
+            and not (args.backend or args.trace or args.print_profile)):
+        response = forward_to_instance({'argv': sys.argv[1:] if argv is None else list(argv),
+                                        'command': args.command})
+        if response is not None and response.get('handled'):
+            sys.stdout.write(response.get('stdout', ''))
+            sys.stderr.write(response.get('stderr', ''))
+            return response.get('code', 0)
+    if args.backend:
+        os.environ['EZSWITCH_BACKEND'] = args.backend
+    if args.trace or args.print_profile or os.environ.get('EZSWITCH_TRACE'):
+        TRACER.enable()
+    try:
+        if args.command in (None, 'gui'):
+            run_gui()
+            return 0
+        with TRACER.span(f"cli.{args.command}"):
+            return run_cli(args)
+    finally:
+        if args.print_profile:
+            print(TRACER.format_summary(), file=sys.stderr)
+
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
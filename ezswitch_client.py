@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""Quick launcher: hand the command to a running EZ Switch instance, or run ezswitch.py
+
+Usage: python ezswitch_client.py [the same arguments as ezswitch.py]
+
+Only what forwarding needs is imported, so a shortcut such as
+``ezswitch_client.py apply zai`` returns as soon as the open window (or
+``ezswitch.py serve``) has switched. ``ezswitch_client.py run zai -- claude``
+asks the instance for the profile's values and starts the command itself.
+Without a running instance the command runs in this process exactly as
+ezswitch.py would run it.
+"""
+import json
+import os
+import sys
+
+from ezswitch_common import FORWARDED_COMMANDS, run_session_command
+
+
+def forward(argv):
+    """Send ``argv`` to the resident instance; returns its response, or None if none answered"""
+    import socket
+    path = os.path.join(os.path.expanduser('~'), '.claude_ez_switch', 'instance.json')
+    try:
+        with open(path) as f:
+            published = json.load(f)
+        address = published['address']
+        if isinstance(address, str):
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+        else:
+            sock = socket.create_connection(tuple(address))
+        with sock:
+            request = {'token': published['token'], 'argv': argv, 'command': argv[0] if argv else None}
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            line = sock.makefile('rb').readline()
+        return json.loads(line) if line else None
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def run_session(argv):
+    """Start ``run PROFILE -- COMMAND`` with values from the instance; None if it cannot be served"""
+    profile, command = argv[1], argv[2:]
+    if command[:1] == ['--']:
+        command = command[1:]
+    if profile.startswith('-') or not command:
+        return None
+    response = forward(['env', profile, '--shell', 'json'])
+    if response is None or not response.get('handled') or response.get('code'):
+        # ezswitch.py reports the error
+        return None
+    return run_session_command(command, json.loads(response['stdout']))
+
+
+def main():
+    argv = sys.argv[1:]
+    if argv[:1] == ['run'] and len(argv) > 2:
+        code = run_session(argv)
+        if code is not None:
+            return code
+    # Global flags (--backend, --trace, ...) change how a command runs, so those stay local
+    if not argv or argv[0] in FORWARDED_COMMANDS:
+        response = forward(argv)
+        if response is not None and response.get('handled'):
+            sys.stdout.write(response.get('stdout', ''))
+            sys.stderr.write(response.get('stderr', ''))
+            return response.get('code', 0)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    import ezswitch
+    return ezswitch.main(argv, forward=False)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Code shared by ezswitch.py and the quick launcher ezswitch_client.py
+
+Only the standard library is used and nothing slow is imported at module
+level, so the launcher stays quick.
+"""
+import json
+import os
+import sys
+
+# Commands a later launch hands to the resident instance instead of running itself (None: no command)
+FORWARDED_COMMANDS = (None, 'gui', 'status', 'current', 'list', 'apply')
+# What the instance runs for others: those, plus the lookup ezswitch_client.py makes for ``run``
+SERVED_COMMANDS = FORWARDED_COMMANDS + ('env',)
+
+
+def session_environment(values, base=None):
+    """Return a copy of ``base`` (default: os.environ) with ``values`` set, or removed where None"""
+    env = dict(os.environ if base is None else base)
+    for name, value in values.items():
+        if value:
+            env[name] = value
+        else:
+            env.pop(name, None)
+    return env
+
+
+def claude_session_command(command, values):
+    """Return (command, settings_path), passing ``values`` as --settings when ``command`` starts Claude Code
+
+    Claude Code applies the env block of ~/.claude/settings.json over its own
+    environment, so once a profile has been applied there, only --settings
+    (which ranks above it) can override it for one session. The values go in
+    a temporary file readable only by the user, never on the command line,
+    where other users could read the key; the caller deletes
+    ``settings_path`` (None when no file was needed) once the command exits.
+    """
+    if os.path.splitext(os.path.basename(command[0]))[0].lower() != 'claude':
+        return command, None
+    try:
+        with open(os.path.join(os.path.expanduser('~'), '.claude', 'settings.json'), encoding='utf-8') as f:
+            env = json.load(f).get('env') or {}
+    except (OSError, ValueError, AttributeError):
+        return command, None
+    if not any(env.get(name) for name in values):
+        return command, None
+    import tempfile
+    fd, settings_path = tempfile.mkstemp(prefix='ezswitch-session-', suffix='.json')
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump({'env': {name: value or '' for name, value in values.items()}}, f)
+    return command[:1] + ['--settings', settings_path] + command[1:], settings_path
+
+
+def run_session_command(command, values):
+    """Run ``command`` with ``values`` in its environment only and return its exit status"""
+    env = session_environment(values)
+    command, settings_path = claude_session_command(command, values)
+    try:
+        # Replace this process where possible; a settings file must outlive the command, then go
+        if os.name == 'posix' and settings_path is None:
+            os.execvpe(command[0], command, env)
+        import subprocess
+        return subprocess.call(command, env=env)
+    except OSError as e:
+        print(f"Error: cannot run {command[0]}: {e}", file=sys.stderr)
+        return 127
+    finally:
+        if settings_path is not None:
+            try:
+                os.unlink(settings_path)
+            except OSError:
+                pass
@@ -0,0 +1,60 @@
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT / "tools"))
+
+
+@pytest.fixture(autouse=True)
+def home(tmp_path, monkeypatch):
+    """Give every test its own home directory, so config.json, the vault and caches start empty"""
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv('HOME', str(home))
+    monkeypatch.setenv('USERPROFILE', str(home))
+    monkeypatch.delenv('EZSWITCH_VAULT_PASSPHRASE', raising=False)
+    import ezswitch
+    # The process-wide vault remembers its directory and session key
+    monkeypatch.setattr(ezswitch, '_key_vault', None)
+    return home
+
+
+@pytest.fixture
+def stub():
+    """A stub Anthropic server that accepts only the key 'sk-real'"""
+    from stub_anthropic_server import start_stub_server
+    server = start_stub_server(api_key='sk-real')
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def gui(monkeypatch):
+    """The window on the headless tkinter stand-in from tools/bench_app.py, with an unstarted executor
+
+    Returns a function that builds it once config.json is in place.
+    """
+    import ezswitch
+    from bench_app import install_headless_tk
+    for name in ('tkinter', 'tkinter.ttk', 'tkinter.messagebox'):
+        monkeypatch.delitem(sys.modules, name, raising=False)
+    for name in ('tk', 'ttk', 'messagebox'):
+        monkeypatch.setattr(ezswitch, name, None)
+    monkeypatch.setenv('EZSWITCH_BACKEND', 'memory')
+    tk, _ = install_headless_tk()
+    apps = []
+
+    def open_window():
+        app = ezswitch.ClaudeConfigSwitcher(tk.Tk(), executor=ezswitch.TaskExecutor())
+        app.executor.run_pending()
+        app.drain_background()
+        apps.append(app)
+        return app
+    yield open_window
+    for app in apps:
+        app.close_application()
@@ -0,0 +1,75 @@
+import pytest
+
+import ezswitch
+
+SETTINGS = {'zai_key': 'sk-zai-0123456789', 'claude_key': 'sk-ant-0123456789'}
+
+
+class FlakyBackend(ezswitch.MemoryBackend):
+    """Writes the first variable of the next batch, then fails the rest of it"""
+
+    name = "flaky"
+
+    def __init__(self, values=None, path="flaky.env"):
+        super().__init__(values)
+        self.path = path
+        self.fail_next = True
+
+    def set(self, values):
+        if self.fail_next:
+            self.fail_next = False
+            first = next(iter(values))
+            super().set({first: values[first]})
+            raise ezswitch.EnvironmentStoreError("disk full")
+        super().set(values)
+
+
+def test_reapplying_the_active_profile_writes_nothing():
+    backend = ezswitch.MemoryBackend()
+    first = ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    assert first.changed
+    writes, broadcasts = backend.writes, backend.broadcasts
+
+    again = ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    assert not again.changed
+    assert set(again.unchanged) == {'ANTHROPIC_AUTH_TOKEN', 'ANTHROPIC_BASE_URL'}
+    assert (backend.writes, backend.broadcasts) == (writes, broadcasts)
+
+
+def test_switching_writes_only_what_differs():
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'zai', dict(SETTINGS, zai_key='sk-zai-old'))
+    writes = backend.writes
+    report = ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    assert list(report.changes) == ['ANTHROPIC_AUTH_TOKEN']
+    assert backend.writes == writes + 1
+    assert backend.broadcasts == 2
+
+
+def test_failed_write_puts_the_target_back():
+    backend = FlakyBackend({'ANTHROPIC_AUTH_TOKEN': 'sk-before'})
+    with pytest.raises(ezswitch.EnvironmentStoreError):
+        ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    assert backend.values == {'ANTHROPIC_AUTH_TOKEN': 'sk-before'}
+
+
+def test_one_failing_target_is_rolled_back_and_the_others_applied(monkeypatch, tmp_path):
+    flaky = FlakyBackend({'ANTHROPIC_AUTH_TOKEN': 'sk-before'})
+    monkeypatch.setitem(ezswitch.APPLY_TARGETS, 'flaky', lambda path: flaky)
+    backend = ezswitch.MemoryBackend()
+    settings = dict(SETTINGS, apply_targets=['flaky', {'target': 'dotenv', 'path': str(tmp_path / ".env")}])
+
+    report = ezswitch.apply_profile(backend, 'zai', settings)
+    assert isinstance(report, ezswitch.PipelineReport)
+    assert [result.name for result in report.failures] == [report.results[1].name]
+    assert "disk full" in report.describe()
+    assert flaky.values == {'ANTHROPIC_AUTH_TOKEN': 'sk-before'}
+    assert backend.values['ANTHROPIC_AUTH_TOKEN'] == SETTINGS['zai_key']
+    assert ezswitch.DotenvBackend(tmp_path / ".env").get()['ANTHROPIC_AUTH_TOKEN'] == SETTINGS['zai_key']
+
+
+def test_apply_raises_only_when_every_target_fails(monkeypatch):
+    monkeypatch.setitem(ezswitch.APPLY_TARGETS, 'flaky', lambda path: FlakyBackend())
+    settings = dict(SETTINGS, apply_targets=['flaky'])
+    with pytest.raises(ezswitch.EnvironmentStoreError):
+        ezswitch.apply_profile(FlakyBackend(), 'zai', settings)
@@ -0,0 +1,56 @@
+import os
+import stat
+
+import pytest
+
+import ezswitch
+
+
+def test_lock_files_stay_out_of_the_users_directories(tmp_path):
+    env_file = tmp_path / "project" / ".env"
+    backend = ezswitch.DotenvBackend(env_file)
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-test'})
+    assert sorted(p.name for p in env_file.parent.iterdir()) == ['.env']
+    locks = list((ezswitch.get_config_dir() / "locks").iterdir())
+    assert len(locks) == 1 and locks[0].name.startswith('.env.')
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="symlinks need privileges on Windows")
+def test_symlink_and_target_share_one_lock(tmp_path):
+    target = tmp_path / "dotfiles" / "zshrc"
+    target.parent.mkdir()
+    target.write_text("")
+    link = tmp_path / ".zshrc"
+    link.symlink_to(target)
+    assert ezswitch.FileLock(link).path == ezswitch.FileLock(target).path
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="symlinks need privileges on Windows")
+def test_symlinked_file_is_written_through(tmp_path):
+    target = tmp_path / "dotfiles" / "zshrc"
+    target.parent.mkdir()
+    target.write_text("alias ll='ls -l'\n")
+    link = tmp_path / ".zshrc"
+    link.symlink_to(target)
+    ezswitch.ShellProfileBackend(link).set({'ANTHROPIC_AUTH_TOKEN': 'sk-test'})
+    assert link.is_symlink()
+    assert "sk-test" in target.read_text()
+    assert target.read_text().startswith("alias ll='ls -l'\n")
+    assert sorted(p.name for p in target.parent.iterdir()) == ['zshrc']
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="POSIX permission bits")
+def test_replaced_file_keeps_its_permissions(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("OTHER=1\n")
+    path.chmod(0o640)
+    ezswitch.write_text_atomic(path, "OTHER=2\n")
+    assert stat.S_IMODE(path.stat().st_mode) == 0o640
+    assert path.read_text() == "OTHER=2\n"
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="POSIX permission bits")
+def test_explicit_mode_applies_to_new_files(tmp_path):
+    path = tmp_path / "profiles.jsonl"
+    ezswitch.write_lines_atomic(path, ["{}\n"], mode=0o600)
+    assert stat.S_IMODE(path.stat().st_mode) == 0o600
@@ -0,0 +1,111 @@
+import json
+
+import ezswitch
+
+KEY = {'ANTHROPIC_AUTH_TOKEN': 'sk-zai-0123456789', 'ANTHROPIC_BASE_URL': 'https://api.z.ai/api/anthropic'}
+
+ZSHRC = """export PATH="$HOME/bin:$PATH"
+alias ll='ls -l'
+"""
+
+
+def test_shell_block_is_added_after_the_users_lines(tmp_path):
+    path = tmp_path / ".zshrc"
+    path.write_text(ZSHRC)
+    backend = ezswitch.ShellProfileBackend(path)
+    backend.set(KEY)
+    text = path.read_text()
+    assert text.startswith(ZSHRC)
+    assert f"export ANTHROPIC_AUTH_TOKEN={KEY['ANTHROPIC_AUTH_TOKEN']}" in text
+    assert backend.get() == KEY
+
+
+def test_shell_block_is_rewritten_in_place(tmp_path):
+    path = tmp_path / ".zshrc"
+    path.write_text(ZSHRC)
+    backend = ezswitch.ShellProfileBackend(path)
+    backend.set(KEY)
+    with open(path, 'a') as f:
+        f.write("eval \"$(starship init zsh)\"\n")
+
+    backend.set({'ANTHROPIC_AUTH_TOKEN': "it's secret"})
+    lines = path.read_text().splitlines()
+    assert lines[:2] == ZSHRC.splitlines()
+    assert lines[-1] == 'eval "$(starship init zsh)"'
+    assert lines.count(backend.BEGIN) == 1
+    assert backend.get()['ANTHROPIC_AUTH_TOKEN'] == "it's secret"
+
+    backend.set({'ANTHROPIC_AUTH_TOKEN': None, 'ANTHROPIC_BASE_URL': None})
+    assert path.read_text() == ZSHRC + 'eval "$(starship init zsh)"\n'
+
+
+def test_dotenv_rewrites_assignments_in_place(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("# database\nDATABASE_URL=postgres://localhost/app\n"
+                    "ANTHROPIC_AUTH_TOKEN=sk-old\nDEBUG=1\nANTHROPIC_AUTH_TOKEN=sk-older\n")
+    backend = ezswitch.DotenvBackend(path)
+    backend.set(KEY)
+    assert path.read_text().splitlines() == [
+        "# database",
+        "DATABASE_URL=postgres://localhost/app",
+        f"ANTHROPIC_AUTH_TOKEN={KEY['ANTHROPIC_AUTH_TOKEN']}",
+        "DEBUG=1",
+        f"ANTHROPIC_BASE_URL={KEY['ANTHROPIC_BASE_URL']}",
+    ]
+    assert backend.get() == KEY
+
+
+def test_dotenv_quotes_and_removes_values(tmp_path):
+    path = tmp_path / ".env"
+    path.write_text("DEBUG=1\n")
+    backend = ezswitch.DotenvBackend(path)
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'has "quotes" and spaces'})
+    assert backend.get()['ANTHROPIC_AUTH_TOKEN'] == 'has "quotes" and spaces'
+    backend.set({'ANTHROPIC_AUTH_TOKEN': None})
+    assert path.read_text() == "DEBUG=1\n"
+
+
+CLAUDE_SETTINGS = {
+    'model': 'opus',
+    'permissions': {'allow': ['Bash(git status)']},
+    'env': {'DISABLE_TELEMETRY': '1', 'ANTHROPIC_AUTH_TOKEN': 'sk-old'},
+}
+
+
+def test_settings_file_patches_only_the_env_block(tmp_path):
+    path = tmp_path / ".claude" / "settings.json"
+    path.parent.mkdir()
+    path.write_text(json.dumps(CLAUDE_SETTINGS))
+    backend = ezswitch.SettingsFileBackend(path)
+    backend.set(KEY)
+    settings = json.loads(path.read_text())
+    assert settings['model'] == 'opus'
+    assert settings['permissions'] == CLAUDE_SETTINGS['permissions']
+    assert settings['env'] == dict(KEY, DISABLE_TELEMETRY='1')
+
+    backend.set({'ANTHROPIC_AUTH_TOKEN': None, 'ANTHROPIC_BASE_URL': None, 'DISABLE_TELEMETRY': None})
+    assert json.loads(path.read_text()) == {'model': 'opus', 'permissions': CLAUDE_SETTINGS['permissions']}
+
+
+def test_settings_file_is_not_rewritten_when_nothing_changes(tmp_path, monkeypatch):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps(dict(CLAUDE_SETTINGS, env=KEY)))
+    writes = []
+    monkeypatch.setattr(ezswitch, 'write_json_atomic', lambda *args: writes.append(args))
+    backend = ezswitch.SettingsFileBackend(path)
+    backend.set(KEY)
+    backend.set({'ANTHROPIC_MODEL': None})
+    assert writes == []
+    report = ezswitch.apply_profile(backend, 'zai', {'zai_key': KEY['ANTHROPIC_AUTH_TOKEN']})
+    assert not report.changed and writes == []
+
+
+def test_settings_file_keeps_edits_made_after_it_was_read(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text(json.dumps(CLAUDE_SETTINGS))
+    backend = ezswitch.SettingsFileBackend(path)
+    backend.get()
+    path.write_text(json.dumps(dict(CLAUDE_SETTINGS, model='sonnet', theme='dark')))
+    backend.set(KEY)
+    settings = json.loads(path.read_text())
+    assert (settings['model'], settings['theme']) == ('sonnet', 'dark')
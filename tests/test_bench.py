@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+import ezswitch
+from stub_anthropic_server import start_stub_server
+
+
+def custom(server, key='sk-real'):
+    return {'custom_url': server.url, 'custom_key': key}
+
+
+def bench(settings, **options):
+    [summary] = [s for s in ezswitch.run_benchmark(settings, **options) if s['profile'] == 'custom']
+    return summary
+
+
+def test_only_saved_profiles_are_benchmarked(stub):
+    assert [s['profile'] for s in ezswitch.run_benchmark(custom(stub), runs=1)] == ['custom']
+
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 21))
+    assert ezswitch.percentile(values, 50) == 10
+    assert ezswitch.percentile(values, 95) == 19
+    assert ezswitch.percentile(values, 100) == 20
+    assert ezswitch.percentile([7], 95) == 7
+    assert ezswitch.percentile([], 50) is None
+
+
+def test_summary_reports_p50_and_p95_in_milliseconds():
+    result = ezswitch.BenchmarkResult('custom', 'http://stub')
+    result.ttfb = [0.010, 0.020, 0.030, 0.040, 0.500]
+    result.errors = ["HTTP 529: overloaded"]
+    summary = result.summary()
+    assert (summary['ttfb_ms_p50'], summary['ttfb_ms_p95']) == (30.0, 500.0)
+    assert (summary['runs'], summary['errors'], summary['last_error']) == (6, 1, "HTTP 529: overloaded")
+    assert summary['connect_ms_p50'] is None
+
+
+def test_runs_reuse_one_keep_alive_connection(stub):
+    summary = bench(custom(stub), runs=5, timeout=5)
+    assert (summary['runs'], summary['errors']) == (5, 0)
+    assert summary['ttfb_ms_p50'] <= summary['ttfb_ms_p95']
+    assert summary['tokens_per_second_p50'] > 0
+    # Only the first run opens a connection
+    assert summary['connect_ms_p50'] == summary['connect_ms_p95']
+    assert (stub.state.requests, stub.state.connections) == (5, 1)
+
+
+def test_rejected_and_failing_requests_are_counted_as_errors(stub):
+    summary = bench(custom(stub, 'sk-wrong'), runs=3, timeout=5)
+    assert (summary['runs'], summary['errors'], summary['ttfb_ms_p50']) == (3, 3, None)
+    assert summary['last_error'].startswith("HTTP 401")
+
+    stub.state.status = 503
+    summary = bench(custom(stub), runs=2, timeout=5)
+    assert summary['errors'] == 2 and summary['last_error'].startswith("HTTP 503")
+
+
+def test_timeout_is_reported_and_not_retried(stub):
+    async def scenario():
+        client = ezswitch.AsyncHTTPClient(timeout=0.3)
+        try:
+            url, headers, _ = ezswitch.messages_request(stub.url, 'sk-real', 'model', 8)
+            response = await client.request('GET', stub.url + '/v1/models', headers)
+            await response.read()
+            stub.state.delay = 1.0
+            started = time.monotonic()
+            # The pooled connection is reused; a timeout on it must not start a second wait
+            with pytest.raises(ezswitch.HTTPError, match="within 0.3 s"):
+                await client.request('GET', stub.url + '/v1/models', headers)
+            return time.monotonic() - started
+        finally:
+            client.close()
+
+    assert asyncio.run(scenario()) < 0.55
+    assert stub.state.connections == 1
+
+
+def test_benchmark_names_the_timeout(stub):
+    stub.state.delay = 1.0
+    summary = bench(custom(stub), runs=1, timeout=0.2)
+    assert summary['errors'] == 1
+    assert "within 0.2 s" in summary['last_error']
+
+
+def test_unreachable_endpoint_names_the_address():
+    server = start_stub_server()
+    url = server.url
+    server.shutdown()
+    server.server_close()
+    summary = bench({'custom_url': url, 'custom_key': 'sk-real'}, runs=1, timeout=2)
+    assert summary['last_error'].startswith("Could not connect to 127.0.0.1:")
@@ -0,0 +1,68 @@
+import json
+
+import ezswitch
+
+
+def config_file():
+    return ezswitch.get_config_dir() / "config.json"
+
+
+def write_config(settings):
+    config_file().write_text(json.dumps(settings))
+
+
+def read_config():
+    return json.loads(config_file().read_text())
+
+
+def test_keystroke_saves_are_debounced_and_skip_unchanged_content(tmp_path):
+    store = ezswitch.ConfigStore(tmp_path / "config.json", delay=60)
+    for i in range(10):
+        store.save_later({'zai_key': f"sk-{i}"})
+    assert not (tmp_path / "config.json").exists()
+    assert store.flush()
+    assert json.loads((tmp_path / "config.json").read_text()) == {'zai_key': 'sk-9'}
+    assert not store.save({'zai_key': 'sk-9'})
+
+
+def test_owned_store_keeps_keys_written_by_others(tmp_path):
+    path = tmp_path / "config.json"
+    path.write_text(json.dumps({'zai_key': 'sk-old', 'project_profiles': {'/work': 'zai'}}))
+    store = ezswitch.ConfigStore(path, owned=ezswitch.FORM_SETTINGS)
+    store.load()
+    path.write_text(json.dumps({'zai_key': 'sk-old', 'proxy': {'port': 8787}}))
+    store.save({'zai_key': 'sk-new', 'project_profiles': {'/stale': 'zai'}})
+    assert json.loads(path.read_text()) == {'zai_key': 'sk-new', 'proxy': {'port': 8787}}
+
+
+def test_cli_writes_survive_a_gui_save(gui, tmp_path, capsys):
+    write_config({'zai_key': 'sk-zai-0123456789', 'selected_config': 'zai'})
+    app = gui()
+    project = tmp_path / "project"
+    project.mkdir()
+
+    # Written while the window is open, after it read config.json
+    assert ezswitch.main(['bind', 'zai', str(project), '--map-only'], forward=False) == 0
+    assert ezswitch.main(['vars', 'zai', '--set', 'API_TIMEOUT_MS=3000000'], forward=False) == 0
+    app.set_field('zai_key', 'sk-zai-9876543210')
+    app.save_api_keys(defer=True)
+    app.config_store.flush()
+
+    settings = read_config()
+    assert settings['zai_key'] == 'sk-zai-9876543210'
+    assert list(settings['project_profiles'].values()) == ['zai']
+    assert settings['profile_variables']['zai']['API_TIMEOUT_MS'] == '3000000'
+
+
+def test_gui_save_does_not_undo_vault_enable(gui, monkeypatch, capsys):
+    write_config({'zai_key': 'sk-zai-0123456789', 'selected_config': 'zai'})
+    app = gui()
+    monkeypatch.setenv('EZSWITCH_VAULT_PASSPHRASE', 'correct horse')
+    assert ezswitch.main(['vault', 'enable'], forward=False) == 0
+    app.set_field('custom_url', 'https://gateway.example.com')
+    app.save_api_keys()
+
+    settings = read_config()
+    assert settings['vault']
+    assert settings['custom_url'] == 'https://gateway.example.com'
+    assert not set(settings) & set(ezswitch.SECRET_FIELDS)
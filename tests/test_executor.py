@@ -0,0 +1,80 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import ezswitch
+
+
+def test_coalesce_runs_one_job_for_a_burst():
+    executor = ezswitch.TaskExecutor()
+    runs = []
+    jobs = {executor.submit('status', lambda: runs.append(1), policy='coalesce') for _ in range(20)}
+    assert len(jobs) == 1
+    executor.run_pending()
+    assert runs == [1]
+
+
+def test_latest_delivers_only_the_newest_queued_job():
+    executor = ezswitch.TaskExecutor()
+    ran, delivered = [], []
+    for i in range(3):
+        executor.submit('apply', lambda i=i: ran.append(i) or i, on_done=delivered.append, policy='latest')
+    executor.submit('status', lambda: 'status', on_done=delivered.append)
+    executor.run_pending()
+    executor.drain()
+    assert ran == [2]
+    assert delivered == [2, 'status']
+
+
+def test_latest_supersedes_a_running_job():
+    executor = ezswitch.TaskExecutor()
+    executor.start()
+    try:
+        gate, started, delivered = threading.Event(), threading.Event(), []
+        executor.submit('apply', lambda: started.set() or gate.wait() or 'old', on_done=delivered.append,
+                        policy='latest')
+        assert started.wait(2)
+        executor.submit('apply', lambda: 'new', on_done=delivered.append, policy='latest')
+        assert executor.busy('apply') and not executor.busy('status')
+        gate.set()
+        deadline = time.monotonic() + 2
+        while executor.busy() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        executor.drain()
+        assert delivered == ['new']
+    finally:
+        executor.stop()
+
+
+def test_errors_go_to_on_error():
+    executor = ezswitch.TaskExecutor()
+    errors = []
+    executor.submit('apply', lambda: 1 / 0, on_done=pytest.fail, on_error=errors.append)
+    executor.run_pending()
+    executor.drain()
+    assert isinstance(errors[0], ZeroDivisionError)
+
+
+def test_a_failing_callback_does_not_stop_delivery():
+    reported, delivered = [], []
+    executor = ezswitch.TaskExecutor(on_callback_error=lambda job, error: reported.append((job.kind, error)))
+    executor.submit('first', lambda: None, on_done=lambda result: 1 / 0)
+    executor.submit('second', lambda: 'ok', on_done=delivered.append)
+    executor.call_soon(delivered.append, 'soon')
+    executor.run_pending()
+    assert executor.drain() == 3
+    assert [kind for kind, _ in reported] == ['first']
+    assert delivered == ['soon', 'ok']
+
+
+def test_background_pump_keeps_running_when_a_status_update_fails():
+    scheduled = []
+    app = SimpleNamespace(executor=ezswitch.TaskExecutor(),
+                          root=SimpleNamespace(after=lambda delay, func: scheduled.append(delay)))
+    app.drain_status_updates = lambda: 1 / 0
+    app.drain_background = lambda: ezswitch.ClaudeConfigSwitcher.drain_background(app)
+    with pytest.raises(ZeroDivisionError):
+        app.drain_background()
+    assert scheduled == [50]
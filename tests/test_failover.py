@@ -0,0 +1,115 @@
+import asyncio
+import json
+import threading
+import urllib.request
+
+import pytest
+
+import ezswitch
+from stub_anthropic_server import start_stub_server
+
+
+def control(server, **changes):
+    """Change a running stub's behaviour through POST /_control"""
+    request = urllib.request.Request(server.url + '/_control', data=json.dumps(changes).encode(), method='POST')
+    with urllib.request.urlopen(request, timeout=5) as response:
+        assert json.loads(response.read()) == {'ok': True}
+
+
+@pytest.fixture
+def stubs():
+    servers = {name: start_stub_server() for name in ('primary', 'backup')}
+    yield servers
+    for server in servers.values():
+        server.shutdown()
+        server.server_close()
+
+
+@pytest.fixture
+def settings(stubs):
+    return {'custom_url': stubs['primary'].url, 'custom_key': 'sk-primary',
+            'local_url': stubs['backup'].url, 'local_key': 'sk-backup'}
+
+
+def monitor(backend, settings):
+    return ezswitch.HealthMonitor(backend, lambda: settings, timeout=1, failure_threshold=2,
+                                  failover_profiles=['custom', 'local'])
+
+
+async def probe(health, times):
+    client = ezswitch.AsyncHTTPClient(timeout=1)
+    try:
+        return [await health.check(client) for _ in range(times)]
+    finally:
+        client.close()
+
+
+def test_fails_over_when_the_stub_starts_failing(stubs, settings):
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'custom', settings)
+    health = monitor(backend, settings)
+    assert asyncio.run(probe(health, 1))[0]['healthy']
+
+    control(stubs['primary'], status=503)
+    failovers = []
+    health.on_failover = lambda profile, report: failovers.append(profile)
+    asyncio.run(probe(health, 2))
+    # 'custom' comes first in the list but is the endpoint that is failing
+    assert failovers == ['local']
+    assert backend.values['ANTHROPIC_BASE_URL'] == stubs['backup'].url
+
+
+def test_stays_put_while_the_stub_recovers(stubs, settings):
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'custom', settings)
+    health = monitor(backend, settings)
+    control(stubs['primary'], status=503)
+    asyncio.run(probe(health, 1))
+    control(stubs['primary'], status=200)
+    statuses = asyncio.run(probe(health, 2))
+    assert statuses[-1]['healthy'] and statuses[-1]['consecutive_failures'] == 0
+    assert backend.values['ANTHROPIC_BASE_URL'] == stubs['primary'].url
+
+
+def test_proxy_mode_switches_the_upstream_not_the_environment(stubs, settings):
+    backend = ezswitch.MemoryBackend()
+
+    async def run():
+        proxy = ezswitch.SwitchingProxy(lambda: settings, port=0)
+        await proxy.start()
+        try:
+            settings['proxy'] = {'enabled': True, 'port': proxy.port}
+            proxy.set_upstream('custom', settings)
+            ezswitch.apply_profile_values(backend, 'custom', ezswitch.proxy_environment(proxy.port))
+            control(stubs['primary'], status=503)
+            health = monitor(backend, settings)
+            await probe(health, 2)
+            return proxy.port, proxy.status()
+        finally:
+            await proxy.close()
+
+    port, upstream = asyncio.run(run())
+    assert upstream['profile'] == 'local' and upstream['base_url'] == stubs['backup'].url
+    assert backend.values['ANTHROPIC_BASE_URL'] == ezswitch.proxy_url(port)
+    assert backend.values['ANTHROPIC_AUTH_TOKEN'] == ezswitch.proxy_token()
+
+
+def test_a_check_that_raises_is_logged_and_reported_as_unknown(settings, capsys):
+    class BrokenBackend(ezswitch.MemoryBackend):
+        def get(self, names=ezswitch.ENV_VARS):
+            raise RuntimeError("backend exploded")
+
+    updates = []
+    got_update = threading.Event()
+    health = ezswitch.HealthMonitor(BrokenBackend(), lambda: settings, interval=60,
+                                    on_update=lambda status: updates.append(status) or got_update.set())
+    health.start()
+    try:
+        assert got_update.wait(5)
+    finally:
+        health.stop()
+    status = updates[0]
+    assert status['unknown'] and not status['healthy']
+    assert "backend exploded" in status['last_error']
+    assert ezswitch.format_health(status).startswith("Endpoint health: UNKNOWN")
+    assert "Error in health check" in capsys.readouterr().err
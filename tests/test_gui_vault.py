@@ -0,0 +1,54 @@
+import json
+
+import pytest
+
+import ezswitch
+
+
+@pytest.fixture
+def vaulted(home):
+    """config.json with the vault on and a locked vault holding the Z.ai key"""
+    vault = ezswitch.key_vault()
+    vault.create('correct horse')
+    vault.put('zai_key', 'sk-zai-old')
+    vault.lock_now()
+    (ezswitch.get_config_dir() / "config.json").write_text(json.dumps({'vault': True, 'selected_config': 'zai'}))
+    return vault
+
+
+def test_key_typed_while_locked_is_reported_not_dropped(gui, vaulted):
+    app = gui()
+    app.vault.prompt = lambda: None
+    app.set_field('zai_key', 'sk-zai-new')
+    app.mark_secret_edited('zai_key')
+    assert app.store_vault_secrets() is False
+    kind, title, message = ezswitch.messagebox.log[-1]
+    assert (kind, title) == ('showerror', "Key Vault") and "not saved" in message
+    assert app.get_field('zai_key') == 'sk-zai-new'
+
+    # Unlocking on the next attempt stores it
+    app.vault.prompt = lambda: 'correct horse'
+    assert app.store_vault_secrets() is True
+    assert vaulted.get('zai_key') == 'sk-zai-new'
+    assert 'zai_key' not in json.loads((ezswitch.get_config_dir() / "config.json").read_text())
+
+
+def test_empty_unrevealed_field_does_not_delete_the_stored_key(gui, vaulted):
+    app = gui()
+    app.vault.prompt = lambda: 'correct horse'
+    app.mark_secret_edited('zai_key')
+    assert app.store_vault_secrets() is True
+    assert vaulted.get('zai_key') == 'sk-zai-old'
+
+
+def test_closing_with_an_unsaved_key_asks_first(gui, vaulted, monkeypatch):
+    app = gui()
+    app.vault.prompt = lambda: None
+    app.set_field('zai_key', 'sk-zai-new')
+    app.mark_secret_edited('zai_key')
+    questions = []
+    monkeypatch.setattr(ezswitch.messagebox, 'askyesno', lambda *args: questions.append(args) or False)
+    app.close_application()
+    assert len(questions) == 1
+    assert app.executor.thread is None and not app.executor.stopped
+    app.vault.prompt = lambda: 'correct horse'
@@ -0,0 +1,134 @@
+import json
+import sys
+import threading
+import time
+
+import pytest
+
+import ezswitch
+import ezswitch_client
+
+
+@pytest.fixture
+def config(home):
+    directory = home / ".claude_ez_switch"
+    directory.mkdir(exist_ok=True)
+    (directory / "config.json").write_text(json.dumps({'zai_key': 'sk-zai-0123456789'}))
+
+
+@pytest.mark.parametrize('argv', [
+    ['proxy'], ['monitor'], ['serve'], ['vault', 'enable'], ['usage'], ['run', 'zai', '--', 'claude'],
+    ['status', '--help'], ['status', '--hel'], ['--backend', 'memory', 'status'], ['--trace', 'list'],
+    ['no-such-command'], ['apply'], [], ['gui'], 'status', [1],
+])
+def test_only_quick_commands_are_served(argv):
+    assert ezswitch.run_forwarded(argv) == {'handled': False}
+
+
+def test_output_is_captured_without_touching_sys_stdout(config, monkeypatch, capsys):
+    streams = []
+    read_environment = ezswitch.read_environment
+
+    def spy():
+        streams.append(sys.stdout)
+        return read_environment()
+
+    monkeypatch.setattr(ezswitch, 'read_environment', spy)
+    stdout = sys.stdout
+    response = ezswitch.run_forwarded(['current'])
+    assert response == {'handled': True, 'code': 0, 'stdout': "claude-subscription\n", 'stderr': ''}
+    assert streams == [stdout]
+    assert capsys.readouterr() == ('', '')
+
+
+def test_errors_go_to_the_captured_stderr(config):
+    response = ezswitch.run_forwarded(['apply', 'openrouter'])
+    assert response['handled'] and response['code'] == 1
+    assert response['stderr'].startswith("Error: ")
+
+
+def test_env_lookup_for_run_is_served(config):
+    response = ezswitch.run_forwarded(['env', 'zai', '--shell', 'json'])
+    assert response['code'] == 0
+    assert json.loads(response['stdout'])['ANTHROPIC_AUTH_TOKEN'] == 'sk-zai-0123456789'
+
+
+def test_launcher_forwards_the_same_commands():
+    assert ezswitch_client.FORWARDED_COMMANDS is ezswitch.FORWARDED_COMMANDS
+    assert set(ezswitch.FORWARDED_COMMANDS) <= set(ezswitch.SERVED_COMMANDS)
+
+
+@pytest.fixture
+def resident(config):
+    """A running InstanceServer that serves requests with run_forwarded and records them"""
+    requests = []
+    server = ezswitch.InstanceServer(lambda request: requests.append(request) or ezswitch.run_forwarded(request['argv']))
+    assert server.start()
+    server.requests = requests
+    yield server
+    server.close()
+
+
+def test_later_launch_runs_in_the_resident_instance(resident, capsys):
+    assert ezswitch.main(['current']) == 0
+    assert capsys.readouterr().out == "claude-subscription\n"
+    assert [request['argv'] for request in resident.requests] == [['current']]
+    assert 'token' not in ezswitch.forward_to_instance({'argv': ['current'], 'command': 'current'})
+
+
+def test_only_one_instance_listens(resident):
+    assert not ezswitch.InstanceServer(lambda request: {}).start()
+
+
+def test_commands_the_instance_does_not_serve_run_locally(resident, capsys):
+    assert ezswitch.main(['projects']) == 0
+    assert resident.requests == []
+
+
+def test_stale_socket_falls_back_to_running_locally(config, capsys):
+    server = ezswitch.InstanceServer(pytest.fail)
+    assert server.start()
+    # The instance died without withdrawing instance.json
+    server.closed = True
+    server.sock.close()
+    assert ezswitch.forward_to_instance(None) is None
+    assert ezswitch.main(['current']) == 0
+    assert capsys.readouterr().out == "claude-subscription\n"
+
+    replacement = ezswitch.InstanceServer(lambda request: {'handled': True})
+    try:
+        assert replacement.start()
+    finally:
+        replacement.close()
+
+
+def test_wrong_token_is_dropped_and_runs_locally(resident, capsys):
+    path = ezswitch.instance_file()
+    published = json.loads(path.read_text())
+    path.write_text(json.dumps(dict(published, token='0' * 32)))
+    assert ezswitch.forward_to_instance({'argv': ['current'], 'command': 'current'}) is None
+    assert ezswitch.main(['current']) == 0
+    assert capsys.readouterr().out == "claude-subscription\n"
+    assert resident.requests == []
+
+
+def test_accept_errors_back_off_instead_of_spinning(tmp_path):
+    class FailingSocket:
+        calls = 0
+
+        def accept(self):
+            self.calls += 1
+            raise OSError("too many open files")
+
+        def fileno(self):
+            return 3
+
+    server = ezswitch.InstanceServer(pytest.fail, tmp_path / "instance.json")
+    server.sock = FailingSocket()
+    thread = threading.Thread(target=server._accept, daemon=True)
+    thread.start()
+    time.sleep(0.5)
+    server.closed = True
+    thread.join(2)
+    assert not thread.is_alive()
+    assert server.sock.calls < 15
@@ -0,0 +1,110 @@
+import base64
+import sys
+import time
+
+import pytest
+
+import ezswitch
+
+FAKE = ezswitch.Path(__file__).resolve().parent.parent / "tools" / "fake-powershell" / "powershell"
+
+pytestmark = pytest.mark.skipif(sys.platform == 'win32', reason="tools/fake-powershell is a POSIX script")
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    """Point ezswitch at tools/fake-powershell and return its launch log"""
+    log = tmp_path / "launches.log"
+    monkeypatch.setenv('EZSWITCH_POWERSHELL', str(FAKE))
+    monkeypatch.setenv('FAKE_POWERSHELL_STORE', str(tmp_path / "env.json"))
+    monkeypatch.setenv('FAKE_POWERSHELL_LAUNCH_LOG', str(log))
+    log.write_text("")
+    return log
+
+
+def launches(log):
+    return len(log.read_text().splitlines())
+
+
+TRICKY = {
+    'ANTHROPIC_AUTH_TOKEN': "sk-'quoted' \"double\" $(whoami) `tick` %PATH% ünï",
+    'ANTHROPIC_BASE_URL': "https://example.com/a b;c&d|e",
+}
+
+
+def test_values_survive_quoting_unchanged(fake):
+    backend = ezswitch.PowerShellBackend()
+    backend.set(TRICKY)
+    assert backend.get() == TRICKY
+    # The values travel base64-encoded, never spliced into the script
+    command = backend.build_command(writes=TRICKY)
+    script = base64.b64decode(command[command.index('-EncodedCommand') + 1]).decode('utf-16-le')
+    assert "whoami" not in script
+
+
+def test_each_batch_is_one_process(fake):
+    backend = ezswitch.PowerShellBackend()
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-1', 'ANTHROPIC_BASE_URL': 'https://a', 'API_TIMEOUT_MS': '1'})
+    assert launches(fake) == 1
+    assert backend.get(['ANTHROPIC_AUTH_TOKEN', 'ANTHROPIC_BASE_URL', 'API_TIMEOUT_MS'])['API_TIMEOUT_MS'] == '1'
+    assert launches(fake) == 2
+
+
+def test_none_removes_a_variable(fake):
+    backend = ezswitch.PowerShellBackend()
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-1', 'ANTHROPIC_BASE_URL': 'https://a'})
+    backend.set({'ANTHROPIC_AUTH_TOKEN': None})
+    assert backend.get() == {'ANTHROPIC_AUTH_TOKEN': '', 'ANTHROPIC_BASE_URL': 'https://a'}
+
+
+def test_a_failing_process_raises(fake, monkeypatch):
+    monkeypatch.setenv('EZSWITCH_POWERSHELL', '/bin/false')
+    with pytest.raises(ezswitch.EnvironmentStoreError):
+        ezswitch.PowerShellBackend().get()
+
+
+@pytest.fixture
+def worker(fake):
+    worker = ezswitch.PowerShellWorker(timeout=2)
+    yield worker
+    worker.stop()
+
+
+def test_worker_is_spawned_once_per_session(fake, worker):
+    backend = ezswitch.PowerShellBackend(worker=worker)
+    for i in range(5):
+        backend.set({'ANTHROPIC_AUTH_TOKEN': f"sk-{i}"})
+        assert backend.get()['ANTHROPIC_AUTH_TOKEN'] == f"sk-{i}"
+    assert launches(fake) == 1
+
+
+def test_killed_worker_is_restarted_for_the_same_request(fake, worker):
+    backend = ezswitch.PowerShellBackend(worker=worker)
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-1'})
+    worker.process.kill()
+    worker.process.wait()
+    assert backend.get()['ANTHROPIC_AUTH_TOKEN'] == 'sk-1'
+    assert launches(fake) == 2
+
+
+def test_hung_worker_times_out_and_is_replaced(fake, worker, monkeypatch):
+    monkeypatch.setenv('FAKE_POWERSHELL_HANG', '30')
+    worker.timeout = 0.5
+    backend = ezswitch.PowerShellBackend(worker=worker)
+    started = time.monotonic()
+    with pytest.raises(ezswitch.EnvironmentStoreError, match="timed out"):
+        backend.get()
+    assert time.monotonic() - started < 5
+    assert worker.process is None
+
+    monkeypatch.delenv('FAKE_POWERSHELL_HANG')
+    assert backend.get() == {'ANTHROPIC_AUTH_TOKEN': '', 'ANTHROPIC_BASE_URL': ''}
+    assert launches(fake) == 2
+
+
+def test_closing_the_backend_stops_the_worker(fake, worker):
+    backend = ezswitch.PowerShellBackend(worker=worker)
+    backend.get()
+    process = worker.process
+    backend.close()
+    assert process.poll() is not None
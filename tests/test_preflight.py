@@ -0,0 +1,73 @@
+import pytest
+
+import ezswitch
+from stub_anthropic_server import start_stub_server
+
+
+def custom(server, key, **preflight):
+    return {'custom_url': server.url, 'custom_key': key, 'preflight': dict({'enabled': True}, **preflight)}
+
+
+def test_accepted_key_passes(stub):
+    validation = ezswitch.preflight_check('custom', custom(stub, 'sk-real'))
+    assert validation.status == 'valid'
+
+
+def test_rejected_key_stops_the_switch(stub):
+    settings = custom(stub, 'sk-wrong')
+    [validation] = ezswitch.validate_profiles(['custom'], settings)
+    assert (validation.status, validation.detail, validation.ok) == ('rejected', "HTTP 401", False)
+    with pytest.raises(ezswitch.ProfileError, match="nothing was changed"):
+        ezswitch.preflight_check('custom', settings)
+
+
+def test_rejected_key_leaves_the_environment_alone(stub, monkeypatch):
+    monkeypatch.setattr(ezswitch, 'select_backend', lambda *args, **kwargs: backend)
+    backend = ezswitch.MemoryBackend({'ANTHROPIC_AUTH_TOKEN': 'sk-before'})
+    ezswitch.write_json_atomic(ezswitch.get_config_dir() / "config.json", custom(stub, 'sk-wrong'))
+    assert ezswitch.main(['apply', 'custom'], forward=False) == 1
+    assert backend.values == {'ANTHROPIC_AUTH_TOKEN': 'sk-before'}
+    assert backend.writes == 0
+
+
+def test_slow_endpoint_times_out_as_unreachable():
+    server = start_stub_server(api_key='sk-real', delay=1.0)
+    try:
+        settings = custom(server, 'sk-real', timeout=0.2)
+        [validation] = ezswitch.validate_profiles(['custom'], settings, timeout=0.2)
+        assert validation.status == 'unreachable'
+        assert validation.detail == "no response within 0.2 s"
+        with pytest.raises(ezswitch.ProfileError, match="endpoint unreachable"):
+            ezswitch.preflight_check('custom', settings)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_verdicts_are_cached_but_timeouts_are_not(stub):
+    cache = ezswitch.ValidationCache()
+    ezswitch.validate_profiles(['custom'], custom(stub, 'sk-wrong'), cache)
+    [validation] = ezswitch.validate_profiles(['custom'], custom(stub, 'sk-wrong'), cache)
+    assert validation.cached and validation.status == 'rejected'
+
+    cache.put({(stub.url, 'sk-real'): ('unreachable', "no response within 5 s")})
+    assert cache.get(stub.url, 'sk-real') is None
+
+
+def test_local_gateway_counts_as_configured_only_once_saved(capsys):
+    assert ezswitch.main(['list'], forward=False) == 0
+    [line] = [line for line in capsys.readouterr().out.splitlines() if line[2:].startswith('local ')]
+    assert line.endswith("(not configured)")
+    assert ezswitch.profile_endpoint('local', {}) is None
+    assert ezswitch.validate_profiles(list(ezswitch.PROFILES), {}) == []
+
+    assert ezswitch.profile_endpoint('local', {'local_key': 'sk-local'}) == (ezswitch.LOCAL_GATEWAY_URL, 'sk-local')
+    assert ezswitch.profile_endpoint('local', {'local_url': 'http://localhost:8080'}) == (
+        'http://localhost:8080', 'local')
+
+
+def test_check_without_arguments_covers_only_saved_keys(stub, capsys):
+    ezswitch.write_json_atomic(ezswitch.get_config_dir() / "config.json", custom(stub, 'sk-real'))
+    assert ezswitch.main(['check'], forward=False) == 0
+    [line] = capsys.readouterr().out.splitlines()
+    assert stub.url in line and 'localhost:4000' not in line
@@ -0,0 +1,91 @@
+import json
+import os
+import stat
+
+import pytest
+
+import ezswitch
+
+ROWS = [
+    {'name': 'acme-eu', 'url': 'https://eu.acme.example/anthropic', 'key': 'sk-team-eu-0123456789'},
+    {'name': 'acme-us', 'url': 'https://us.acme.example/anthropic', 'key': 'sk-team-us-0123456789'},
+]
+
+
+def rows_file(tmp_path, rows=ROWS):
+    path = tmp_path / "team.jsonl"
+    path.write_text("".join(json.dumps(row) + "\n" for row in rows))
+    return path
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = ezswitch.KeyVault(tmp_path / "vault", prompt=None)
+    vault.create('correct horse')
+    return vault
+
+
+def mode(path):
+    return stat.S_IMODE(path.stat().st_mode)
+
+
+posix_only = pytest.mark.skipif(os.name != 'posix', reason="POSIX permission bits")
+
+
+@posix_only
+def test_store_is_private(tmp_path):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl")
+    ezswitch.import_profiles(rows_file(tmp_path), store=store)
+    assert mode(store.path) == 0o600
+
+
+def test_import_dedupes_and_updates(tmp_path):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl")
+    assert ezswitch.import_profiles(rows_file(tmp_path), store=store).added == 2
+    rotated = [dict(ROWS[0], key='sk-team-eu-rotated-99'), ROWS[1]]
+    report = ezswitch.import_profiles(rows_file(tmp_path, rotated), store=store)
+    assert (report.added, report.updated, report.duplicates) == (0, 1, 1)
+    assert store.get('acme-eu')['key'] == 'sk-team-eu-rotated-99'
+
+
+def test_vaulted_keys_stay_out_of_the_file(tmp_path, vault):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl", vault=vault)
+    ezswitch.import_profiles(rows_file(tmp_path), store=store)
+    text = store.path.read_text()
+    assert 'sk-team' not in text and 'fingerprint' in text
+    assert store.get('acme-us')['key'] == ROWS[1]['key']
+    # Re-importing the same rows finds them by fingerprint
+    assert ezswitch.import_profiles(rows_file(tmp_path), store=store).duplicates == 2
+
+
+def test_removing_a_vaulted_profile_drops_its_key(tmp_path, vault):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl", vault=vault)
+    ezswitch.import_profiles(rows_file(tmp_path), store=store)
+    assert store.remove('acme-eu')
+    assert list(store.vault_keys().values()) == [ROWS[1]['key']]
+
+
+def test_seal_moves_keys_into_the_vault_and_back(tmp_path, vault):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl")
+    ezswitch.import_profiles(rows_file(tmp_path), store=store)
+    store.seal(vault)
+    assert 'sk-team' not in store.path.read_text()
+    store.seal(None)
+    assert [profile['key'] for profile in store] == [row['key'] for row in ROWS]
+    assert vault.get(ezswitch.ProfileStore.VAULT_RECORD) is None
+
+
+def test_export_includes_vaulted_keys_in_a_private_file(tmp_path, vault):
+    store = ezswitch.ProfileStore(tmp_path / "profiles.jsonl", vault=vault)
+    ezswitch.import_profiles(rows_file(tmp_path), store=store)
+    out = tmp_path / "backup.csv"
+    assert ezswitch.export_profiles(out, store=store) == 2
+    assert out.read_text().splitlines() == ['name,url,key'] + [f"{r['name']},{r['url']},{r['key']}" for r in ROWS]
+    if os.name == 'posix':
+        assert mode(out) == 0o600
+
+
+def test_export_command_warns_about_secrets(tmp_path, capsys):
+    ezswitch.import_profiles(rows_file(tmp_path))
+    assert ezswitch.main(['profiles', 'export', str(tmp_path / "backup.jsonl")], forward=False) == 0
+    assert 'plain text' in capsys.readouterr().err
@@ -0,0 +1,67 @@
+import json
+
+import pytest
+
+import ezswitch
+
+normalized = ezswitch.normalize_project_path
+
+
+@pytest.fixture
+def tree(tmp_path):
+    """work/ bound to zai, work/client/ bound to custom, and a deep directory in each"""
+    work = tmp_path / "work"
+    (work / "app" / "src" / "pkg").mkdir(parents=True)
+    (work / "client" / "api" / "v2").mkdir(parents=True)
+    (tmp_path / "elsewhere").mkdir()
+    return tmp_path
+
+
+def write_config(settings):
+    path = ezswitch.get_config_dir() / "config.json"
+    path.write_text(json.dumps(settings))
+    return path
+
+
+def test_nearest_bound_ancestor_wins(tree):
+    index = ezswitch.ProjectIndex({str(tree / "work"): 'zai', str(tree / "work" / "client"): 'custom'})
+    assert index.resolve(tree / "work" / "app" / "src" / "pkg") == ('zai', normalized(tree / "work"))
+    assert index.resolve(tree / "work" / "client" / "api" / "v2") == ('custom', normalized(tree / "work" / "client"))
+    assert index.resolve(tree / "work") == ('zai', normalized(tree / "work"))
+    assert index.resolve(tree / "elsewhere") == (None, None)
+
+
+def test_unbound_directories_follow_the_global_profile(tree):
+    write_config({'selected_config': 'claude', 'project_profiles': {str(tree / "work"): 'zai'}})
+    resolver = ezswitch.ProjectResolver()
+    assert resolver.resolve(tree / "work" / "app") == ('zai', normalized(tree / "work"))
+    profile, root = resolver.resolve(tree / "elsewhere")
+    assert root is None and profile == ezswitch.selected_profile({'selected_config': 'claude'})
+
+
+def test_index_is_rebuilt_only_when_config_changes(tree, monkeypatch):
+    path = write_config({'project_profiles': {str(tree / "work"): 'zai'}})
+    loads = []
+    original = ezswitch.ConfigStore.load
+    monkeypatch.setattr(ezswitch.ConfigStore, 'load', lambda self: loads.append(1) or original(self))
+    resolver = ezswitch.ProjectResolver(path)
+    for _ in range(5):
+        assert resolver.resolve(tree / "work" / "app")[0] == 'zai'
+    assert len(loads) == 1
+
+    path.write_text(json.dumps({'project_profiles': {str(tree / "work" / "app"): 'custom'}}))
+    assert resolver.resolve(tree / "work" / "app" / "src") == ('custom', normalized(tree / "work" / "app"))
+    assert len(loads) == 2
+
+
+def test_bind_and_unbind(tree, capsys):
+    write_config({'zai_key': 'sk-zai-0123456789'})
+    project = tree / "work" / "app"
+    assert ezswitch.main(['bind', 'zai', str(project)], forward=False) == 0
+    local = project / ".claude" / "settings.local.json"
+    assert json.loads(local.read_text())['env']['ANTHROPIC_AUTH_TOKEN'] == 'sk-zai-0123456789'
+    assert ezswitch.ProjectResolver().resolve(project / "src") == ('zai', normalized(project))
+
+    assert ezswitch.main(['unbind', str(project)], forward=False) == 0
+    assert 'env' not in json.loads(local.read_text())
+    assert ezswitch.ProjectResolver().resolve(project / "src")[1] is None
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+import stat
+
+import pytest
+
+import ezswitch
+
+
+def proxy_call(upstream_url, token=None, authorize=True, host=None, path='/v1/messages', payload=None):
+    """Send one raw request to a fresh proxy in front of ``upstream_url``; returns (status, body)
+
+    The request carries the proxy's own token unless ``token`` replaces it or ``authorize`` is False.
+    """
+    settings = {'custom_url': upstream_url, 'custom_key': 'sk-real'}
+
+    async def run():
+        proxy = ezswitch.SwitchingProxy(lambda: settings, port=0)
+        proxy.set_upstream('custom')
+        await proxy.start()
+        try:
+            reader, writer = await asyncio.open_connection('127.0.0.1', proxy.port)
+            body = json.dumps(payload or {'model': 'stub', 'max_tokens': 5, 'stream': False,
+                                          'messages': [{'role': 'user', 'content': 'hi'}]}).encode()
+            lines = [f"POST {path} HTTP/1.1", f"Host: {host or f'127.0.0.1:{proxy.port}'}",
+                     f"Content-Length: {len(body)}", "Connection: close"]
+            if authorize:
+                lines.append(f"Authorization: Bearer {token or proxy.token}")
+            writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+            response = await reader.read()
+            writer.close()
+        finally:
+            await proxy.close()
+        head, _, content = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), content
+
+    return asyncio.run(run())
+
+
+def test_token_is_random_per_install_and_private(home):
+    token = ezswitch.proxy_token()
+    assert token.startswith(ezswitch.PROXY_TOKEN_PREFIX) and len(token) > 40
+    assert ezswitch.proxy_token() == token
+    if os.name == 'posix':
+        assert stat.S_IMODE((home / ".claude_ez_switch" / "proxy_token").stat().st_mode) == 0o600
+    assert ezswitch.proxy_environment(8082)['ANTHROPIC_AUTH_TOKEN'] == token
+
+
+def test_forwards_with_the_proxy_token(stub):
+    status, body = proxy_call(stub.url)
+    assert status == 200
+    assert json.loads(body)['type'] == 'message'
+
+
+def test_rejects_a_wrong_or_missing_token(stub):
+    assert proxy_call(stub.url, token='ezswitch-proxy')[0] == 401
+    assert proxy_call(stub.url, authorize=False)[0] == 401
+    assert stub.state.requests == 0
+
+
+def test_rejects_a_foreign_host(stub):
+    assert proxy_call(stub.url, host='evil.example.com')[0] == 401
+    assert stub.state.requests == 0
+
+
+def test_control_requests_need_the_token(stub):
+    assert proxy_call(stub.url, authorize=False, path='/_ezswitch/upstream', payload={'profile': 'custom'})[0] == 401
+    assert proxy_call(stub.url, path='/_ezswitch/upstream', payload={'profile': 'custom'})[0] == 200
+
+
+def test_stopped_proxy_leaves_the_environment_alone(stub):
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    settings = {'custom_url': stub.url, 'custom_key': 'sk-real', 'proxy': {'enabled': True, 'port': port}}
+    backend = ezswitch.MemoryBackend({'ANTHROPIC_AUTH_TOKEN': 'sk-before', 'ANTHROPIC_BASE_URL': stub.url})
+    with pytest.raises(ezswitch.HTTPError, match="Nothing was changed"):
+        ezswitch.switch_proxy_upstream(backend, port, 'custom', settings)
+    assert backend.writes == 0
+    assert backend.values['ANTHROPIC_BASE_URL'] == stub.url
+
+
+def test_running_proxy_is_switched_and_pointed_at(stub):
+    settings = {'custom_url': stub.url, 'custom_key': 'sk-real'}
+    backend = ezswitch.MemoryBackend()
+
+    async def run():
+        proxy = ezswitch.SwitchingProxy(lambda: settings, port=0)
+        await proxy.start()
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, ezswitch.switch_proxy_upstream, backend, proxy.port, 'custom', settings)
+            return proxy.port, proxy.status()
+        finally:
+            await proxy.close()
+
+    port, status = asyncio.run(run())
+    assert status['base_url'] == stub.url
+    assert backend.values['ANTHROPIC_BASE_URL'] == ezswitch.proxy_url(port)
@@ -0,0 +1,95 @@
+import subprocess
+
+import pytest
+
+import ezswitch
+
+
+class FakeWinreg:
+    """The part of winreg RegistryBackend uses, backed by a dict"""
+
+    HKEY_CURRENT_USER = 'HKCU'
+    KEY_READ = 1
+    KEY_WRITE = 2
+    REG_SZ = 1
+    REG_EXPAND_SZ = 2
+
+    def __init__(self):
+        self.values = {}
+
+    class Key:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            pass
+
+    def OpenKey(self, root, path, reserved, access):
+        assert (root, path) == ('HKCU', 'Environment')
+        return self.Key()
+
+    def QueryValueEx(self, key, name):
+        try:
+            return self.values[name]
+        except KeyError:
+            raise FileNotFoundError(name)
+
+    def SetValueEx(self, key, name, reserved, value_type, value):
+        self.values[name] = (value, value_type)
+
+    def DeleteValue(self, key, name):
+        try:
+            del self.values[name]
+        except KeyError:
+            raise FileNotFoundError(name)
+
+
+@pytest.fixture
+def registry(monkeypatch):
+    fake = FakeWinreg()
+    monkeypatch.setattr(ezswitch, 'winreg', fake)
+
+    def no_processes(*args, **kwargs):
+        raise AssertionError("the registry backend started a process")
+    monkeypatch.setattr(subprocess, 'Popen', no_processes)
+    backend = ezswitch.RegistryBackend()
+    backend.broadcasts = 0
+
+    def broadcast_change():
+        backend.broadcasts += 1
+    backend.broadcast_change = broadcast_change
+    return fake, backend
+
+
+def test_batch_is_written_with_one_broadcast(registry):
+    fake, backend = registry
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-1', 'ANTHROPIC_BASE_URL': 'https://a'})
+    assert backend.get() == {'ANTHROPIC_AUTH_TOKEN': 'sk-1', 'ANTHROPIC_BASE_URL': 'https://a'}
+    assert backend.broadcasts == 1
+
+
+def test_empty_batch_is_not_broadcast(registry):
+    fake, backend = registry
+    backend.set({})
+    assert backend.broadcasts == 0
+
+
+def test_values_with_variables_stay_expandable(registry):
+    fake, backend = registry
+    backend.set({'ANTHROPIC_BASE_URL': '%GATEWAY%/v1', 'ANTHROPIC_AUTH_TOKEN': 'sk-1'})
+    assert fake.values['ANTHROPIC_BASE_URL'][1] == FakeWinreg.REG_EXPAND_SZ
+    assert fake.values['ANTHROPIC_AUTH_TOKEN'][1] == FakeWinreg.REG_SZ
+
+
+def test_removing_a_missing_value_is_not_an_error(registry):
+    fake, backend = registry
+    backend.set({'ANTHROPIC_AUTH_TOKEN': 'sk-1'})
+    backend.set({'ANTHROPIC_AUTH_TOKEN': None, 'ANTHROPIC_BASE_URL': ''})
+    assert fake.values == {}
+    assert backend.get() == {'ANTHROPIC_AUTH_TOKEN': '', 'ANTHROPIC_BASE_URL': ''}
+
+
+def test_registry_needs_windows(monkeypatch):
+    monkeypatch.setattr(ezswitch, 'winreg', None)
+    with pytest.raises(ezswitch.EnvironmentStoreError):
+        ezswitch.RegistryBackend()
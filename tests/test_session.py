@@ -0,0 +1,74 @@
+import json
+import os
+import stat
+import sys
+
+import pytest
+
+import ezswitch
+import ezswitch_common
+
+KEY = 'sk-ant-session-0123456789'
+
+
+@pytest.fixture
+def claude(tmp_path):
+    """A stand-in ``claude`` that records its arguments and the --settings file it was given"""
+    record = tmp_path / "record.json"
+    script = tmp_path / "claude"
+    script.write_text(f"""#!{sys.executable}
+import json, os, stat, sys
+args = sys.argv[1:]
+path = args[args.index('--settings') + 1] if '--settings' in args else None
+with open({str(record)!r}, 'w') as f:
+    json.dump({{'args': args, 'token': os.environ.get('ANTHROPIC_AUTH_TOKEN'),
+               'settings': json.load(open(path)) if path else None,
+               'mode': stat.S_IMODE(os.stat(path).st_mode) if path else None}}, f)
+""")
+    script.chmod(0o755)
+    return script, record
+
+
+def apply_globally(home):
+    (home / ".claude").mkdir()
+    (home / ".claude" / "settings.json").write_text(json.dumps({'env': {'ANTHROPIC_AUTH_TOKEN': 'sk-global'}}))
+
+
+@pytest.mark.skipif(os.name != 'posix', reason="runs a script through its shebang")
+def test_key_goes_in_a_private_file_not_on_the_command_line(home, claude):
+    script, record = claude
+    apply_globally(home)
+    assert ezswitch_common.run_session_command([str(script), '-p', 'hi'], {'ANTHROPIC_AUTH_TOKEN': KEY}) == 0
+    seen = json.loads(record.read_text())
+    assert not any(KEY in arg for arg in seen['args'])
+    assert seen['args'][-2:] == ['-p', 'hi']
+    assert seen['settings'] == {'env': {'ANTHROPIC_AUTH_TOKEN': KEY}}
+    assert seen['mode'] == 0o600
+    assert not os.path.exists(seen['args'][1])
+
+
+def test_no_settings_file_without_a_global_profile():
+    command, path = ezswitch_common.claude_session_command(['claude'], {'ANTHROPIC_AUTH_TOKEN': KEY})
+    assert (command, path) == (['claude'], None)
+
+
+def test_other_commands_are_left_alone(home):
+    apply_globally(home)
+    assert ezswitch_common.claude_session_command(['python', '-V'], {'ANTHROPIC_AUTH_TOKEN': KEY}) == (['python', '-V'], None)
+
+
+def test_session_environment_sets_and_removes():
+    env = ezswitch_common.session_environment({'A': '1', 'B': None}, {'B': 'x', 'C': 'y'})
+    assert env == {'A': '1', 'C': 'y'}
+
+
+def test_run_passes_the_command_line_through(home, monkeypatch):
+    calls = []
+    monkeypatch.setattr(ezswitch, 'run_session_command', lambda command, values: calls.append((command, values)) or 0)
+    ezswitch.write_json_atomic(ezswitch.get_config_dir() / "config.json", {'claude_key': KEY})
+    argv = ['run', 'claude-api', '--', 'claude', '-p', 'hi']
+    args = ezswitch.build_parser().parse_args(argv)
+    assert args.command == 'run' and args.argv[-3:] == ['claude', '-p', 'hi']
+    assert ezswitch.main(argv, forward=False) == 0
+    [(command, values)] = calls
+    assert command == ['claude', '-p', 'hi'] and values['ANTHROPIC_AUTH_TOKEN'] == KEY
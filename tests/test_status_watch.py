@@ -0,0 +1,69 @@
+import queue
+import time
+
+import pytest
+
+import ezswitch
+
+KEY = {'ANTHROPIC_AUTH_TOKEN': 'sk-zai-0123456789', 'ANTHROPIC_BASE_URL': 'https://api.z.ai/api/anthropic'}
+
+
+def updates_within(watcher, seconds):
+    """Collect what the watcher queues in the next ``seconds``"""
+    deadline = time.monotonic() + seconds
+    updates = []
+    while time.monotonic() < deadline:
+        try:
+            updates.append(watcher.updates.get(timeout=max(deadline - time.monotonic(), 0)))
+        except queue.Empty:
+            break
+    return updates
+
+
+@pytest.fixture
+def watch():
+    watchers = []
+
+    def start(backend, interval=0.05):
+        watcher = ezswitch.StatusWatcher(backend, interval=interval)
+        watcher.seed(backend.get())
+        watcher.start()
+        watchers.append(watcher)
+        return watcher
+    yield start
+    for watcher in watchers:
+        watcher.stop()
+
+
+def test_polling_reports_one_change_once(watch):
+    backend = ezswitch.MemoryBackend()
+    watcher = watch(backend)
+    assert updates_within(watcher, 0.3) == []
+    backend.set(KEY)
+    assert updates_within(watcher, 0.5) == [KEY]
+
+
+def test_settings_file_changes_are_noticed(watch, tmp_path):
+    path = tmp_path / "settings.json"
+    watcher = watch(ezswitch.SettingsFileBackend(path), interval=0.1)
+    # Another process, as far as the watcher's backend is concerned
+    ezswitch.SettingsFileBackend(path).set(KEY)
+    assert updates_within(watcher, 1.0) == [KEY]
+
+
+def test_force_poke_queues_unchanged_values(watch):
+    backend = ezswitch.MemoryBackend(KEY)
+    watcher = watch(backend, interval=60)
+    watcher.poke(force=True)
+    assert updates_within(watcher, 0.5) == [KEY]
+
+
+def test_a_read_error_is_queued_once():
+    class FailingBackend(ezswitch.MemoryBackend):
+        def get(self, names=ezswitch.ENV_VARS):
+            raise ezswitch.EnvironmentStoreError("settings.json is not valid JSON")
+
+    watcher = ezswitch.StatusWatcher(FailingBackend())
+    assert watcher.check() and not watcher.check()
+    assert isinstance(watcher.updates.get_nowait(), ezswitch.EnvironmentStoreError)
+    assert watcher.updates.empty()
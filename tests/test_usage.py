@@ -0,0 +1,78 @@
+import json
+
+import pytest
+
+import ezswitch
+
+
+def line(entry):
+    # Claude Code writes compact JSON, one entry per line
+    return json.dumps(entry, separators=(',', ':')) + "\n"
+
+
+def prompt(ts):
+    return line({'type': 'user', 'timestamp': ts, 'message': {'role': 'user', 'content': 'hi'}})
+
+
+def reply(ts, reply_id, output_tokens=10):
+    return line({'type': 'assistant', 'timestamp': ts, 'message': {
+        'id': reply_id, 'model': 'glm-4.6', 'usage': {'input_tokens': 100, 'output_tokens': output_tokens}}})
+
+
+@pytest.fixture
+def paths(tmp_path):
+    history = tmp_path / "history.jsonl"
+    history.write_text(json.dumps({'ts': '2026-10-01T00:00:00Z', 'profile': 'zai'}) + "\n")
+    transcript = tmp_path / "projects" / "-work-app" / "session.jsonl"
+    transcript.parent.mkdir(parents=True)
+    return {'projects_dir': tmp_path / "projects", 'index_path': tmp_path / "usage_index.json",
+            'history_path': history, 'transcript': transcript}
+
+
+def analyze(paths):
+    return ezswitch.UsageAnalyzer(paths['projects_dir'], paths['index_path'], paths['history_path']).update()
+
+
+def totals(analyzer):
+    [row] = analyzer.summary()
+    return row['profile'], row['requests'], row['output_tokens']
+
+
+def test_a_second_run_reads_only_appended_lines(paths):
+    transcript = paths['transcript']
+    transcript.write_text(prompt('2026-10-02T10:00:00Z') + reply('2026-10-02T10:00:02Z', 'msg_1'))
+    assert totals(analyze(paths)) == ('zai', 1, 10)
+    index = json.loads(paths['index_path'].read_text())
+    assert index['files'][str(transcript)]['offset'] == transcript.stat().st_size
+
+    # Nothing new: the totals are kept, not counted again
+    assert totals(analyze(paths)) == ('zai', 1, 10)
+
+    with open(transcript, 'a') as f:
+        f.write(prompt('2026-10-02T11:00:00Z') + reply('2026-10-02T11:00:01Z', 'msg_2', 5))
+    analyzer = analyze(paths)
+    assert totals(analyzer) == ('zai', 2, 15)
+    assert analyzer.summary()[0]['latency_ms_mean'] == 1500
+
+
+def test_a_line_still_being_written_waits_for_the_next_run(paths):
+    transcript = paths['transcript']
+    entry = reply('2026-10-02T10:00:02Z', 'msg_1')
+    transcript.write_text(entry[:20])
+    assert analyze(paths).summary() == []
+    with open(transcript, 'a') as f:
+        f.write(entry[20:])
+    assert totals(analyze(paths)) == ('zai', 1, 10)
+
+
+def test_repeated_content_blocks_count_once(paths):
+    paths['transcript'].write_text(reply('2026-10-02T10:00:02Z', 'msg_1') * 3)
+    assert totals(analyze(paths)) == ('zai', 1, 10)
+
+
+def test_a_rewritten_transcript_is_read_again(paths):
+    transcript = paths['transcript']
+    transcript.write_text(reply('2026-10-02T10:00:02Z', 'msg_1') + reply('2026-10-02T10:00:03Z', 'msg_2'))
+    analyze(paths)
+    transcript.write_text(reply('2026-10-02T12:00:00Z', 'msg_3'))
+    assert totals(analyze(paths)) == ('zai', 3, 30)
@@ -0,0 +1,73 @@
+import pytest
+
+import ezswitch
+
+SETTINGS = {
+    'zai_key': 'sk-zai-0123456789',
+    'claude_key': 'sk-ant-0123456789',
+    'profile_variables': {'zai': {'preset': 'slow-gateway', 'ANTHROPIC_MODEL': 'glm-4.6'}},
+}
+
+
+@pytest.mark.parametrize('name', ['PATH', 'HOME', 'USERPROFILE', 'PATHEXT', 'SYSTEMROOT', 'FOO', 'path'])
+def test_only_claude_code_settings_are_accepted(name):
+    with pytest.raises(ezswitch.ProfileError):
+        ezswitch.coerce_variable(name, '/opt/x')
+
+
+def test_core_variables_cannot_be_set_directly():
+    with pytest.raises(ezswitch.ProfileError):
+        ezswitch.check_variable_name('ANTHROPIC_BASE_URL')
+
+
+def test_values_are_typed():
+    assert ezswitch.coerce_variable('API_TIMEOUT_MS', '3000000') == '3000000'
+    assert ezswitch.coerce_variable('DISABLE_TELEMETRY', True) == '1'
+    assert ezswitch.coerce_variable('DISABLE_TELEMETRY', 'off') is None
+    assert ezswitch.coerce_variable('CLAUDE_CODE_SOMETHING_NEW', 'x') == 'x'
+    with pytest.raises(ezswitch.ProfileError):
+        ezswitch.coerce_variable('API_TIMEOUT_MS', 'soon')
+
+
+def test_managed_list_drops_names_older_versions_accepted():
+    settings = dict(SETTINGS, managed_variables=['PATH', 'API_TIMEOUT_MS', 'MAX_THINKING_TOKENS'])
+    names = ezswitch.managed_variables(settings)
+    assert 'PATH' not in names
+    assert {'API_TIMEOUT_MS', 'MAX_THINKING_TOKENS', 'ANTHROPIC_MODEL'} <= set(names)
+
+
+def test_extras_are_written_with_the_key_in_one_batch():
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    assert backend.broadcasts == 1
+    assert backend.values['API_TIMEOUT_MS'] == '3000000'
+    assert backend.values['ANTHROPIC_MODEL'] == 'glm-4.6'
+    assert backend.values['CLAUDE_CODE_DISABLE_NONESSENTIAL_TRAFFIC'] == '1'
+
+
+def test_switching_away_clears_what_was_written():
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    ezswitch.apply_profile(backend, 'claude-subscription', SETTINGS)
+    assert backend.values == {}
+
+
+def test_values_changed_by_hand_are_kept():
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    backend.values['ANTHROPIC_MODEL'] = 'my-own-model'
+    ezswitch.apply_profile(backend, 'claude-subscription', SETTINGS)
+    assert backend.values == {'ANTHROPIC_MODEL': 'my-own-model'}
+
+
+def test_values_ez_switch_never_wrote_are_kept():
+    backend = ezswitch.MemoryBackend({'API_TIMEOUT_MS': '1234'})
+    ezswitch.apply_profile(backend, 'claude-subscription', SETTINGS)
+    assert backend.values == {'API_TIMEOUT_MS': '1234'}
+
+
+def test_status_shows_the_extras():
+    backend = ezswitch.MemoryBackend()
+    ezswitch.apply_profile(backend, 'zai', SETTINGS)
+    text = ezswitch.describe_status(backend.get(ezswitch.status_variables(SETTINGS)))
+    assert 'API_TIMEOUT_MS=3000000' in text
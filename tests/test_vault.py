@@ -0,0 +1,48 @@
+import base64
+import json
+
+import pytest
+
+import ezswitch
+
+
+@pytest.fixture
+def vault(tmp_path):
+    vault = ezswitch.KeyVault(tmp_path / "vault", prompt=None)
+    vault.create('correct horse')
+    vault.put('zai_key', 'sk-zai-0123456789')
+    vault.lock_now()
+    return vault
+
+
+def test_right_passphrase_unlocks(vault):
+    vault.unlock('correct horse')
+    assert vault.get('zai_key') == 'sk-zai-0123456789'
+
+
+def test_wrong_passphrase_is_refused_and_the_vault_stays_locked(vault):
+    with pytest.raises(ezswitch.VaultError, match="Incorrect vault passphrase"):
+        vault.unlock('battery staple')
+    assert not vault.is_unlocked()
+    with pytest.raises(ezswitch.VaultLockedError):
+        vault.get('zai_key')
+
+
+def test_wrong_passphrase_from_the_prompt_is_refused(vault):
+    answers = ['battery staple', 'correct horse']
+    vault.prompt = lambda: answers.pop(0)
+    with pytest.raises(ezswitch.VaultError, match="Incorrect vault passphrase"):
+        vault.get('zai_key')
+    assert vault.get('zai_key') == 'sk-zai-0123456789'
+
+
+def test_modified_record_is_refused(vault):
+    vault.unlock('correct horse')
+    record = vault.record_file('zai_key')
+    data = json.loads(record.read_text())
+    ciphertext = bytearray(base64.b64decode(data['ciphertext']))
+    ciphertext[0] ^= 1
+    data['ciphertext'] = base64.b64encode(bytes(ciphertext)).decode('ascii')
+    record.write_text(json.dumps(data))
+    with pytest.raises(ezswitch.VaultError, match="modified or is corrupt"):
+        vault.get('zai_key')
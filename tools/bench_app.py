@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""Benchmark the app's startup, status, apply and keystroke-save paths on any OS
+
+Usage:
+    python tools/bench_app.py                       # print results
+    python tools/bench_app.py --save                # write tools/bench_baseline.json
+    python tools/bench_app.py --check               # exit 1 on regression against the baseline
+
+Tk is replaced with a headless stand-in and PowerShell with
+tools/fake-powershell (sleeping --spawn-delay seconds per launch, like a
+cold powershell.exe). Every run uses a temporary HOME, so real settings
+are never touched. Process-spawn counts must match the baseline exactly.
+Latencies may grow by --tolerance times plus --slack-ms before --check
+fails.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import types
+from pathlib import Path
+
+TOOLS = Path(__file__).resolve().parent
+BASELINE = TOOLS / "bench_baseline.json"
+sys.path.insert(0, str(TOOLS.parent))
+
+
+def install_headless_tk():
+    """Register a minimal tkinter stand-in whose after() callbacks are run by pump()"""
+    pending = []
+
+    class Var:
+        def __init__(self, master=None, value=None):
+            self.value = value
+
+        def get(self):
+            return self.value
+
+        def set(self, value):
+            self.value = value
+
+    class Widget:
+        def __init__(self, *args, **options):
+            self.options = options
+            self.text = ''
+
+        def __getattr__(self, name):
+            # pack, grid, bind, start, stop, mainloop, ... are no-ops
+            return lambda *args, **kwargs: None
+
+        def configure(self, *args, **options):
+            self.options.update(options)
+
+        config = configure
+
+        def cget(self, name):
+            return self.options.get(name)
+
+        def get(self):
+            return self.text
+
+        def delete(self, first, last=None):
+            self.text = ''
+
+        def insert(self, index, text):
+            self.text += text
+
+        def after(self, ms, func=None, *args):
+            pending.append((time.monotonic() + ms / 1000, func, args))
+
+        def after_idle(self, func, *args):
+            pending.append((0, func, args))
+
+        def winfo_width(self):
+            return 600
+
+        winfo_height = winfo_screenwidth = winfo_screenheight = winfo_width
+
+    tk = types.ModuleType('tkinter')
+    for name in ('Tk', 'Frame', 'Label', 'Button', 'Entry', 'LabelFrame', 'Checkbutton', 'Toplevel',
+                 'Canvas', 'Scrollbar', 'Listbox', 'Text'):
+        setattr(tk, name, Widget)
+    tk.StringVar = tk.BooleanVar = tk.IntVar = Var
+    for name in ('X', 'Y', 'W', 'E', 'N', 'S', 'LEFT', 'RIGHT', 'TOP', 'BOTTOM', 'BOTH', 'FLAT',
+                 'NORMAL', 'DISABLED', 'END', 'VERTICAL', 'HORIZONTAL', 'WORD'):
+        setattr(tk, name, name.lower())
+    ttk = types.ModuleType('tkinter.ttk')
+    for name in ('Label', 'Radiobutton', 'Progressbar', 'Style', 'Combobox', 'Frame', 'Button',
+                 'Entry', 'Scrollbar', 'Treeview'):
+        setattr(ttk, name, Widget)
+    messagebox = types.ModuleType('tkinter.messagebox')
+    messagebox.log = []
+    for name in ('showinfo', 'showerror', 'showwarning'):
+        setattr(messagebox, name, lambda *args, kind=name: messagebox.log.append((kind,) + args))
+    messagebox.askyesno = lambda *args: False
+    tk.ttk, tk.messagebox = ttk, messagebox
+    sys.modules.update({'tkinter': tk, 'tkinter.ttk': ttk, 'tkinter.messagebox': messagebox})
+
+    def pump(until=lambda: True, timeout=30):
+        """Run after() callbacks as they fall due until ``until()`` is true"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            now = time.monotonic()
+            due = [entry for entry in pending if entry[0] <= now]
+            for entry in due:
+                pending.remove(entry)
+                if entry[1] is not None:
+                    entry[1](*entry[2])
+            if until():
+                return
+            if not due:
+                time.sleep(0.001)
+        raise TimeoutError("condition not reached")
+
+    return tk, pump
+
+
+def spawns(log):
+    try:
+        with open(log) as f:
+            return sum(1 for _ in f)
+    except OSError:
+        return 0
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def run(args):
+    home = tempfile.mkdtemp(prefix='ezswitch-bench-')
+    log = os.path.join(home, 'launches.log')
+    os.environ.update({
+        'HOME': home, 'USERPROFILE': home,
+        'EZSWITCH_BACKEND': 'powershell',
+        'EZSWITCH_POWERSHELL': str(TOOLS / 'fake-powershell' / 'powershell'),
+        'FAKE_POWERSHELL_STORE': os.path.join(home, 'env.json'),
+        'FAKE_POWERSHELL_LAUNCH_LOG': log,
+        'FAKE_POWERSHELL_DELAY': str(args.spawn_delay),
+    })
+    tk, pump = install_headless_tk()
+    import ezswitch
+
+    results = {'spawn_delay_ms': ms(args.spawn_delay)}
+
+    # Startup: construction, then the background status read
+    start = time.perf_counter()
+    app = ezswitch.ClaudeConfigSwitcher(tk.Tk())
+    results['construct_ms'] = ms(time.perf_counter() - start)
+    results['startup_frames_built'] = len(app.group_frames)
+    pump(lambda: 'time-to-verified-status' in app.startup_timer.marks)
+    results['verified_status_ms'] = ms(time.perf_counter() - start)
+    results['startup_spawns'] = spawns(log)
+
+    # Status refresh on a warm backend
+    before = spawns(log)
+    samples = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        app.show_verified_status(app.env_backend.get(ezswitch.ENV_VARS))
+        samples.append(time.perf_counter() - start)
+    results['check_status_ms_p50'] = ms(ezswitch.percentile(samples, 50))
+    results['check_status_spawns'] = spawns(log) - before
+
+    # Apply each profile end to end, then re-apply it (nothing to write)
+    app.set_field('zai_key', 'zk-bench-0123456789abcdef')
+    app.set_field('custom_url', 'http://127.0.0.1:9/bench')
+    app.set_field('custom_key', 'ck-bench-0123456789abcdef')
+    app.set_field('claude_key', 'sk-ant-bench-0123456789')
+    app.set_field('openrouter_key', 'sk-or-bench-0123456789')
+    for profile in ezswitch.PROFILES:
+        app.select_profile(profile)
+        for phase in ('apply', 'reapply'):
+            before = spawns(log)
+            start = time.perf_counter()
+            app.on_applied(app.apply_job(app.collect_settings()))
+            results[f'{phase}_{profile}_ms'] = ms(time.perf_counter() - start)
+            results[f'{phase}_{profile}_spawns'] = spawns(log) - before
+    errors = [entry for entry in tk.messagebox.log if entry[0] == 'showerror']
+    if errors:
+        raise RuntimeError(f"apply failed: {errors}")
+
+    # Keystrokes: the per-event cost on the UI thread, then the single coalesced write
+    writes = []
+    original_write = app.config_store._write
+    app.config_store._write = lambda data: writes.append(1) or original_write(data)
+    app.select_profile('zai')
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        app.entries['zai_key'].insert(0, 'x')
+        app.save_api_keys(defer=True)
+    results['keystroke_save_us_mean'] = round((time.perf_counter() - start) / args.iterations * 1e6, 2)
+    app.config_store.flush()
+    results['keystroke_file_writes'] = len(writes)
+
+    # Project resolution against 500 bindings, from a directory nested inside one of them
+    projects = os.path.join(home, 'projects.json')
+    with open(projects, 'w') as f:
+        json.dump({'project_profiles': {os.path.join(home, 'src', f'repo{i}'): 'zai' for i in range(500)}}, f)
+    resolver = ezswitch.ProjectResolver(projects)
+    cwd = os.path.join(home, 'src', 'repo250', 'pkg', 'module', 'tests')
+    start = time.perf_counter()
+    resolver.resolve(cwd)
+    results['project_resolve_cold_ms'] = ms(time.perf_counter() - start)
+    samples = []
+    for _ in range(args.iterations):
+        start = time.perf_counter()
+        resolver.resolve(cwd)
+        samples.append(time.perf_counter() - start)
+    results['project_resolve_ms_p50'] = ms(ezswitch.percentile(samples, 50))
+
+    # Another tool rewrites the variables: the watcher's poll notices and the UI drains the queue
+    before = spawns(log)
+    app.status_watcher.interval = 0.1
+    app.status_watcher.poke()
+    store = os.environ['FAKE_POWERSHELL_STORE']
+    with open(store) as f:
+        data = json.load(f)
+    data.setdefault('User', {})['ANTHROPIC_BASE_URL'] = 'http://127.0.0.1:9/elsewhere'
+    with open(store, 'w') as f:
+        json.dump(data, f)
+    start = time.perf_counter()
+    pump(lambda: 'elsewhere' in (app.status_label.cget('text') or ''))
+    results['external_change_ms'] = ms(time.perf_counter() - start)
+    results['external_change_spawns'] = spawns(log) - before
+
+    app.close_application()
+    results['total_spawns'] = spawns(log)
+    return results
+
+
+def check(results, baseline, tolerance, slack_ms):
+    """Return regression messages comparing ``results`` to ``baseline``"""
+    failures = []
+    for key, expected in baseline.items():
+        actual = results.get(key)
+        if actual is None or key == 'spawn_delay_ms':
+            continue
+        if key.endswith(('_spawns', '_writes', '_built')):
+            if actual > expected:
+                failures.append(f"{key}: {actual} (baseline {expected})")
+        elif key.endswith('_ms') or '_ms_' in key:
+            if actual > expected * tolerance + slack_ms:
+                failures.append(f"{key}: {actual} ms (baseline {expected} ms)")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--spawn-delay', type=float, default=0.15,
+                        help="simulated powershell.exe cold start in seconds (default: 0.15)")
+    parser.add_argument('--save', action='store_true', help=f"write results to {BASELINE.name}")
+    parser.add_argument('--check', action='store_true', help="compare against the saved baseline")
+    parser.add_argument('--tolerance', type=float, default=1.5)
+    parser.add_argument('--slack-ms', type=float, default=20.0)
+    args = parser.parse_args()
+
+    results = run(args)
+    print(json.dumps(results, indent=2))
+    if args.save:
+        with open(BASELINE, 'w') as f:
+            json.dump(results, f, indent=2)
+            f.write('\n')
+    if args.check:
+        with open(BASELINE) as f:
+            failures = check(results, json.load(f), args.tolerance, args.slack_ms)
+        for failure in failures:
+            print(f"REGRESSION {failure}", file=sys.stderr)
+        return 1 if failures else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
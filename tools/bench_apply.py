@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""Benchmark the multi-target apply pipeline with fake targets that inject delays and failures
+
+Usage: python tools/bench_apply.py [--runs 10] [--json]
+
+Four in-memory targets stand in for the User environment, settings.json, a
+shell profile and a dotenv file. Each sleeps for a set time on every write.
+The pipeline's wall time is compared with the sum of the delays, which is
+what applying one target after another costs. A second scenario makes one
+target fail and another hang past its timeout. Every target must then be
+reported on its own, and the failed target must not be left half-written.
+The real file targets are exercised once at the end.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-apply-bench-')
+
+import ezswitch  # noqa: E402
+
+
+class FakeTarget(ezswitch.MemoryBackend):
+    """An in-memory target that sleeps ``delay`` seconds per write and can fail part-way"""
+
+    def __init__(self, delay=0.0, fail=False):
+        super().__init__()
+        self.delay = delay
+        self.fail = fail
+
+    def set(self, values):
+        time.sleep(self.delay)
+        if self.fail and values:
+            # Write the first variable only, like a batch interrupted half-way
+            name = next(iter(values))
+            super().set({name: values[name]})
+            self.fail = False
+            raise ezswitch.EnvironmentStoreError("injected failure")
+        super().set(values)
+
+
+PROFILE_VALUES = [
+    {'ANTHROPIC_AUTH_TOKEN': 'zk-bench-0123456789abcdef', 'ANTHROPIC_BASE_URL': ezswitch.ZAI_BASE_URL},
+    {'ANTHROPIC_AUTH_TOKEN': 'ck-bench-0123456789abcdef', 'ANTHROPIC_BASE_URL': 'http://127.0.0.1:9/bench'},
+]
+
+DELAYS = {'environment': 0.15, 'settings': 0.03, 'shell': 0.02, 'dotenv': 0.01}
+
+
+def parallel_speedup(runs):
+    targets = [(name, FakeTarget(delay), 5.0) for name, delay in DELAYS.items()]
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        report = ezswitch.apply_to_targets(targets, 'bench', PROFILE_VALUES[i % 2])
+        samples.append(time.perf_counter() - start)
+        if report.failures:
+            raise RuntimeError(report.describe())
+    return {'sequential_ms': round(sum(DELAYS.values()) * 1000, 1),
+            'pipeline_ms_p50': round(ezswitch.percentile(samples, 50) * 1000, 1)}
+
+
+def partial_failure():
+    healthy, failing, hanging = FakeTarget(0.01), FakeTarget(0.01, fail=True), FakeTarget(2.0)
+    targets = [('environment', healthy, 5.0), ('settings', failing, 5.0), ('dotenv', hanging, 0.2)]
+    start = time.perf_counter()
+    report = ezswitch.apply_to_targets(targets, 'bench', PROFILE_VALUES[0])
+    elapsed = time.perf_counter() - start
+    outcome = {result.name: 'ok' if result.error is None else str(result.error) for result in report.results}
+    if outcome['environment'] != 'ok' or 'injected' not in outcome['settings'] or 'timed out' not in outcome['dotenv']:
+        raise RuntimeError(f"unexpected outcome: {outcome}")
+    if failing.values:
+        raise RuntimeError(f"failed target left half-written: {failing.values}")
+    return {'wall_ms': round(elapsed * 1000, 1), 'targets': outcome}
+
+
+def file_targets():
+    directory = Path(tempfile.mkdtemp(prefix='targets-'))
+    (directory / "bashrc").write_text("alias ll='ls -l'\n")
+    (directory / ".env").write_text("OTHER=1\nANTHROPIC_BASE_URL=old\n")
+    settings = {'apply_targets': [{'target': 'shell', 'path': str(directory / "bashrc")},
+                                  {'target': 'dotenv', 'path': str(directory / ".env")},
+                                  {'target': 'settings', 'path': str(directory / "settings.json")}]}
+    targets = ezswitch.apply_targets(ezswitch.MemoryBackend(), settings)
+    start = time.perf_counter()
+    report = ezswitch.apply_to_targets(targets, 'bench', PROFILE_VALUES[1])
+    elapsed = time.perf_counter() - start
+    if report.failures:
+        raise RuntimeError(report.describe())
+    for _, target, _ in targets:
+        if target.get() != PROFILE_VALUES[1]:
+            raise RuntimeError(f"{target.name} reads back {target.get()}")
+    return {'wall_ms': round(elapsed * 1000, 2), 'targets': len(targets)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    results = {'parallel': parallel_speedup(args.runs), 'partial_failure': partial_failure(),
+               'file_targets': file_targets()}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        parallel = results['parallel']
+        print(f"4 targets: {parallel['pipeline_ms_p50']} ms p50 concurrently, "
+              f"{parallel['sequential_ms']} ms one after another")
+        failure = results['partial_failure']
+        print(f"partial failure reported in {failure['wall_ms']} ms:")
+        for name, outcome in failure['targets'].items():
+            print(f"  {name}: {outcome}")
+        print(f"real file targets ({results['file_targets']['targets']}): {results['file_targets']['wall_ms']} ms")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Benchmark command forwarding to a resident instance over its Unix socket
+
+Usage: python tools/bench_instance.py [--runs 10] [--spawn-delay 0.15] [--json]
+
+Starts `ezswitch.py serve` with the fake PowerShell backend in a temporary
+HOME. It then times `apply` and `status` as separate processes in three
+ways: standalone with --no-instance, forwarded by ezswitch.py, and forwarded
+by the ezswitch_client.py launcher. The fake PowerShell sleeps --spawn-delay
+seconds per launch, like a cold powershell.exe. Applies alternate between
+two profiles so every one writes. The interpreter's own start-up time is
+reported for reference.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLS = Path(__file__).resolve().parent
+EZSWITCH = str(TOOLS.parent / "ezswitch.py")
+CLIENT = str(TOOLS.parent / "ezswitch_client.py")
+sys.path.insert(0, str(TOOLS.parent))
+
+from ezswitch import percentile  # noqa: E402
+
+
+def run_command(env, script, *argv):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, script, *argv], env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"{' '.join(argv)} failed: {result.stderr.strip()}")
+    return elapsed
+
+
+def measure(env, runs, script=EZSWITCH, extra=()):
+    timings = {'apply': [], 'status': []}
+    for i in range(runs):
+        timings['apply'].append(run_command(env, script, *extra, 'apply', ('zai', 'custom')[i % 2]))
+        timings['status'].append(run_command(env, script, *extra, 'status'))
+    return {name: round(percentile(samples, 50) * 1000, 1) for name, samples in timings.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--spawn-delay', type=float, default=0.15)
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    home = tempfile.mkdtemp(prefix='ezswitch-instance-bench-')
+    env = dict(os.environ, HOME=home, USERPROFILE=home,
+               EZSWITCH_BACKEND='powershell',
+               EZSWITCH_POWERSHELL=str(TOOLS / 'fake-powershell' / 'powershell'),
+               FAKE_POWERSHELL_STORE=os.path.join(home, 'env.json'),
+               FAKE_POWERSHELL_DELAY=str(args.spawn_delay))
+    config_dir = Path(home) / ".claude_ez_switch"
+    config_dir.mkdir()
+    with open(config_dir / "config.json", 'w') as f:
+        json.dump({'zai_key': 'zk-bench-0123456789abcdef', 'custom_url': 'http://127.0.0.1:9/bench',
+                   'custom_key': 'ck-bench-0123456789abcdef', 'selected_config': 'zai'}, f)
+
+    interpreter = percentile([run_command(env, '-c', 'pass') for _ in range(args.runs)], 50)
+    standalone = measure(env, args.runs, extra=('--no-instance',))
+    server = subprocess.Popen([sys.executable, EZSWITCH, 'serve'], env=env,
+                              stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        line = server.stdout.readline()
+        if 'listening' not in line:
+            raise RuntimeError(f"instance did not start: {line}{server.stderr.read()}")
+        forwarded = measure(env, args.runs)
+        client = measure(env, args.runs, CLIENT)
+    finally:
+        server.terminate()
+        server.wait(5)
+
+    results = {'spawn_delay_ms': args.spawn_delay * 1000, 'interpreter_ms_p50': round(interpreter * 1000, 1),
+               'standalone_ms_p50': standalone, 'forwarded_ms_p50': forwarded, 'client_ms_p50': client}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        print(f"{'command':<10} {'standalone ms':>14} {'ezswitch.py ms':>15} {'client ms':>10}")
+        for name in ('apply', 'status'):
+            print(f"{name:<10} {standalone[name]:>14.1f} {forwarded[name]:>15.1f} {client[name]:>10.1f}")
+        print(f"(python -c pass: {results['interpreter_ms_p50']} ms)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
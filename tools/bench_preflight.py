@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""Benchmark pre-flight key validation against local stub servers
+
+Usage: python tools/bench_preflight.py [--endpoints 6] [--delay 0.2] [--json]
+
+Starts stub servers that accept one key. It checks an accepted key, a
+rejected key (401) and an endpoint that answers after the timeout; each must
+get the right verdict. It then validates --endpoints slow endpoints at once
+and compares the wall time with the sum of their delays. Finally it checks
+two saved profiles twice through the result cache: the second pass must not
+send any request.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+TOOLS = Path(__file__).resolve().parent
+sys.path.insert(0, str(TOOLS))
+sys.path.insert(0, str(TOOLS.parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-preflight-bench-')
+
+import ezswitch  # noqa: E402
+from stub_anthropic_server import start_stub_server  # noqa: E402
+
+KEY = 'sk-bench-0123456789abcdef'
+
+
+def requests_served(*servers):
+    return sum(server.state.requests for server in servers)
+
+
+def verdicts(timeout):
+    good = start_stub_server(api_key=KEY)
+    slow = start_stub_server(api_key=KEY, delay=timeout * 3)
+    endpoints = {'accepted': (good.url, KEY), 'rejected': (good.url, 'sk-wrong'), 'slow': (slow.url, KEY)}
+    start = time.perf_counter()
+    outcomes = asyncio.run(ezswitch.validate_endpoints(endpoints, timeout))
+    elapsed = time.perf_counter() - start
+    statuses = {name: outcome[0] for name, outcome in outcomes.items()}
+    if statuses != {'accepted': 'valid', 'rejected': 'rejected', 'slow': 'unreachable'}:
+        raise RuntimeError(f"unexpected verdicts: {outcomes}")
+    return {'wall_ms': round(elapsed * 1000, 1), 'statuses': statuses}
+
+
+def concurrency(count, delay):
+    servers = [start_stub_server(api_key=KEY, delay=delay) for _ in range(count)]
+    endpoints = {f"endpoint{i}": (server.url, KEY) for i, server in enumerate(servers)}
+    start = time.perf_counter()
+    outcomes = asyncio.run(ezswitch.validate_endpoints(endpoints, timeout=delay * 10))
+    elapsed = time.perf_counter() - start
+    if any(status != 'valid' for status, _, _ in outcomes.values()):
+        raise RuntimeError(f"unexpected verdicts: {outcomes}")
+    return {'endpoints': count, 'sequential_ms': round(count * delay * 1000, 1), 'wall_ms': round(elapsed * 1000, 1)}
+
+
+def cached(timeout):
+    good = start_stub_server(api_key=KEY)
+    bad = start_stub_server(api_key='sk-other')
+    settings = {'custom_url': good.url, 'custom_key': KEY, 'local_url': bad.url, 'local_key': KEY}
+    cache = ezswitch.ValidationCache(ttl=60)
+    timings = []
+    for _ in range(2):
+        before = requests_served(good, bad)
+        start = time.perf_counter()
+        validations = ezswitch.validate_profiles(['custom', 'local'], settings, cache, timeout)
+        timings.append((time.perf_counter() - start, requests_served(good, bad) - before))
+    if [v.status for v in validations] != ['valid', 'rejected'] or not all(v.cached for v in validations):
+        raise RuntimeError(f"unexpected cached results: {[v.describe() for v in validations]}")
+    try:
+        ezswitch.preflight_check('local', settings, enabled=True)
+    except ezswitch.ProfileError:
+        pass
+    else:
+        raise RuntimeError("pre-flight let a rejected key through")
+    (cold, cold_requests), (warm, warm_requests) = timings
+    return {'cold_ms': round(cold * 1000, 2), 'cold_requests': cold_requests,
+            'cached_ms': round(warm * 1000, 3), 'cached_requests': warm_requests}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--endpoints', type=int, default=6)
+    parser.add_argument('--delay', type=float, default=0.2, help="seconds each slow endpoint takes to answer")
+    parser.add_argument('--timeout', type=float, default=0.5)
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    results = {'verdicts': verdicts(args.timeout), 'concurrency': concurrency(args.endpoints, args.delay),
+               'cache': cached(args.timeout)}
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        verdict = results['verdicts']
+        print(f"verdicts in {verdict['wall_ms']} ms: "
+              + ", ".join(f"{name} -> {status}" for name, status in verdict['statuses'].items()))
+        together = results['concurrency']
+        print(f"{together['endpoints']} slow endpoints: {together['wall_ms']} ms concurrently, "
+              f"{together['sequential_ms']} ms one after another")
+        cache = results['cache']
+        print(f"2 profiles: {cache['cold_ms']} ms and {cache['cold_requests']} requests cold, "
+              f"{cache['cached_ms']} ms and {cache['cached_requests']} requests cached")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""Benchmark bulk import and export of named team profiles
+
+Usage: python tools/bench_profiles.py [--profiles 10000] [--json]
+
+Writes --profiles rows as JSON Lines and times the first import into an
+empty store. Peak Python memory is measured with tracemalloc and compared
+with the file size. It then re-imports the same file, where every row is a
+duplicate, and imports a CSV export of the store with a few changed keys,
+which must update those profiles in place. Finally it times one filter pass
+of the kind the GUI picker runs on each pause in typing.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-profiles-bench-')
+
+import ezswitch  # noqa: E402
+
+
+def write_rows(path, count):
+    with open(path, 'w') as f:
+        for i in range(count):
+            f.write(json.dumps({'name': f"team-gw-{i:05d}", 'url': f"https://gw{i % 500}.example.com/anthropic",
+                                'key': f"sk-team-{i:08d}-0123456789abcdef"}) + "\n")
+
+
+def timed_import(path, store):
+    start = time.perf_counter()
+    report = ezswitch.import_profiles(path, store=store)
+    return report, time.perf_counter() - start
+
+
+def import_peak(path, directory):
+    """Peak traced memory of an import into an empty store (timed separately; tracing is slow)"""
+    tracemalloc.start()
+    ezswitch.import_profiles(path, store=ezswitch.ProfileStore(directory / "peak.jsonl"))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--profiles', type=int, default=10000)
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    directory = Path(tempfile.mkdtemp(prefix='profiles-'))
+    source = directory / "team.jsonl"
+    write_rows(source, args.profiles)
+    store = ezswitch.ProfileStore(directory / "profiles.jsonl")
+
+    report, cold = timed_import(source, store)
+    if report.added != args.profiles:
+        raise RuntimeError(report.describe())
+    again, repeat = timed_import(source, store)
+    if again.duplicates != args.profiles or again.added or again.updated:
+        raise RuntimeError(again.describe())
+
+    exported = directory / "team.csv"
+    ezswitch.export_profiles(exported, store=store)
+    text = exported.read_text()
+    for i in range(10):
+        text = text.replace(f"sk-team-{i:08d}-", f"sk-rotated-{i:08d}-")
+    exported.write_text(text)
+    rotated, csv_time = timed_import(exported, store)
+    if rotated.updated != 10 or rotated.added:
+        raise RuntimeError(rotated.describe())
+
+    profiles = [(p['name'], p['url']) for p in store]
+    haystacks = [f"{name}\n{url}".lower() for name, url in profiles]
+    start = time.perf_counter()
+    matches = [profile for profile, haystack in zip(profiles, haystacks) if "gw499" in haystack]
+    filter_time = time.perf_counter() - start
+
+    results = {
+        'profiles': args.profiles,
+        'file_kb': round(source.stat().st_size / 1024, 1),
+        'import_ms': round(cold * 1000, 1),
+        'import_peak_kb': round(import_peak(source, directory) / 1024, 1),
+        'reimport_duplicates_ms': round(repeat * 1000, 1),
+        'csv_rotate_keys_ms': round(csv_time * 1000, 1),
+        'picker_filter_ms': round(filter_time * 1000, 2),
+        'picker_matches': len(matches),
+    }
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:<24} {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
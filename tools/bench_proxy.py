@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""Measure the overhead and throughput of the EZ Switch proxy against a local stub upstream
+
+Usage: python tools/bench_proxy.py [--requests 200] [--concurrency 8] [--tokens 50]
+
+Streams the same Messages requests directly to the stub and through the
+proxy, then prints time-to-first-byte, full-response latency and request
+throughput for both, plus the time to switch upstreams live.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-proxy-bench-')
+
+import ezswitch  # noqa: E402
+from stub_anthropic_server import start_stub_server  # noqa: E402
+
+
+async def drive(base_url, requests, concurrency, tokens, key='stub-key'):
+    """Send ``requests`` streaming calls with ``concurrency`` keep-alive workers"""
+    client = ezswitch.AsyncHTTPClient()
+    url, headers, body = ezswitch.messages_request(base_url, key, 'stub-model', tokens)
+    ttfb, total = [], []
+    queue = list(range(requests))
+
+    async def worker():
+        while queue:
+            queue.pop()
+            start = time.perf_counter()
+            response, _, _ = await ezswitch.stream_message(client, url, headers, body)
+            ttfb.append(response.ttfb)
+            total.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+    elapsed = time.perf_counter() - start
+    client.close()
+
+    def ms(value):
+        return round(value * 1000, 3)
+    return {
+        'ttfb_ms_p50': ms(ezswitch.percentile(ttfb, 50)),
+        'ttfb_ms_p95': ms(ezswitch.percentile(ttfb, 95)),
+        'latency_ms_p50': ms(ezswitch.percentile(total, 50)),
+        'latency_ms_p95': ms(ezswitch.percentile(total, 95)),
+        'requests_per_second': round(requests / elapsed, 1),
+    }
+
+
+async def main(args):
+    upstream = start_stub_server(tokens=args.tokens)
+    other = start_stub_server(tokens=args.tokens)
+    settings = {'custom_url': upstream.url, 'custom_key': 'stub-key',
+                'claude_key': 'stub-key-2'}
+    proxy = ezswitch.SwitchingProxy(lambda: settings, port=0)
+    proxy.set_upstream('custom')
+    await proxy.start()
+
+    direct = await drive(upstream.url, args.requests, args.concurrency, args.tokens)
+    proxied = await drive(ezswitch.proxy_url(proxy.port), args.requests, args.concurrency, args.tokens,
+                          proxy.token)
+
+    # Live switch cost: from the control call to the first request served by the new upstream
+    loop = asyncio.get_running_loop()
+    settings['custom_url'] = other.url
+    start = time.perf_counter()
+    await loop.run_in_executor(None, ezswitch.proxy_request, proxy.port, 'POST',
+                               '/_ezswitch/upstream', {'profile': 'custom'})
+    switch_ms = (time.perf_counter() - start) * 1000
+    await proxy.close()
+
+    print(json.dumps({
+        'requests': args.requests,
+        'concurrency': args.concurrency,
+        'tokens_per_response': args.tokens,
+        'direct': direct,
+        'proxy': proxied,
+        'overhead_ms_p50': round(proxied['latency_ms_p50'] - direct['latency_ms_p50'], 3),
+        'live_switch_ms': round(switch_ms, 3),
+        'upstream_connections_opened': upstream.state.connections,
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--tokens', type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Benchmark usage analytics on a synthetic Claude Code transcript corpus
+
+Usage:
+    python tools/bench_usage.py                     # 256 MB corpus
+    python tools/bench_usage.py --size-mb 4096      # multi-GB corpus
+    python tools/bench_usage.py --json
+
+Writes sessions shaped like ~/.claude/projects transcripts into a temporary
+directory. Each session has prompts, streamed assistant replies with usage
+blocks and large tool results. It then times the cold scan that builds the
+index, a rescan with nothing new, and an incremental scan after lines are
+appended to a few sessions. Request totals are checked against what was
+written, so a fast but wrong parser fails.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-usage-bench-')
+
+import ezswitch  # noqa: E402
+
+# Roughly the mix of a real coding session: most bytes are tool output
+TOOL_OUTPUT = "x" * 12000
+
+
+def turn(session, n, base):
+    """Return the transcript lines of one prompt, its tool call and the streamed reply"""
+    def stamp(offset):
+        return ezswitch.utc_timestamp(base + n * 60 + offset)
+    cwd = f"/home/bench/repo{session % 7}"
+    usage = {'input_tokens': 10, 'output_tokens': 200, 'cache_creation_input_tokens': 1000,
+             'cache_read_input_tokens': 30000}
+    lines = [
+        {'type': 'user', 'cwd': cwd, 'sessionId': f"s{session}", 'timestamp': stamp(0),
+         'message': {'role': 'user', 'content': f"Prompt {n}: please refactor the parser"}},
+        {'type': 'user', 'cwd': cwd, 'sessionId': f"s{session}", 'timestamp': stamp(1),
+         'message': {'role': 'user', 'content': [{'type': 'tool_result', 'content': TOOL_OUTPUT}]}},
+    ]
+    for block in range(2):
+        lines.append({'type': 'assistant', 'cwd': cwd, 'sessionId': f"s{session}", 'timestamp': stamp(3),
+                      'requestId': f"req_{session}_{n}",
+                      'message': {'id': f"msg_{session}_{n}", 'model': 'claude-sonnet-4', 'role': 'assistant',
+                                  'content': [{'type': 'text', 'text': "Done. " * 40}], 'usage': usage}})
+    return "".join(json.dumps(line, separators=(',', ':')) + "\n" for line in lines)
+
+
+def write_corpus(root, size_mb, sessions=200):
+    """Write about ``size_mb`` of transcripts; returns the number of replies written"""
+    base = time.time() - 30 * 86400
+    sample = len(turn(0, 0, base))
+    turns = max(1, size_mb * 1024 * 1024 // sample // sessions)
+    for session in range(sessions):
+        directory = root / f"-home-bench-repo{session % 7}"
+        directory.mkdir(parents=True, exist_ok=True)
+        with open(directory / f"session-{session}.jsonl", 'w') as f:
+            for n in range(turns):
+                f.write(turn(session, n, base))
+    return sessions * turns
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--size-mb', type=int, default=256)
+    parser.add_argument('--append-turns', type=int, default=100,
+                        help="turns appended to each of 10 sessions before the incremental scan")
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    root = Path(tempfile.mkdtemp(prefix='ezswitch-corpus-'))
+    try:
+        projects = root / "projects"
+        written = write_corpus(projects, args.size_mb)
+        size = sum(f.stat().st_size for f in projects.rglob('*.jsonl'))
+        history = root / "switch_history.jsonl"
+        history.write_text(json.dumps({'ts': ezswitch.utc_timestamp(0), 'profile': 'zai'}) + "\n")
+
+        def analyzer():
+            return ezswitch.UsageAnalyzer(projects, root / "usage_index.json", history)
+
+        def timed(func):
+            start = time.perf_counter()
+            result = func()
+            return result, time.perf_counter() - start
+
+        rows, cold = timed(lambda: analyzer().update().summary())
+        _, unchanged = timed(lambda: analyzer().update().summary())
+        base = time.time()
+        for session in range(10):
+            path = projects / f"-home-bench-repo{session % 7}" / f"session-{session}.jsonl"
+            with open(path, 'a') as f:
+                for n in range(args.append_turns):
+                    f.write(turn(session, 100000 + n, base))
+        rows, incremental = timed(lambda: analyzer().update().summary())
+
+        expected = written + 10 * args.append_turns
+        if sum(row['requests'] for row in rows) != expected:
+            raise RuntimeError(f"counted {sum(row['requests'] for row in rows)} replies, wrote {expected}")
+        results = {
+            'corpus_mb': round(size / 1024 / 1024, 1),
+            'replies': expected,
+            'cold_scan_s': round(cold, 3),
+            'cold_scan_mb_per_s': round(size / 1024 / 1024 / cold, 1),
+            'unchanged_scan_ms': round(unchanged * 1000, 2),
+            'incremental_scan_ms': round(incremental * 1000, 2),
+            'index_kb': round((root / "usage_index.json").stat().st_size / 1024, 1),
+        }
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for key, value in results.items():
+            print(f"{key:<22} {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Benchmark the key vault: open, unlock and per-record decrypt latency as the key count grows
+
+Usage:
+    python tools/bench_vault.py                    # 3, 30, 300 and 3000 stored keys
+    python tools/bench_vault.py --keys 10 1000 --json
+
+"open" is what startup pays before any key is shown (locating the selected
+record). "unlock" is the once-per-session key derivation. "decrypt" and
+"encrypt" are per-record costs on an unlocked vault. Only unlock should be
+expensive, and nothing but the record count should grow with it.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+os.environ['HOME'] = os.environ['USERPROFILE'] = tempfile.mkdtemp(prefix='ezswitch-vault-bench-')
+
+import ezswitch  # noqa: E402
+
+
+def timed(func, repeat):
+    """Return the median wall time of ``func`` in milliseconds"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return round(ezswitch.percentile(samples, 50) * 1000, 4)
+
+
+def run(count, repeat):
+    directory = Path(tempfile.mkdtemp(prefix='vault-')) / "vault"
+    vault = ezswitch.KeyVault(directory, prompt=None)
+    vault.create('benchmark passphrase')
+    for i in range(count):
+        vault.put(f"key_{i}", f"sk-bench-{i:08d}-0123456789abcdef")
+    selected = f"key_{count // 2}"
+
+    def open_vault():
+        fresh = ezswitch.KeyVault(directory, prompt=None)
+        return fresh.exists() and fresh.has(selected)
+
+    fresh = ezswitch.KeyVault(directory, prompt=None)
+    return {
+        'keys': count,
+        'open_ms': timed(open_vault, repeat),
+        'unlock_ms': timed(lambda: fresh.unlock('benchmark passphrase'), 3),
+        'decrypt_ms': timed(lambda: fresh.get(selected), repeat),
+        'encrypt_ms': timed(lambda: fresh.put(selected, 'sk-bench-updated-0123456789abcdef'), repeat),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--keys', type=int, nargs='+', default=[3, 30, 300, 3000])
+    parser.add_argument('--repeat', type=int, default=50)
+    parser.add_argument('--json', action='store_true', help="print machine-readable output")
+    args = parser.parse_args()
+
+    results = [run(count, args.repeat) for count in args.keys]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    print(f"{'keys':>6} {'open ms':>9} {'unlock ms':>10} {'decrypt ms':>11} {'encrypt ms':>11}")
+    for row in results:
+        print(f"{row['keys']:>6} {row['open_ms']:>9.3f} {row['unlock_ms']:>10.1f} "
+              f"{row['decrypt_ms']:>11.3f} {row['encrypt_ms']:>11.3f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
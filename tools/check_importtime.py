@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Fail if the headless CLI start path imports tkinter or exceeds its import budget
+
+Usage: python tools/check_importtime.py [budget_ms] [runs]
+
+Runs ``python -X importtime ezswitch.py --help`` several times and sums the
+cumulative import time of top-level modules reported on stderr. Importing
+tkinter on any run is a hard failure; the budget is checked against the
+median, and leaves headroom so one slow run on a busy machine does not
+fail it.
+"""
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+SCRIPT = Path(__file__).resolve().parent.parent / "ezswitch.py"
+DEFAULT_BUDGET_MS = 100.0
+DEFAULT_RUNS = 7
+
+
+def measure():
+    """Return (total_ms, modules) for one run, or None if the command failed"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', str(SCRIPT), '--help'],
+                            capture_output=True, text=True)
+    if result.returncode != 0:
+        print(result.stderr)
+        return None
+
+    total_us = 0
+    modules = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        # One space separates the column; anything beyond that is nesting
+        name = name[1:]
+        modules.append(name.strip())
+        if not name.startswith(' '):
+            total_us += int(cumulative_us)
+    return total_us / 1000, modules
+
+
+def main(argv):
+    budget_ms = float(argv[0]) if argv else DEFAULT_BUDGET_MS
+    runs = int(argv[1]) if len(argv) > 1 else DEFAULT_RUNS
+
+    times = []
+    heavy = set()
+    for _ in range(runs):
+        measured = measure()
+        if measured is None:
+            return 1
+        total_ms, modules = measured
+        times.append(total_ms)
+        heavy.update(m for m in modules if m.split('.')[0] in ('tkinter', '_tkinter', 'webbrowser'))
+
+    failures = []
+    if heavy:
+        failures.append(f"GUI modules imported on the CLI path: {', '.join(sorted(heavy))}")
+    median_ms = statistics.median(times)
+    if median_ms > budget_ms:
+        failures.append(f"median import time {median_ms:.1f} ms exceeds budget {budget_ms:.1f} ms")
+
+    print(f"CLI import time: median {median_ms:.1f} ms over {runs} runs "
+          f"(min {min(times):.1f}, max {max(times):.1f}; budget {budget_ms:.1f} ms)")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
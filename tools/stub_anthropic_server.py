@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""Local Anthropic-compatible stub server for exercising ezswitch's network features
+
+Serves POST /v1/messages (streaming SSE or JSON) and GET /v1/models over
+keep-alive HTTP/1.1. With --api-key, both answer 401 to any other key.
+Behaviour can be changed while it runs:
+
+    POST /_control  {"status": 503, "delay": 2.0}   fail or slow down every request
+    POST /_control  {"status": 200, "delay": 0}     back to normal
+    GET  /_stats                                    request and connection counters
+
+Usage: python tools/stub_anthropic_server.py [--port 8765] [--api-key KEY] ...
+Or import start_stub_server() to run it on a background thread.
+"""
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+    def __init__(self, status=200, delay=0.0, tokens=20, token_delay=0.0, api_key=None):
+        self.status = status
+        self.delay = delay
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.api_key = api_key
+        self.requests = 0
+        self.connections = 0
+        self.lock = threading.Lock()
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server_version = 'StubAnthropic/1.0'
+
+    def setup(self):
+        super().setup()
+        with self.server.state.lock:
+            self.server.state.connections += 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status, payload):
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+
+    def authorized(self):
+        api_key = self.server.state.api_key
+        token = self.headers.get('x-api-key') or (self.headers.get('Authorization') or '').replace('Bearer ', '', 1)
+        return not api_key or token == api_key
+
+    def do_GET(self):
+        state = self.server.state
+        if self.path == '/_stats':
+            self.send_json(200, {'requests': state.requests, 'connections': state.connections})
+            return
+        with state.lock:
+            state.requests += 1
+        if state.delay:
+            time.sleep(state.delay)
+        if not self.authorized():
+            self.send_json(401, {'type': 'error', 'error': {'type': 'authentication_error', 'message': 'invalid x-api-key'}})
+        elif state.status != 200:
+            self.send_json(state.status, {'type': 'error', 'error': {'type': 'api_error', 'message': 'stub failure'}})
+        else:
+            self.send_json(200, {'data': [], 'has_more': False})
+
+    def do_POST(self):
+        state = self.server.state
+        body = self.read_body()
+        if self.path == '/_control':
+            for name in ('status', 'delay', 'tokens', 'token_delay', 'api_key'):
+                if name in body:
+                    setattr(state, name, body[name])
+            self.send_json(200, {'ok': True})
+            return
+        if not self.path.rstrip('/').endswith('/v1/messages'):
+            self.send_json(404, {'type': 'error', 'error': {'type': 'not_found_error', 'message': self.path}})
+            return
+
+        with state.lock:
+            state.requests += 1
+        if state.delay:
+            time.sleep(state.delay)
+
+        if not self.authorized():
+            self.send_json(401, {'type': 'error', 'error': {'type': 'authentication_error', 'message': 'invalid x-api-key'}})
+            return
+        if state.status != 200:
+            self.send_json(state.status, {'type': 'error', 'error': {'type': 'api_error', 'message': 'stub failure'}})
+            return
+
+        tokens = min(int(body.get('max_tokens') or state.tokens), state.tokens)
+        if not body.get('stream'):
+            self.send_json(200, {
+                'id': 'msg_stub', 'type': 'message', 'role': 'assistant', 'model': body.get('model'),
+                'content': [{'type': 'text', 'text': ' '.join(str(i) for i in range(1, tokens + 1))}],
+                'stop_reason': 'end_turn', 'usage': {'input_tokens': 10, 'output_tokens': tokens},
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def event(name, payload):
+            data = f"event: {name}\ndata: {json.dumps(payload)}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):x}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        event('message_start', {'type': 'message_start', 'message': {
+            'id': 'msg_stub', 'type': 'message', 'role': 'assistant', 'model': body.get('model'),
+            'content': [], 'usage': {'input_tokens': 10, 'output_tokens': 0}}})
+        event('content_block_start', {'type': 'content_block_start', 'index': 0,
+                                      'content_block': {'type': 'text', 'text': ''}})
+        for i in range(1, tokens + 1):
+            if state.token_delay:
+                time.sleep(state.token_delay)
+            event('content_block_delta', {'type': 'content_block_delta', 'index': 0,
+                                          'delta': {'type': 'text_delta', 'text': f"{i} "}})
+        event('content_block_stop', {'type': 'content_block_stop', 'index': 0})
+        event('message_delta', {'type': 'message_delta', 'delta': {'stop_reason': 'end_turn'},
+                                'usage': {'output_tokens': tokens}})
+        event('message_stop', {'type': 'message_stop'})
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+
+def start_stub_server(port=0, **options):
+    """Start the stub on a daemon thread and return the server (its URL is server.url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    server.url = f"http://127.0.0.1:{server.server_address[1]}"
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--status', type=int, default=200, help="status code to return")
+    parser.add_argument('--delay', type=float, default=0.0, help="seconds before responding")
+    parser.add_argument('--tokens', type=int, default=20, help="tokens to stream per response")
+    parser.add_argument('--token-delay', type=float, default=0.0, help="seconds between streamed tokens")
+    parser.add_argument('--api-key', help="reject requests that do not use this key with 401")
+    args = parser.parse_args()
+    server = start_stub_server(args.port, status=args.status, delay=args.delay, tokens=args.tokens,
+                               token_delay=args.token_delay, api_key=args.api_key)
+    print(f"Stub Anthropic API listening on {server.url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()